@@ -0,0 +1,229 @@
+"""Time and memory-profile the conversion of a synthetic workflowresult.
+
+Usage:
+    python benchmarks/run_benchmarks.py --output results.json
+    python benchmarks/run_benchmarks.py --output new.json --compare results.json
+
+The results are written as JSON so that runs on different commits can be
+compared with `--compare`.
+"""
+
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from pyqe import (
+    create_sql_engine,
+    export_dataframes_to_csv,
+    export_dataframes_to_parquet,
+    export_dataframes_to_xlsx,
+    extract_dataframes,
+    extract_lists,
+    generate_workflowresult,
+    get_super_dict,
+    send_dataframes_to_sql,
+)
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Benchmark pyqe on a synthetic workflow result.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument("--steps", type=int, default=50, help="Number of steps.")
+    parser.add_argument("--classes", type=int, default=4, help="Number of task classes.")
+    parser.add_argument("--depth", type=int, default=3, help="Depth of nested dicts.")
+    parser.add_argument(
+        "--array-shape",
+        type=str,
+        default="20,10",
+        help="Comma-separated shape of the numeric arrays.",
+    )
+    parser.add_argument(
+        "--records", type=int, default=100, help="Number of dicts in each list of dicts."
+    )
+    parser.add_argument(
+        "--artifacts", type=int, default=2, help="Number of output artifacts per step."
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="Number of timed runs of each benchmark."
+    )
+    parser.add_argument(
+        "--only",
+        type=str,
+        default=None,
+        help="Comma-separated names of the benchmarks to run. Defaults to all.",
+    )
+    parser.add_argument(
+        "--output",
+        type=str,
+        default="benchmark_results.json",
+        help="JSON file to write the results to.",
+    )
+    parser.add_argument(
+        "--compare",
+        type=str,
+        default=None,
+        help="JSON file of an earlier run to compare the results with.",
+    )
+    return parser.parse_args()
+
+
+def _extract_lists(workflowresult):
+    dataset = {}
+    for step in workflowresult.values():
+        extract_lists(step, dataset)
+
+
+def _has_pyarrow():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def get_benchmarks(workflowresult, directory):
+    """Get the benchmarks to run, as (name, setup, function) tuples. `setup` is
+    called before each run, outside of the measurements, and returns the
+    arguments of `function`. Sinks write to fresh subdirectories of
+    `directory`."""
+
+    dfs = extract_dataframes(workflowresult)
+
+    def in_directory(name):
+        return lambda: (dfs, os.path.join(tempfile.mkdtemp(dir=directory), name))
+
+    def sqlite_engine():
+        path = os.path.join(tempfile.mkdtemp(dir=directory), "pyqe.db")
+        return dfs, "insert", create_sql_engine(f"sqlite:///{path}")
+
+    benchmarks = [
+        ("extract_lists", lambda: (workflowresult,), _extract_lists),
+        ("get_super_dict", lambda: (workflowresult,), get_super_dict),
+        ("extract_dataframes", lambda: (workflowresult,), extract_dataframes),
+        (
+            "extract_dataframes_optimized",
+            lambda: (workflowresult, False, True),
+            extract_dataframes,
+        ),
+        ("export_to_csv", in_directory("csv_data"), export_dataframes_to_csv),
+        ("export_to_xlsx", in_directory("excel_data.xlsx"), export_dataframes_to_xlsx),
+        ("send_to_sqlite", sqlite_engine, send_dataframes_to_sql),
+    ]
+    if _has_pyarrow():
+        benchmarks.append(
+            ("export_to_parquet", in_directory("parquet_data"), export_dataframes_to_parquet)
+        )
+    return benchmarks
+
+
+def run_benchmark(setup, function, repeat):
+    """Run a benchmark `repeat` times and then once more under tracemalloc.
+
+    Returns:
+        dict: The fastest and median run times in seconds and the peak memory
+            allocated by the function in MiB.
+    """
+
+    times = []
+    for _ in range(repeat):
+        args = setup()
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            function(*args)
+            times.append(time.perf_counter() - start)
+    times.sort()
+
+    args = setup()
+    tracemalloc.start()
+    with contextlib.redirect_stdout(io.StringIO()):
+        function(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "min_seconds": times[0],
+        "median_seconds": times[len(times) // 2],
+        "peak_mib": peak / 2 ** 20,
+    }
+
+
+def _get_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline):
+    print(f"\nCompared with {baseline.get('commit')}:")
+    for name, result in results["results"].items():
+        old = baseline["results"].get(name)
+        if old is None:
+            continue
+        time_ratio = result["min_seconds"] / old["min_seconds"]
+        memory_ratio = result["peak_mib"] / old["peak_mib"] if old["peak_mib"] else 1
+        print(f"  {name:<28} time x{time_ratio:.2f}  memory x{memory_ratio:.2f}")
+
+
+def main():
+    args = parse_arguments()
+    parameters = {
+        "n_steps": args.steps,
+        "n_classes": args.classes,
+        "depth": args.depth,
+        "array_shape": [int(n) for n in args.array_shape.split(",")],
+        "n_records": args.records,
+        "n_artifacts": args.artifacts,
+    }
+    workflowresult = generate_workflowresult(
+        **dict(parameters, array_shape=tuple(parameters["array_shape"]))
+    )
+    only = set(args.only.split(",")) if args.only else None
+
+    results = {
+        "commit": _get_commit(),
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "parameters": parameters,
+        "results": {},
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        for name, setup, function in get_benchmarks(workflowresult, directory):
+            if only is not None and name not in only:
+                continue
+            result = run_benchmark(setup, function, args.repeat)
+            results["results"][name] = result
+            print(
+                f"{name:<28} {result['min_seconds']:8.3f}s "
+                f"(median {result['median_seconds']:.3f}s)  "
+                f"{result['peak_mib']:8.1f} MiB"
+            )
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Wrote {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
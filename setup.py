@@ -20,9 +20,15 @@ setuptools.setup(
         "Operating System :: OS Independent",
     ],
     install_requires=[
+        'numpy',
         'pandas',
         'sqlalchemy',
-        'flatten-json==0.1.7',
         'openpyxl'
-    ]
+    ],
+    extras_require={
+        'parquet': ['pyarrow'],
+        'duckdb': ['duckdb-engine'],
+        'orjson': ['orjson'],
+        'zstd': ['zstandard'],
+    }
 )
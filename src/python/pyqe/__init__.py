@@ -1,2 +1,13 @@
 from ._pyqe import *
-from ._sql import *
\ No newline at end of file
+from ._sql import *
+from ._io import *
+from ._ledger import *
+from ._synthetic import *
+from ._profile import *
+from ._watch import *
+from ._pipeline import *
+from ._dtypes import *
+from ._cache import *
+from ._fanout import *
+from ._relations import *
+from ._read import *
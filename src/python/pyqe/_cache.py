@@ -0,0 +1,271 @@
+"""An on-disk cache of the tables extracted from workflowresult files, so that
+exporting the same file to several sinks only parses and flattens it once."""
+
+import glob
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from importlib import metadata
+
+import pandas as pd
+
+from pyqe._profile import profile_stage
+
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".pyqe", "cache")
+DEFAULT_CACHE_SIZE = 1 << 30
+_MANIFEST_FILE = "manifest.json"
+
+_code_version = None
+
+
+def _get_code_version():
+    """Get a fingerprint of the installed library version and of the source of
+    its modules, so that cached tables are not reused once the code that
+    extracted them changes, including in editable installs."""
+
+    global _code_version
+    if _code_version is None:
+        try:
+            version = metadata.version("pyqe")
+        except metadata.PackageNotFoundError:
+            version = "unknown"
+        digest = hashlib.sha256(version.encode())
+        package_dir = os.path.dirname(os.path.abspath(__file__))
+        for path in sorted(glob.glob(os.path.join(package_dir, "*.py"))):
+            if path.endswith("_test.py"):
+                continue
+            with open(path, "rb") as f:
+                digest.update(f.read())
+        _code_version = digest.hexdigest()[:16]
+    return _code_version
+
+
+class ExtractionCache:
+    """A directory of the tables extracted from workflowresult files, keyed by
+    the hash of the file content and the version of the library.
+
+    Each entry holds one Arrow IPC file per table, which is read back without
+    parsing, or a pickle for the tables Arrow cannot represent, such as
+    columns mixing strings and numbers, or when pyarrow is not installed.
+    Reading an entry marks it as recently used, and the least recently used
+    entries are evicted once the cache outgrows `max_bytes`.
+
+    Args:
+        directory (str): The directory of the cache.
+        max_bytes (int): The largest total size of the cached entries.
+    """
+
+    def __init__(self, directory=CACHE_DIR, max_bytes=DEFAULT_CACHE_SIZE):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def key(self, digest, variant=None):
+        """Get the key of a workflowresult file.
+
+        Args:
+            digest (str): The hash of the file content, see `hash_file`.
+            variant (str): The options the tables were extracted with, if they
+                differ from the defaults, such as the layout of wide tables.
+        """
+
+        if variant is None:
+            return f"{digest}-{_get_code_version()}"
+        return f"{digest}-{_get_code_version()}-{variant}"
+
+    def get(self, key):
+        """Read the tables of an entry.
+
+        Returns:
+            dict: The dataframes of the entry, keyed by table name, or None if
+                the cache has no such entry.
+        """
+
+        entry_dir = os.path.join(self.directory, key)
+        manifest_path = os.path.join(entry_dir, _MANIFEST_FILE)
+        try:
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        dfs = {}
+        with profile_stage("cache_read", tables=len(manifest["tables"])):
+            try:
+                for table in manifest["tables"]:
+                    dfs[table["name"]] = _read_table(
+                        os.path.join(entry_dir, table["file"]), table["format"]
+                    )
+            except (OSError, ImportError):
+                # The entry was evicted while being read.
+                return None
+        try:
+            os.utime(manifest_path)
+        except OSError:
+            pass
+        return dfs
+
+    def get_info(self, key):
+        """Read the information stored along with the tables of an entry.
+
+        Returns:
+            dict: The `info` the entry was added with, or None if the cache
+                has no such entry or it was added without any.
+        """
+
+        try:
+            with open(os.path.join(self.directory, key, _MANIFEST_FILE)) as f:
+                return json.load(f).get("info")
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key, dfs, info=None):
+        """Add the tables of a workflowresult file to the cache.
+
+        Args:
+            key (str): The key of the file, see `key`.
+            dfs (dict): The dataframes of the file, keyed by table name.
+            info (dict): See `write_through`.
+        """
+
+        for _ in self.write_through(key, dfs.items(), info):
+            pass
+
+    def write_through(self, key, tables, info=None):
+        """Add tables to the cache as they are iterated over, so that they are
+        cached without being held in memory all at once. The entry is only
+        added once every table has been iterated over.
+
+        Args:
+            key (str): The key of the file, see `key`.
+            tables (iterable): (table name, pandas.DataFrame) tuples, as
+                yielded by `iter_dataframes`.
+            info (dict): JSON serializable information about the file to store
+                along with its tables, such as its steps, read back with
+                `get_info`. It is serialized once every table has been
+                iterated over.
+
+        Yields:
+            The tuples of `tables`.
+        """
+
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(prefix=".tmp-", dir=self.directory)
+        manifest = {"tables": [], "bytes": 0}
+        try:
+            for table_name, df in tables:
+                if tmp_dir is not None:
+                    file_name = str(len(manifest["tables"]))
+                    try:
+                        with profile_stage("cache_write", table=table_name):
+                            file_name, table_format = _write_table(
+                                df, os.path.join(tmp_dir, file_name)
+                            )
+                    except OSError as e:
+                        print(f"Could not cache the tables of {key}: {e}")
+                        shutil.rmtree(tmp_dir, ignore_errors=True)
+                        tmp_dir = None
+                    else:
+                        manifest["tables"].append(
+                            {"name": table_name, "file": file_name, "format": table_format}
+                        )
+                        manifest["bytes"] += os.path.getsize(
+                            os.path.join(tmp_dir, file_name)
+                        )
+                yield table_name, df
+            if tmp_dir is not None:
+                if info is not None:
+                    manifest["info"] = info
+                self._commit(key, tmp_dir, manifest)
+                tmp_dir = None
+        finally:
+            if tmp_dir is not None:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def _commit(self, key, tmp_dir, manifest):
+        if manifest["bytes"] > self.max_bytes:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return
+        with open(os.path.join(tmp_dir, _MANIFEST_FILE), "w") as f:
+            json.dump(manifest, f)
+        try:
+            os.rename(tmp_dir, os.path.join(self.directory, key))
+        except OSError:
+            # Another process cached the same file first.
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        self.evict()
+
+    def entries(self):
+        """List the entries of the cache.
+
+        Returns:
+            list: (last used time, size in bytes, key) tuples, least recently
+                used first.
+        """
+
+        entries = []
+        if not os.path.isdir(self.directory):
+            return entries
+        for key in os.listdir(self.directory):
+            if key.startswith("."):
+                # Entries still being written.
+                continue
+            manifest_path = os.path.join(self.directory, key, _MANIFEST_FILE)
+            try:
+                last_used = os.path.getmtime(manifest_path)
+                with open(manifest_path) as f:
+                    size = json.load(f)["bytes"]
+            except (OSError, ValueError, KeyError):
+                continue
+            entries.append((last_used, size, key))
+        entries.sort()
+        return entries
+
+    def evict(self):
+        """Remove the least recently used entries until the cache fits in
+        `max_bytes`."""
+
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, key in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(os.path.join(self.directory, key), ignore_errors=True)
+            total -= size
+
+    def clear(self):
+        """Remove every entry of the cache."""
+
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def _write_table(df, path):
+    """Write a dataframe to an Arrow IPC file, or to a pickle if Arrow cannot
+    represent it.
+
+    Returns:
+        tuple: The name of the file written and its format.
+    """
+
+    try:
+        import pyarrow as pa
+
+        table = pa.Table.from_pandas(df)
+    except (ImportError, ValueError, TypeError):
+        # ArrowInvalid and ArrowTypeError derive from ValueError and
+        # TypeError.
+        df.to_pickle(path + ".pkl")
+        return os.path.basename(path) + ".pkl", "pickle"
+    with pa.OSFile(path + ".arrow", "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    return os.path.basename(path) + ".arrow", "arrow"
+
+
+def _read_table(path, table_format):
+    if table_format == "pickle":
+        return pd.read_pickle(path)
+    import pyarrow as pa
+
+    with pa.memory_map(path) as source:
+        return pa.ipc.open_file(source).read_all().to_pandas()
@@ -0,0 +1,76 @@
+import unittest
+import json
+import os
+import tempfile
+import time
+import pandas as pd
+from ._cache import ExtractionCache
+from ._ledger import hash_file
+from ._pyqe import extract_dataframes, extract_dataframes_from_file
+from ._synthetic import generate_workflowresult
+
+
+class TestCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.cache = ExtractionCache(os.path.join(self.tmp_dir.name, "cache"))
+        self.path = os.path.join(self.tmp_dir.name, "workflowresult.json")
+        workflowresult = generate_workflowresult(n_steps=4, seed=1)
+        # A column mixing strings and numbers, which Arrow cannot store.
+        workflowresult["step-mixed"] = {"class": "mixed", "id": 0, "value": "a"}
+        workflowresult["step-mixed-2"] = {"class": "mixed", "id": 1, "value": 2}
+        with open(self.path, "w") as f:
+            json.dump(workflowresult, f)
+        self.dfs = extract_dataframes(workflowresult)
+
+    def test_cache_round_trip(self):
+        key = self.cache.key(hash_file(self.path))
+        self.assertIsNone(self.cache.get(key))
+        self.cache.put(key, self.dfs)
+        cached = self.cache.get(key)
+        self.assertEqual(list(cached), list(self.dfs))
+        for table_name, df in self.dfs.items():
+            pd.testing.assert_frame_equal(cached[table_name], df)
+
+    def test_extract_dataframes_from_file(self):
+        steps = []
+        dfs = extract_dataframes_from_file(self.path, cache=self.cache, steps=steps)
+        self.assertEqual(len(self.cache.entries()), 1)
+        digest = hash_file(self.path)
+        # Cached tables are read back without parsing the file, and so are
+        # its steps.
+        os.remove(self.path)
+        cached_steps = []
+        cached = extract_dataframes_from_file(
+            self.path, cache=self.cache, digest=digest, steps=cached_steps
+        )
+        self.assertEqual(list(cached), list(dfs))
+        self.assertEqual(cached_steps, steps)
+        self.assertIn(("", "step-mixed", 0), steps)
+        optimized = extract_dataframes_from_file(
+            self.path, optimize_dtypes=True, cache=self.cache, digest=digest
+        )
+        self.assertEqual(optimized["array"]["parentId"].dtype, "category")
+
+    def test_cache_eviction(self):
+        for key in ("a", "b", "c"):
+            self.cache.put(key, self.dfs)
+            time.sleep(0.01)
+        size = self.cache.entries()[0][1]
+        # Reading an entry marks it as recently used.
+        self.cache.get("a")
+        self.cache.max_bytes = 2 * size
+        self.cache.evict()
+        self.assertEqual(sorted(key for _, _, key in self.cache.entries()), ["a", "c"])
+
+        # Entries larger than the whole cache are not kept.
+        self.cache.max_bytes = size - 1
+        self.cache.put("d", self.dfs)
+        self.assertIsNone(self.cache.get("d"))
+        self.cache.clear()
+        self.assertEqual(self.cache.entries(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
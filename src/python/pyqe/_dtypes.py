@@ -0,0 +1,148 @@
+"""Compact dtypes for the dataframes extracted from workflowresults."""
+
+import numpy as np
+import pandas as pd
+
+from pyqe._profile import add_profile_callback, profile_stage, remove_profile_callback
+
+
+def optimize_dataframe(df, table_name=None, max_category_ratio=0.5):
+    """Convert the columns of a dataframe to more compact dtypes.
+
+    String columns with few distinct values, such as `parentId`, `taskClass`,
+    `workflowId` and `schema`, become categoricals. Integer columns, such as
+    the `index_<i>` columns, are downcast to the smallest integer type that
+    holds their values, and float columns to float32 where that loses no
+    precision. The index is left as is.
+
+    The savings are reported to the profile callbacks as the `bytes_before`
+    and `bytes_after` of an `optimize_dtypes` stage, see `DtypeSavings`.
+
+    Args:
+        df (pandas.DataFrame): The dataframe to optimize.
+        table_name (str): The name of the table, used to report the savings.
+        max_category_ratio (float): The largest ratio of distinct values to
+            rows for which a string column becomes a categorical.
+
+    Returns:
+        pandas.DataFrame: The optimized dataframe. `df` is left unchanged.
+    """
+
+    with profile_stage(
+        "optimize_dtypes", table=table_name, rows=len(df.index), columns=len(df.columns)
+    ) as stage:
+        stage["bytes_before"] = _memory_usage(df)
+        converted = {}
+        for col, values in df.items():
+            if isinstance(values.dtype, pd.SparseDtype):
+                # Sparse columns only hold the values rows have already.
+                continue
+            kind = values.dtype.kind
+            if kind == "O":
+                if (
+                    len(values.index)
+                    and pd.api.types.infer_dtype(values, skipna=True) == "string"
+                    and values.nunique() <= max_category_ratio * len(values.index)
+                ):
+                    converted[col] = values.astype("category")
+            elif kind == "i":
+                converted[col] = pd.to_numeric(values, downcast="integer")
+            elif kind == "u":
+                converted[col] = pd.to_numeric(values, downcast="unsigned")
+            elif kind == "f" and values.dtype.itemsize > 4:
+                with np.errstate(over="ignore"):
+                    narrowed = values.astype(np.float32)
+                if np.array_equal(
+                    narrowed.to_numpy(np.float64), values.to_numpy(), equal_nan=True
+                ):
+                    converted[col] = narrowed
+        if converted:
+            df = df.copy(deep=False)
+            for col, values in converted.items():
+                df[col] = values
+        stage["bytes_after"] = _memory_usage(df)
+    return df
+
+
+def restore_dtypes(df, categoricals=False):
+    """Widen the numeric columns narrowed by `optimize_dataframe` back to 64
+    bits, so that sinks write the same values and column types whether or not
+    the dtypes were optimized. Sparse columns are made dense.
+
+    Args:
+        df (pandas.DataFrame): The dataframe to restore.
+        categoricals (bool): Also turn categoricals back into object columns.
+
+    Returns:
+        pandas.DataFrame: The restored dataframe, or `df` itself if none of its
+            columns needed restoring.
+    """
+
+    restored = {}
+    for col, values in df.items():
+        dtype = values.dtype
+        if isinstance(dtype, pd.SparseDtype):
+            restored[col] = values.sparse.to_dense()
+        elif isinstance(dtype, pd.CategoricalDtype):
+            if categoricals:
+                restored[col] = values.astype(object)
+        elif dtype.kind in "iuf" and dtype.itemsize < 8:
+            restored[col] = values.astype(f"{dtype.kind}8")
+    if not restored:
+        return df
+    df = df.copy(deep=False)
+    for col, values in restored.items():
+        df[col] = values
+    return df
+
+
+def _memory_usage(df):
+    return int(df.memory_usage(deep=True).sum())
+
+
+class DtypeSavings:
+    """Collect the memory saved by `optimize_dataframe` on each table while it
+    is used as a context manager.
+
+    Attributes:
+        tables (dict): The total bytes before and after optimization of each
+            table.
+    """
+
+    def __init__(self):
+        self.tables = {}
+
+    def __call__(self, record):
+        if record["stage"] != "optimize_dtypes":
+            return
+        before, after = self.tables.get(record["table"], (0, 0))
+        self.tables[record["table"]] = (
+            before + record["bytes_before"],
+            after + record["bytes_after"],
+        )
+
+    def __enter__(self):
+        add_profile_callback(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        remove_profile_callback(self)
+
+    def report(self):
+        for table_name, (before, after) in self.tables.items():
+            print(
+                f"Optimized dtypes of {table_name}: "
+                f"{before / 2 ** 20:.2f} MiB -> {after / 2 ** 20:.2f} MiB "
+                f"({_percent_saved(before, after):.0f}% saved)"
+            )
+        before = sum(before for before, _ in self.tables.values())
+        after = sum(after for _, after in self.tables.values())
+        print(
+            f"Optimized dtypes of {len(self.tables)} tables: "
+            f"{before / 2 ** 20:.2f} MiB -> {after / 2 ** 20:.2f} MiB "
+            f"({_percent_saved(before, after):.0f}% saved)"
+        )
+
+
+def _percent_saved(before, after):
+    return 100 * (before - after) / before if before else 0.0
@@ -0,0 +1,72 @@
+import unittest
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+from ._dtypes import DtypeSavings, optimize_dataframe, restore_dtypes
+from ._pyqe import export_dataframes_to_csv, extract_dataframes, send_dataframes_to_sql
+from ._sql import create_sql_engine
+from ._synthetic import generate_workflowresult
+
+
+class TestDtypes(unittest.TestCase):
+    def setUp(self):
+        self.df = pd.DataFrame(
+            {
+                "parentId": ["step-1"] * 6 + ["step-2"] * 6,
+                "name": [f"name-{i}" for i in range(12)],
+                "index_0": np.arange(12),
+                "value": np.linspace(0, 1, 12),
+                "count": [float(i) for i in range(11)] + [np.nan],
+            }
+        )
+
+    def test_optimize_dataframe(self):
+        optimized = optimize_dataframe(self.df)
+        self.assertEqual(optimized["parentId"].dtype, "category")
+        # Mostly distinct strings are left as they are.
+        self.assertEqual(optimized["name"].dtype, object)
+        self.assertEqual(optimized["index_0"].dtype, np.int8)
+        # Floats are only narrowed when no precision is lost.
+        self.assertEqual(optimized["value"].dtype, np.float64)
+        self.assertEqual(optimized["count"].dtype, np.float32)
+        self.assertEqual(self.df["parentId"].dtype, object)
+        pd.testing.assert_frame_equal(
+            restore_dtypes(optimized, categoricals=True), self.df
+        )
+
+    def test_dtype_savings(self):
+        workflowresult = generate_workflowresult(n_steps=20, seed=1)
+        with DtypeSavings() as savings:
+            dfs = extract_dataframes(workflowresult, optimize_dtypes=True)
+        self.assertEqual(set(savings.tables), set(dfs))
+        before = sum(before for before, _ in savings.tables.values())
+        after = sum(after for _, after in savings.tables.values())
+        self.assertLess(after, before / 2)
+        savings.report()
+
+    def test_sinks(self):
+        workflowresult = generate_workflowresult(n_steps=4, seed=1)
+        dfs = extract_dataframes(workflowresult)
+        optimized = extract_dataframes(workflowresult, optimize_dtypes=True)
+        with tempfile.TemporaryDirectory() as directory:
+            export_dataframes_to_csv(dfs, os.path.join(directory, "plain"))
+            export_dataframes_to_csv(optimized, os.path.join(directory, "optimized"))
+            for table_name in dfs:
+                with open(os.path.join(directory, "plain", table_name + ".csv")) as f:
+                    plain = f.read()
+                with open(
+                    os.path.join(directory, "optimized", table_name + ".csv")
+                ) as f:
+                    self.assertEqual(f.read(), plain)
+
+        engine = create_sql_engine("sqlite://")
+        send_dataframes_to_sql(optimized, engine=engine)
+        send_dataframes_to_sql(optimized, engine=engine)
+        df = pd.read_sql('SELECT * FROM "array"', engine)
+        self.assertEqual(len(df.index), 2 * len(dfs["array"].index))
+        self.assertEqual(df["index_0"].dtype, np.int64)
+
+
+if __name__ == "__main__":
+    unittest.main()
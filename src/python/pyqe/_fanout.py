@@ -0,0 +1,88 @@
+"""Writing the same dataframes to several sinks at once."""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from pyqe._profile import profile_stage
+
+
+class SinkSummary:
+    """The outcome of writing to each sink, see `write_to_sinks`.
+
+    Attributes:
+        seconds (dict): The wall time spent writing to each sink, keyed by
+            sink name.
+        errors (dict): The exception raised by each sink that failed, keyed
+            by sink name.
+        wall_seconds (float): The time from the start of the first sink to the
+            end of the last one.
+    """
+
+    def __init__(self):
+        self.seconds = {}
+        self.errors = {}
+        self.wall_seconds = 0.0
+
+    @property
+    def failed(self):
+        """The names of the sinks that failed."""
+
+        return list(self.errors)
+
+    def report(self):
+        for name, seconds in self.seconds.items():
+            if name in self.errors:
+                print(f"Failed to write to {name} after {seconds:.2f}s: {self.errors[name]}")
+            else:
+                print(f"Wrote to {name} in {seconds:.2f}s")
+        print(
+            f"Wrote to {len(self.seconds) - len(self.errors)} of {len(self.seconds)} "
+            f"sinks in {self.wall_seconds:.2f}s "
+            f"(sinks took {sum(self.seconds.values()):.2f}s in total)"
+        )
+
+
+def write_to_sinks(dfs, sinks, max_workers=None):
+    """Write the same dataframes to several sinks concurrently, each on a
+    thread of a pool. A sink that fails does not stop the others.
+
+    The dataframes are shared by all sinks, which must not modify them. The
+    sinks of this module's exports, such as `export_dataframes_to_csv` and
+    `send_dataframes_to_sql`, only read them.
+
+    Args:
+        dfs (dict): The dataframes to write, keyed by table name, as returned
+            by `extract_dataframes`.
+        sinks (dict): Functions taking `dfs` and writing them to a sink, keyed
+            by sink name.
+        max_workers (int): The number of threads. Defaults to one per sink.
+
+    Returns:
+        SinkSummary: The time spent on each sink and the errors of the sinks
+            that failed.
+    """
+
+    summary = SinkSummary()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers or len(sinks) or 1) as executor:
+        futures = {
+            name: executor.submit(_write_to_sink, name, sink, dfs)
+            for name, sink in sinks.items()
+        }
+        for name, future in futures.items():
+            seconds, error = future.result()
+            summary.seconds[name] = seconds
+            if error is not None:
+                summary.errors[name] = error
+    summary.wall_seconds = time.perf_counter() - start
+    return summary
+
+
+def _write_to_sink(name, sink, dfs):
+    start = time.perf_counter()
+    try:
+        with profile_stage("write_sink", sink=name):
+            sink(dfs)
+    except Exception as e:
+        return time.perf_counter() - start, e
+    return time.perf_counter() - start, None
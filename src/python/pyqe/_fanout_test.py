@@ -0,0 +1,62 @@
+import unittest
+import os
+import tempfile
+import threading
+import pandas as pd
+from ._fanout import write_to_sinks
+from ._pyqe import export_dataframes_to_csv, extract_dataframes, send_dataframes_to_sql
+from ._sql import create_sql_engine
+from ._synthetic import generate_workflowresult
+
+
+class TestFanout(unittest.TestCase):
+    def test_write_to_sinks(self):
+        written = []
+        # Both sinks wait for each other, which only succeeds if they run
+        # concurrently.
+        barrier = threading.Barrier(2, timeout=5)
+
+        def sink(name):
+            def write(dfs):
+                barrier.wait()
+                written.append((name, dfs))
+
+            return write
+
+        def fail(dfs):
+            raise ValueError("sink is down")
+
+        dfs = {"table": pd.DataFrame({"a": [1, 2]})}
+        summary = write_to_sinks(dfs, {"a": sink("a"), "b": sink("b"), "c": fail})
+        self.assertEqual(sorted(name for name, _ in written), ["a", "b"])
+        # Every sink got the same dataframes.
+        self.assertTrue(all(written_dfs is dfs for _, written_dfs in written))
+        self.assertEqual(list(summary.seconds), ["a", "b", "c"])
+        self.assertEqual(summary.failed, ["c"])
+        self.assertIsInstance(summary.errors["c"], ValueError)
+        summary.report()
+
+    def test_write_to_sinks_shared_dataframes(self):
+        dfs = extract_dataframes(generate_workflowresult(n_steps=4, seed=1))
+        with tempfile.TemporaryDirectory() as directory:
+            # In-memory SQLite databases are private to the thread using them.
+            engine = create_sql_engine(
+                "sqlite:///" + os.path.join(directory, "results.db")
+            )
+            summary = write_to_sinks(
+                dfs,
+                {
+                    "csv": lambda dfs: export_dataframes_to_csv(dfs, directory),
+                    "sql": lambda dfs: send_dataframes_to_sql(dfs, engine=engine),
+                },
+            )
+            csv = pd.read_csv(os.path.join(directory, "array.csv"))
+            sql = pd.read_sql('SELECT * FROM "array"', engine)
+            engine.dispose()
+        self.assertEqual(summary.failed, [])
+        self.assertEqual(len(csv.index), len(dfs["array"].index))
+        self.assertEqual(len(sql.index), len(dfs["array"].index))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,253 @@
+"""Utilities for reading Quantum Engine workflowresult files."""
+
+import gzip
+import json
+import mmap
+import os
+import re
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_DECODER = json.JSONDecoder()
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+# The functions decoding a JSON document from bytes, keyed by name, with
+# whether they accept any buffer such as a memory-mapped file.
+_json_decoders = {"json": (json.loads, False)}
+# The decoders used by default, in order of preference.
+DEFAULT_JSON_DECODERS = ("orjson", "json")
+
+try:
+    import orjson
+except ImportError:
+    pass
+else:
+    _json_decoders["orjson"] = (orjson.loads, True)
+
+
+def register_json_decoder(name, loads, accepts_buffer=False):
+    """Register a function decoding JSON documents, to be selected by name in
+    `load_workflowresult`.
+
+    Args:
+        name (str): The name of the decoder.
+        loads (callable): A function taking the bytes of a JSON document and
+            returning the decoded value.
+        accepts_buffer (bool): Whether `loads` accepts any object supporting
+            the buffer protocol, such as a memoryview of a memory-mapped file,
+            instead of only bytes.
+    """
+
+    _json_decoders[name] = (loads, accepts_buffer)
+
+
+def get_json_decoder(name=None):
+    """Get the name of a registered JSON decoder.
+
+    Args:
+        name (str): The name of the decoder. Defaults to the first installed
+            decoder of `DEFAULT_JSON_DECODERS`: orjson if available, else the
+            standard library.
+
+    Returns:
+        str: The name of the decoder.
+    """
+
+    if name is None:
+        return next(name for name in DEFAULT_JSON_DECODERS if name in _json_decoders)
+    if name not in _json_decoders:
+        raise ValueError(
+            f"Unknown JSON decoder {name!r}, choose one of {', '.join(_json_decoders)}"
+        )
+    return name
+
+
+def _get_compression(path):
+    with open(path, "rb") as f:
+        magic = f.read(4)
+    if magic.startswith(GZIP_MAGIC):
+        return "gzip"
+    if magic.startswith(ZSTD_MAGIC):
+        return "zstd"
+    return None
+
+
+def _open_zstd(path, mode):
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError(
+            "Reading zstd-compressed workflowresults requires zstandard, "
+            "install it with `pip install pyqe[zstd]`."
+        )
+    return zstandard.open(path, mode)
+
+
+def open_workflowresult(path):
+    """Open a Quantum Engine workflowresult JSON file as text, decompressing
+    it on the fly if it is compressed with gzip or zstd.
+
+    Args:
+        path (str): The path of the file.
+
+    Returns:
+        file: A text file object, for example for `iter_workflowresult_steps`.
+    """
+
+    compression = _get_compression(path)
+    if compression == "gzip":
+        return gzip.open(path, "rt")
+    if compression == "zstd":
+        return _open_zstd(path, "rt")
+    return open(path)
+
+
+def load_workflowresult(path, decoder=None):
+    """Load a Quantum Engine workflowresult JSON file.
+
+    Uncompressed files are memory-mapped for decoders that accept buffers,
+    such as orjson, which then decode straight from the page cache without
+    copying the file.
+    Files compressed with gzip or zstd are recognized by their content and
+    decompressed in memory. If a decoder other than the standard library's
+    rejects a document, for example because it holds NaN values, the
+    document is decoded again with the standard library.
+
+    Args:
+        path (str): The path of the file.
+        decoder (str): The name of the JSON decoder to use, see
+            `get_json_decoder`. Defaults to the fastest installed decoder.
+
+    Returns:
+        dict: The workflowresult.
+    """
+
+    decoder = get_json_decoder(decoder)
+    compression = _get_compression(path)
+    if compression is not None:
+        if compression == "gzip":
+            f = gzip.open(path, "rb")
+        else:
+            f = _open_zstd(path, "rb")
+        with f:
+            return _decode(f.read(), decoder)
+
+    with open(path, "rb") as f:
+        if not _json_decoders[decoder][1] or os.fstat(f.fileno()).st_size == 0:
+            # Copying a map into bytes would only add to reading the file, and
+            # empty files cannot be memory-mapped.
+            return _decode(f.read(), decoder)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            # The view must be released before the map is closed.
+            with memoryview(mapped) as view:
+                return _decode(view, decoder)
+
+
+def _decode(data, decoder):
+    loads = _json_decoders[decoder][0]
+    if decoder == "json":
+        return loads(data)
+    try:
+        return loads(data)
+    except Exception:
+        return json.loads(bytes(data))
+
+
+class _ChunkReader:
+    """Incrementally decodes JSON values from a text file object, reading it
+    in chunks so that only the value currently being decoded is held in
+    memory."""
+
+    def __init__(self, fp, chunk_size):
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def _read_more(self, size):
+        # Drop the part of the buffer that has already been consumed before
+        # growing it.
+        if self.pos > 0:
+            self.buffer = self.buffer[self.pos :]
+            self.pos = 0
+        chunk = self.fp.read(size)
+        if not chunk:
+            self.eof = True
+        self.buffer += chunk
+
+    def _skip_whitespace(self):
+        while True:
+            self.pos = _WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer) or self.eof:
+                return
+            self._read_more(self.chunk_size)
+
+    def next_char(self):
+        """Consume and return the next non-whitespace character, or an empty
+        string at the end of the file."""
+        self._skip_whitespace()
+        if self.pos >= len(self.buffer):
+            return ""
+        char = self.buffer[self.pos]
+        self.pos += 1
+        return char
+
+    def peek_char(self):
+        """Return the next non-whitespace character without consuming it."""
+        self._skip_whitespace()
+        return self.buffer[self.pos : self.pos + 1]
+
+    def expect(self, char):
+        found = self.next_char()
+        if found != char:
+            raise ValueError(f"Expected {char!r} in workflowresult, found {found!r}")
+
+    def decode(self):
+        """Consume and return the next JSON value."""
+        self._skip_whitespace()
+        while True:
+            try:
+                value, end = _DECODER.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            else:
+                # A number that ends exactly at the end of the buffer may be
+                # truncated, so only accept it once more input is available.
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return value
+            # Double the buffer so that re-decoding a large value stays linear
+            # in its size.
+            self._read_more(max(self.chunk_size, len(self.buffer)))
+
+
+def iter_workflowresult_steps(fp, chunk_size=1 << 20):
+    """Iterate over the steps of a Quantum Engine workflowresult JSON file
+    without loading the whole file into memory.
+
+    Args:
+        fp (file): A text file object containing a workflowresult JSON object.
+        chunk_size (int): The number of characters to read from `fp` at a time.
+
+    Yields:
+        tuple: The key of each top-level step and the step dict itself.
+    """
+
+    reader = _ChunkReader(fp, chunk_size)
+    reader.expect("{")
+    if reader.peek_char() == "}":
+        return
+    while True:
+        key = reader.decode()
+        reader.expect(":")
+        yield key, reader.decode()
+        separator = reader.next_char()
+        if separator == "}":
+            return
+        if separator != ",":
+            raise ValueError(
+                f"Expected ',' or '}}' in workflowresult, found {separator!r}"
+            )
@@ -0,0 +1,90 @@
+import unittest
+import gzip
+import io
+import json
+import math
+import os
+import tempfile
+from ._io import (
+    _json_decoders,
+    iter_workflowresult_steps,
+    load_workflowresult,
+    open_workflowresult,
+    register_json_decoder,
+)
+
+
+class TestIo(unittest.TestCase):
+    def setUp(self):
+        self.workflowresult = {
+            "step-1": {"class": "class-A", "id": "a", "values": [1.5, 2, 3e10]},
+            "step-2": {"class": "class-B", "id": "b", "nested": {"text": "}{,:"}},
+            "step-3": 12345,
+        }
+
+    def test_iter_workflowresult_steps(self):
+        text = json.dumps(self.workflowresult, indent=2)
+        # A tiny chunk size forces values to span several reads.
+        for chunk_size in (1, 3, 1 << 20):
+            steps = list(iter_workflowresult_steps(io.StringIO(text), chunk_size))
+            self.assertEqual(steps, list(self.workflowresult.items()))
+
+    def test_iter_workflowresult_steps_empty(self):
+        self.assertEqual(list(iter_workflowresult_steps(io.StringIO(" { } "))), [])
+
+    def test_iter_workflowresult_steps_invalid(self):
+        with self.assertRaises(ValueError):
+            list(iter_workflowresult_steps(io.StringIO('{"a": 1 "b": 2}')))
+
+    def test_load_workflowresult(self):
+        text = json.dumps(self.workflowresult)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "workflowresult.json")
+            with open(path, "w") as f:
+                f.write(text)
+            gzip_path = path + ".gz"
+            with gzip.open(gzip_path, "wt") as f:
+                f.write(text)
+            paths = [path, gzip_path]
+            try:
+                import zstandard
+            except ImportError:
+                pass
+            else:
+                zstd_path = path + ".zst"
+                with zstandard.open(zstd_path, "wt") as f:
+                    f.write(text)
+                paths.append(zstd_path)
+
+            for path in paths:
+                for decoder in (None, "json"):
+                    self.assertEqual(
+                        load_workflowresult(path, decoder), self.workflowresult
+                    )
+                with open_workflowresult(path) as f:
+                    steps = list(iter_workflowresult_steps(f))
+                self.assertEqual(steps, list(self.workflowresult.items()))
+
+    def test_load_workflowresult_decoder(self):
+        calls = []
+
+        def loads(data):
+            calls.append(type(data))
+            raise ValueError("unsupported")
+
+        register_json_decoder("test", loads, accepts_buffer=True)
+        self.addCleanup(_json_decoders.pop, "test")
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "workflowresult.json")
+            with open(path, "w") as f:
+                f.write('{"step-1": {"value": NaN}}')
+            # Documents the decoder rejects are decoded by the standard library.
+            workflowresult = load_workflowresult(path, "test")
+            with self.assertRaises(ValueError):
+                load_workflowresult(path, "unknown")
+        self.assertEqual(calls, [memoryview])
+        self.assertTrue(math.isnan(workflowresult["step-1"]["value"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
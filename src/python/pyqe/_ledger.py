@@ -0,0 +1,268 @@
+"""A ledger of the workflowresults already loaded into a sink, keyed by the
+hash of their content, so that re-running a conversion does not load the
+same workflowresult twice, and a checkpoint of the steps of each workflow
+already loaded into a sink, so that re-exporting a running workflow only loads
+its new steps."""
+
+import datetime
+import hashlib
+import json
+import os
+from sqlalchemy import Column, DateTime, MetaData, String, Table, Text, inspect
+
+LEDGER_FILE = ".pyqe_ledger.json"
+SQL_LEDGER_TABLE = "pyqe_ledger"
+CHECKPOINT_FILE = ".pyqe_checkpoint.json"
+SQL_CHECKPOINT_TABLE = "pyqe_checkpoint"
+
+_sql_ledger_table = Table(
+    SQL_LEDGER_TABLE,
+    MetaData(),
+    Column("hash", String(64), primary_key=True),
+    Column("source", Text),
+    Column("loaded_at", DateTime),
+)
+
+_sql_checkpoint_table = Table(
+    SQL_CHECKPOINT_TABLE,
+    MetaData(),
+    Column("workflow_id", String(255), primary_key=True),
+    Column("step", String(255), primary_key=True),
+    Column("step_id", Text),
+    Column("loaded_at", DateTime),
+)
+
+
+def hash_file(path, chunk_size=1 << 20):
+    """Compute the SHA-256 hash of the content of a file without parsing it.
+
+    Args:
+        path (str): The path of the file.
+        chunk_size (int): The number of bytes to read at a time.
+
+    Returns:
+        str: The hexadecimal digest of the file.
+    """
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class FileLedger:
+    """A ledger kept as a JSON sidecar file next to a file sink.
+
+    Args:
+        path (str): The path of the ledger file, by convention `LEDGER_FILE` in
+            the output directory, or `.<file>.pyqe_ledger` for a single output
+            file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._entries = {}
+        if os.path.isfile(path):
+            with open(path) as f:
+                self._entries = json.load(f)
+
+    def __contains__(self, digest):
+        return digest in self._entries
+
+    def record(self, entries):
+        """Record workflowresults as loaded.
+
+        Args:
+            entries (list): (hash, source path) tuples.
+        """
+
+        loaded_at = datetime.datetime.now().isoformat(timespec="seconds")
+        for digest, source in entries:
+            self._entries[digest] = {"source": source, "loaded_at": loaded_at}
+        _write_json(self.path, self._entries)
+
+
+class SqlLedger:
+    """A ledger kept as the `pyqe_ledger` table of a SQL database.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): The engine connected to the database.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def __contains__(self, digest):
+        if not inspect(self.engine).has_table(SQL_LEDGER_TABLE):
+            return False
+        query = _sql_ledger_table.select().where(_sql_ledger_table.c.hash == digest)
+        with self.engine.connect() as conn:
+            return conn.execute(query).first() is not None
+
+    def record(self, entries, conn=None):
+        """Record workflowresults as loaded.
+
+        Args:
+            entries (list): (hash, source path) tuples.
+            conn (sqlalchemy.engine.Connection): A connection to record the
+                entries with, so that they are committed in the same
+                transaction as the data they describe. By default the entries
+                are committed on their own.
+        """
+
+        if conn is None:
+            with self.engine.begin() as conn:
+                self.record(entries, conn)
+            return
+        if not entries:
+            return
+        _sql_ledger_table.create(conn, checkfirst=True)
+        loaded_at = datetime.datetime.now()
+        # Entries of forced reloads replace the existing ones.
+        conn.execute(
+            _sql_ledger_table.delete().where(
+                _sql_ledger_table.c.hash.in_([digest for digest, _ in entries])
+            )
+        )
+        conn.execute(
+            _sql_ledger_table.insert(),
+            [
+                {"hash": digest, "source": source, "loaded_at": loaded_at}
+                for digest, source in entries
+            ],
+        )
+
+
+class FileCheckpoint:
+    """A checkpoint of the steps loaded into a file sink, kept as a JSON
+    sidecar file that maps each workflow id to the keys and ids of its steps.
+
+    Args:
+        path (str): The path of the checkpoint file, by convention
+            `CHECKPOINT_FILE` in the output directory, or
+            `.<file>.pyqe_checkpoint` for a single output file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._workflows = {}
+        if os.path.isfile(path):
+            with open(path) as f:
+                self._workflows = json.load(f)
+
+    def get_steps(self, workflow_ids):
+        """Get the keys of the steps already loaded for some workflows.
+
+        Args:
+            workflow_ids (iterable): The ids of the workflows.
+
+        Returns:
+            set: The keys of the loaded steps.
+        """
+
+        steps = set()
+        for workflow_id in workflow_ids:
+            steps.update(self._workflows.get(workflow_id, ()))
+        return steps
+
+    def record(self, steps):
+        """Record steps as loaded.
+
+        Args:
+            steps (list): (workflow id, step key, step id) tuples, see
+                `get_step_entries`.
+        """
+
+        if not steps:
+            return
+        for workflow_id, step, step_id in steps:
+            self._workflows.setdefault(workflow_id, {})[step] = step_id
+        _write_json(self.path, self._workflows)
+
+
+class SqlCheckpoint:
+    """A checkpoint of the steps loaded into a SQL database, kept as the
+    `pyqe_checkpoint` table.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): The engine connected to the database.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def get_steps(self, workflow_ids):
+        """Get the keys of the steps already loaded for some workflows.
+
+        Args:
+            workflow_ids (iterable): The ids of the workflows.
+
+        Returns:
+            set: The keys of the loaded steps.
+        """
+
+        workflow_ids = list(workflow_ids)
+        if not workflow_ids or not inspect(self.engine).has_table(SQL_CHECKPOINT_TABLE):
+            return set()
+        query = _sql_checkpoint_table.select().where(
+            _sql_checkpoint_table.c.workflow_id.in_(workflow_ids)
+        )
+        with self.engine.connect() as conn:
+            return {row.step for row in conn.execute(query)}
+
+    def record(self, steps, conn=None):
+        """Record steps as loaded.
+
+        Args:
+            steps (list): (workflow id, step key, step id) tuples, see
+                `get_step_entries`.
+            conn (sqlalchemy.engine.Connection): A connection to record the
+                steps with, so that they are committed in the same transaction
+                as the data they describe. By default the steps are committed
+                on their own.
+        """
+
+        if conn is None:
+            with self.engine.begin() as conn:
+                self.record(steps, conn)
+            return
+        if not steps:
+            return
+        _sql_checkpoint_table.create(conn, checkfirst=True)
+        loaded_at = datetime.datetime.now()
+        # Steps of forced reloads replace the existing ones.
+        by_workflow = {}
+        for workflow_id, step, _ in steps:
+            by_workflow.setdefault(workflow_id, []).append(step)
+        for workflow_id, workflow_steps in by_workflow.items():
+            conn.execute(
+                _sql_checkpoint_table.delete().where(
+                    (_sql_checkpoint_table.c.workflow_id == workflow_id)
+                    & _sql_checkpoint_table.c.step.in_(workflow_steps)
+                )
+            )
+        conn.execute(
+            _sql_checkpoint_table.insert(),
+            [
+                {
+                    "workflow_id": workflow_id,
+                    "step": step,
+                    "step_id": None if step_id is None else str(step_id),
+                    "loaded_at": loaded_at,
+                }
+                for workflow_id, step, step_id in steps
+            ],
+        )
+
+
+def _write_json(path, data):
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    # Write to a temporary file first so that an interrupted run cannot leave
+    # a truncated file behind.
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
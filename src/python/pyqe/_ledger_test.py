@@ -0,0 +1,111 @@
+import unittest
+import os
+import tempfile
+from ._ledger import FileCheckpoint, FileLedger, SqlCheckpoint, SqlLedger, hash_file
+from ._pyqe import (
+    extract_dataframes,
+    get_step_entries,
+    send_dataframes_to_sql,
+    send_workflowresult_to_sql,
+)
+from ._pyqe_test import _sqlite_engine
+
+
+class TestLedger(unittest.TestCase):
+    def setUp(self):
+        self.workflowresult = {"step-1": {"class": "class-A", "id": "a", "scalar": 1}}
+
+    def test_hash_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "workflow_result.json")
+            with open(path, "w") as f:
+                f.write('{"step-1": {}}')
+            digest = hash_file(path)
+            self.assertEqual(hash_file(path, chunk_size=3), digest)
+            with open(path, "w") as f:
+                f.write('{"step-2": {}}')
+            self.assertNotEqual(hash_file(path), digest)
+
+    def test_file_ledger(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "csv_data", ".pyqe_ledger.json")
+            ledger = FileLedger(path)
+            self.assertNotIn("abc", ledger)
+            ledger.record([("abc", "workflow_result.json")])
+            self.assertIn("abc", ledger)
+            self.assertIn("abc", FileLedger(path))
+
+    def test_sql_ledger(self):
+        engine = _sqlite_engine()
+        ledger = SqlLedger(engine)
+        self.assertNotIn("abc", ledger)
+        entries = [("abc", "workflow_result.json")]
+        send_workflowresult_to_sql(
+            self.workflowresult, engine=engine, ledger_entries=entries
+        )
+        self.assertIn("abc", ledger)
+        # Recording a forced reload replaces the existing entry.
+        send_workflowresult_to_sql(
+            self.workflowresult, engine=engine, ledger_entries=entries
+        )
+        with engine.connect() as conn:
+            rows = conn.exec_driver_sql("SELECT hash FROM pyqe_ledger").fetchall()
+        self.assertEqual(rows, [("abc",)])
+
+    def test_sql_ledger_rollback(self):
+        engine = _sqlite_engine()
+        self.workflowresult["step-2"] = {"class": "class-A", "id": "a", "scalar": "x"}
+        with engine.begin() as conn:
+            conn.exec_driver_sql('CREATE TABLE "class-A" (_id TEXT PRIMARY KEY)')
+        with self.assertRaises(Exception):
+            send_workflowresult_to_sql(
+                self.workflowresult,
+                engine=engine,
+                ledger_entries=[("abc", "workflow_result.json")],
+            )
+        self.assertNotIn("abc", SqlLedger(engine))
+
+    def test_file_checkpoint(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "csv_data", ".pyqe_checkpoint.json")
+            checkpoint = FileCheckpoint(path)
+            self.assertEqual(checkpoint.get_steps(["w"]), set())
+            checkpoint.record([("w", "step-1", "a"), ("v", "step-2", "b")])
+            checkpoint.record([("w", "step-3", "c")])
+            self.assertEqual(
+                FileCheckpoint(path).get_steps(["w"]), {"step-1", "step-3"}
+            )
+            self.assertEqual(
+                FileCheckpoint(path).get_steps(["w", "v"]),
+                {"step-1", "step-2", "step-3"},
+            )
+
+    def test_sql_checkpoint(self):
+        engine = _sqlite_engine()
+        checkpoint = SqlCheckpoint(engine)
+        self.assertEqual(checkpoint.get_steps(["w"]), set())
+        for step in ("step-1", "step-2"):
+            self.workflowresult[step] = {
+                "class": "class-A",
+                "id": step,
+                "workflowId": "w",
+                "scalar": 1,
+            }
+            loaded = checkpoint.get_steps(["w"])
+            # Only the steps added since the last upload are sent.
+            send_dataframes_to_sql(
+                extract_dataframes(self.workflowresult, skip_steps=loaded),
+                engine=engine,
+                step_entries=get_step_entries(self.workflowresult, loaded),
+            )
+        self.assertEqual(checkpoint.get_steps(["w"]), {"step-1", "step-2"})
+        with engine.connect() as conn:
+            rows = conn.exec_driver_sql('SELECT _id FROM "class-A"').fetchall()
+        self.assertEqual(sorted(rows), [("step-1",), ("step-2",)])
+        # Recording a forced reload replaces the existing steps.
+        checkpoint.record([("w", "step-1", "step-1")])
+        self.assertEqual(checkpoint.get_steps(["w"]), {"step-1", "step-2"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,123 @@
+"""Overlapping the production of tables with writing them to a sink."""
+
+import queue
+import threading
+import time
+
+_DONE = object()
+
+
+class PipelineStats:
+    """The time spent in each stage of a pipeline, see `pipelined`.
+
+    Attributes:
+        items (int): The number of items that went through the pipeline.
+        produce_seconds (float): The time spent producing items, for example
+            flattening tables.
+        consume_seconds (float): The time spent consuming items, for example
+            writing tables to a sink.
+        producer_blocked_seconds (float): The time the producer waited for
+            room in the queue, because the consumer was slower.
+        consumer_idle_seconds (float): The time the consumer waited for items,
+            because the producer was slower.
+        wall_seconds (float): The time from the start to the end of the
+            pipeline.
+    """
+
+    def __init__(self):
+        self.items = 0
+        self.produce_seconds = 0.0
+        self.consume_seconds = 0.0
+        self.producer_blocked_seconds = 0.0
+        self.consumer_idle_seconds = 0.0
+        self.wall_seconds = 0.0
+
+    @property
+    def overlap_seconds(self):
+        """The time during which producing and consuming ran concurrently."""
+
+        return max(0.0, self.produce_seconds + self.consume_seconds - self.wall_seconds)
+
+    def report(self):
+        print(
+            f"Pipelined {self.items} items in {self.wall_seconds:.2f}s: "
+            f"producing {self.produce_seconds:.2f}s, "
+            f"consuming {self.consume_seconds:.2f}s, "
+            f"overlapped {self.overlap_seconds:.2f}s "
+            f"(producer blocked {self.producer_blocked_seconds:.2f}s, "
+            f"consumer idle {self.consumer_idle_seconds:.2f}s)"
+        )
+
+
+def pipelined(iterable, queue_size=2, stats=None):
+    """Iterate over `iterable` on a background thread, so that the next items
+    are produced while the caller consumes the current one.
+
+    At most `queue_size` produced items wait to be consumed, which bounds the
+    memory held by the pipeline: a slow consumer blocks the producer rather
+    than letting items pile up. Exceptions raised by the producer are raised
+    to the consumer.
+
+    Args:
+        iterable (iterable): The items to produce, for example the tables
+            yielded by `iter_dataframes` or `stream_dataframes`.
+        queue_size (int): The largest number of items waiting to be consumed.
+        stats (PipelineStats): Statistics to add the timings of the pipeline
+            to.
+
+    Yields:
+        The items of `iterable`, in order.
+    """
+
+    if stats is None:
+        stats = PipelineStats()
+    items = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+
+    def put(item):
+        start = time.perf_counter()
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        stats.producer_blocked_seconds += time.perf_counter() - start
+
+    def produce():
+        iterator = iter(iterable)
+        try:
+            while not stop.is_set():
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    break
+                finally:
+                    stats.produce_seconds += time.perf_counter() - start
+                put((item, None))
+        except Exception as e:
+            put((_DONE, e))
+            return
+        put((_DONE, None))
+
+    start = time.perf_counter()
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    try:
+        while True:
+            wait_start = time.perf_counter()
+            item, error = items.get()
+            stats.consumer_idle_seconds += time.perf_counter() - wait_start
+            if item is _DONE:
+                if error is not None:
+                    raise error
+                break
+            stats.items += 1
+            consume_start = time.perf_counter()
+            yield item
+            stats.consume_seconds += time.perf_counter() - consume_start
+    finally:
+        stop.set()
+        producer.join()
+        stats.wall_seconds += time.perf_counter() - start
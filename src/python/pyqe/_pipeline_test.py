@@ -0,0 +1,60 @@
+import unittest
+import threading
+import time
+from ._pipeline import PipelineStats, pipelined
+
+
+class TestPipeline(unittest.TestCase):
+    def test_pipelined(self):
+        stats = PipelineStats()
+        self.assertEqual(list(pipelined(range(10), 2, stats)), list(range(10)))
+        self.assertEqual(stats.items, 10)
+        self.assertGreaterEqual(stats.wall_seconds, 0)
+
+    def test_pipelined_overlap(self):
+        def produce():
+            for i in range(4):
+                time.sleep(0.05)
+                yield i
+
+        stats = PipelineStats()
+        for _ in pipelined(produce(), 2, stats):
+            time.sleep(0.05)
+        self.assertGreater(stats.overlap_seconds, 0.05)
+
+    def test_pipelined_backpressure(self):
+        produced = []
+
+        def produce():
+            for i in range(100):
+                produced.append(i)
+                yield i
+
+        items = pipelined(produce(), 2)
+        self.assertEqual(next(items), 0)
+        time.sleep(0.1)
+        # One item being consumed, two in the queue and one waiting to be put.
+        self.assertLessEqual(len(produced), 4)
+        items.close()
+
+    def test_pipelined_error(self):
+        def produce():
+            yield 1
+            raise ValueError("invalid workflow result")
+
+        items = pipelined(produce())
+        self.assertEqual(next(items), 1)
+        with self.assertRaises(ValueError):
+            next(items)
+
+    def test_pipelined_close(self):
+        threads = set(threading.enumerate())
+        items = pipelined(iter(range(100)), 1)
+        next(items)
+        items.close()
+        # The producer stops instead of blocking on the full queue.
+        self.assertEqual(set(threading.enumerate()) - threads, set())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,189 @@
+"""Instrumentation of the stages of the workflowresult conversion pipeline.
+
+Every stage (parsing, `get_super_dict`, flattening, dataframe construction
+and writing each table to a sink) is wrapped in `profile_stage`. When a
+callback is registered with `add_profile_callback`, each stage reports a
+record with its wall time, memory usage and, where relevant, the table it
+processed and its numbers of rows and columns. Without callbacks the stages
+cost next to nothing.
+"""
+
+import contextlib
+import json
+import sys
+import threading
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # Not available on Windows.
+    resource = None
+
+_callbacks = []
+# The running peak of traced memory of each open stage of each thread, see
+# `profile_stage`.
+_local = threading.local()
+
+
+def add_profile_callback(callback):
+    """Register a function to be called with the record of every stage of the
+    pipeline once the stage ends.
+
+    A record is a dict with the keys `stage` (the name of the stage),
+    `seconds` (its wall time), `depth` (its nesting depth within other
+    stages), `max_rss_mib` (the peak resident memory of the process so far),
+    `peak_traced_mib` (the peak traced memory during the stage, only if
+    tracemalloc is tracing) and stage specific details such as `table`,
+    `rows` and `columns`.
+
+    Args:
+        callback (callable): A function taking a record dict.
+    """
+
+    _callbacks.append(callback)
+
+
+def remove_profile_callback(callback):
+    """Unregister a function registered with `add_profile_callback`."""
+
+    _callbacks.remove(callback)
+
+
+def _max_rss_mib():
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in KiB elsewhere.
+    if sys.platform == "darwin":
+        return max_rss / 2 ** 20
+    return max_rss / 2 ** 10
+
+
+@contextlib.contextmanager
+def profile_stage(stage, **details):
+    """Measure a stage of the pipeline and report it to the registered
+    callbacks.
+
+    Args:
+        stage (str): The name of the stage.
+        **details: Details to add to the record, such as the table name.
+
+    Yields:
+        dict: The record of the stage, to which the stage can add details
+            such as its numbers of rows and columns.
+    """
+
+    record = {"stage": stage, **details}
+    if not _callbacks:
+        yield record
+        return
+
+    open_stages = _local.__dict__.setdefault("open_stages", [])
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        # The peak is reset for each stage, so fold the peak reached so far
+        # into the running peak of the enclosing stage first.
+        if open_stages:
+            peak = tracemalloc.get_traced_memory()[1]
+            open_stages[-1] = max(open_stages[-1], peak)
+        tracemalloc.reset_peak()
+    open_stages.append(0)
+    record["depth"] = len(open_stages) - 1
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record["seconds"] = time.perf_counter() - start
+        peak = open_stages.pop()
+        if tracing and tracemalloc.is_tracing():
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+            record["peak_traced_mib"] = peak / 2 ** 20
+            if open_stages:
+                open_stages[-1] = max(open_stages[-1], peak)
+        record["max_rss_mib"] = _max_rss_mib()
+        for callback in list(_callbacks):
+            callback(record)
+
+
+class Profiler:
+    """Collect the records of every stage of the pipeline while it is used as
+    a context manager.
+
+    Args:
+        trace_memory (bool): Trace memory allocations with tracemalloc to
+            record the peak memory of each stage. This slows the pipeline
+            down several times, so the wall times are only meaningful without
+            it.
+    """
+
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.records = []
+        self._started_tracing = False
+
+    def __call__(self, record):
+        self.records.append(record)
+
+    def __enter__(self):
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        add_profile_callback(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        remove_profile_callback(self)
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def summary(self):
+        """Summarize the records by stage.
+
+        Returns:
+            dict: For each stage, the number of times it ran, its total wall
+                time, and its largest traced memory peak, resident memory
+                and numbers of rows and columns.
+        """
+
+        summary = {}
+        for record in self.records:
+            stage = summary.setdefault(record["stage"], {"count": 0, "seconds": 0.0})
+            stage["count"] += 1
+            stage["seconds"] += record["seconds"]
+            for key in ("peak_traced_mib", "max_rss_mib", "rows", "columns"):
+                if record.get(key) is not None:
+                    stage[key] = max(stage.get(key) or 0, record[key])
+        return summary
+
+    def report(self):
+        """Get a JSON-serializable report with the summary and all records."""
+
+        return {"summary": self.summary(), "stages": self.records}
+
+    def print_report(self, file=None):
+        """Print the summary of the records as a table."""
+
+        file = file or sys.stdout
+        print(
+            f"{'stage':<24}{'count':>7}{'seconds':>10}{'traced MiB':>12}"
+            f"{'RSS MiB':>10}{'max rows':>11}{'max cols':>10}",
+            file=file,
+        )
+        for name, stage in self.summary().items():
+            traced = stage.get("peak_traced_mib")
+            rss = stage.get("max_rss_mib")
+            print(
+                f"{name:<24}{stage['count']:>7}{stage['seconds']:>10.3f}"
+                f"{'-' if traced is None else f'{traced:.1f}':>12}"
+                f"{'-' if rss is None else f'{rss:.1f}':>10}"
+                f"{stage.get('rows', '-'):>11}{stage.get('columns', '-'):>10}",
+                file=file,
+            )
+
+    def write_report(self, filepath):
+        """Write the report to a JSON file."""
+
+        with open(filepath, "w") as f:
+            json.dump(self.report(), f, indent=2)
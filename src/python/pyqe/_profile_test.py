@@ -0,0 +1,77 @@
+import unittest
+import io
+import json
+import os
+import tempfile
+from ._profile import (
+    Profiler,
+    add_profile_callback,
+    remove_profile_callback,
+    profile_stage,
+)
+from ._pyqe import extract_dataframes, export_to_csv
+
+
+class TestProfile(unittest.TestCase):
+    def setUp(self):
+        self.workflowresult = {
+            "step-1": {
+                "class": "class-A",
+                "id": "a",
+                "array": [[1, 2], [3, 4], [5, 6]],
+                "records": [{"x": 1}, {"x": 2}],
+            }
+        }
+
+    def test_profile_callback(self):
+        records = []
+        add_profile_callback(records.append)
+        try:
+            extract_dataframes(self.workflowresult)
+        finally:
+            remove_profile_callback(records.append)
+        extract_dataframes(self.workflowresult)
+
+        stages = [record["stage"] for record in records]
+        self.assertEqual(stages[0], "get_super_dict")
+        self.assertEqual(stages.count("flatten"), 3)
+        self.assertEqual(stages.count("dataframe"), 3)
+        built = {
+            record["table"]: (record["rows"], record["columns"])
+            for record in records
+            if record["stage"] == "dataframe"
+        }
+        self.assertEqual(built["array"], (6, 4))
+        self.assertEqual(built["records"], (2, 1))
+        self.assertTrue(all(record["seconds"] >= 0 for record in records))
+
+    def test_nested_stages(self):
+        with Profiler(trace_memory=True) as profiler:
+            with profile_stage("outer"):
+                with profile_stage("inner"):
+                    data = bytearray(4 * 2 ** 20)
+                del data
+        inner, outer = profiler.records
+        self.assertEqual((inner["depth"], outer["depth"]), (1, 0))
+        self.assertGreaterEqual(inner["peak_traced_mib"], 4)
+        self.assertGreaterEqual(outer["peak_traced_mib"], inner["peak_traced_mib"])
+
+    def test_profiler_report(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with Profiler() as profiler:
+                export_to_csv(self.workflowresult, directory)
+            summary = profiler.summary()
+            self.assertEqual(summary["write_csv"]["count"], 3)
+            self.assertEqual(summary["write_csv"]["rows"], 6)
+
+            output = io.StringIO()
+            profiler.print_report(output)
+            self.assertIn("write_csv", output.getvalue())
+            filepath = os.path.join(directory, "profile.json")
+            profiler.write_report(filepath)
+            with open(filepath) as f:
+                self.assertEqual(len(json.load(f)["stages"]), len(profiler.records))
+
+
+if __name__ == "__main__":
+    unittest.main()
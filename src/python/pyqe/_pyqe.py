@@ -1,89 +1,254 @@
 """Utilities for flattening Quantum Engine workflowresult objects."""
 
 from pandas.io.json import json_normalize
+import numpy as np
 import pandas as pd
-from flatten_json import flatten
-from sqlalchemy import create_engine, MetaData, Table
-from sqlalchemy.exc import ProgrammingError
+from openpyxl import Workbook, load_workbook
+from sqlalchemy import table as sql_table, column as sql_column
+from sqlalchemy.exc import DBAPIError
 import json
-from pyqe._sql import get_db_conn_str
+from pyqe._sql import (
+    get_engine,
+    get_schema_catalog,
+    get_sql_type,
+    get_add_columns_statements,
+    get_alter_column_types_statements,
+    get_widened_type,
+)
+from pyqe._io import iter_workflowresult_steps, load_workflowresult
+from pyqe._dtypes import optimize_dataframe, restore_dtypes
+from pyqe._ledger import SqlCheckpoint, SqlLedger, hash_file
+from pyqe._profile import profile_stage
+from pyqe._relations import RelationshipIndex, _get_parents
+from collections import deque
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import csv
+import io
+import itertools
 import os
+import time
 import re
+import threading
+import urllib.parse
+import uuid
 
+# The layouts of tables with too many columns, see `extract_dataframes`.
+WIDE_LAYOUTS = ("long", "sparse")
+# Appended to the name of a table whose rows are built in long form, so that
+# they are never merged with rows of the same table built in wide form.
+LONG_TABLE_SUFFIX = ".long"
 
-def extract_lists(item, dataset, path=None, index_buffer=(), parent_id=None):
-    """Recursively extract lists from a dict and add them to a separate dict.
+
+class _NumericBlock:
+    """The rows extracted from a rectangular numeric (nested) list, stored as
+    columns rather than as one dict per element."""
+
+    def __init__(self, columns, length):
+        self.columns = columns
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+
+def _numeric_block(item, index_buffer, parent_id):
+    """Build the `value`, `index_i` and `parentId` columns of a rectangular
+    numeric (nested) list with numpy, or return None if `item` is not one."""
+
+    try:
+        values = np.asarray(item)
+    except (ValueError, TypeError, OverflowError):
+        return None
+    if values.dtype.kind not in "iuf" or values.size == 0:
+        return None
+    # numpy casts booleans mixed with numbers to numbers, which the row-wise
+    # path keeps as they are.
+    if _has_bool(item):
+        return None
+
+    length = values.size
+    columns = {"value": values.ravel()}
+    for i, j in enumerate(index_buffer):
+        columns[f"index_{i}"] = np.full(length, j)
+    indices = np.indices(values.shape).reshape(values.ndim, -1)
+    for i, index in enumerate(indices, len(index_buffer)):
+        columns[f"index_{i}"] = index
+    columns["parentId"] = np.full(length, parent_id, dtype=object)
+    return _NumericBlock(columns, length)
+
+
+def _has_bool(item):
+    """Check whether a (nested) list has a boolean leaf."""
+
+    pending = [item]
+    while pending:
+        current = pending.pop()
+        for value in current:
+            if isinstance(value, list):
+                pending.append(value)
+            elif isinstance(value, bool):
+                return True
+    return False
+
+
+def extract_lists(
+    item, dataset, path=None, index_buffer=(), parent_id=None, numeric_blocks=False
+):
+    """Extract lists from a dict and add them to a separate dict.
+
+    The traversal uses an explicit stack, so arbitrarily deep items do not hit
+    the recursion limit, and `item` itself is left untouched.
 
     Args:
-        item (Object): The item to recursively extract lists from. 
+        item (Object): The item to extract lists from.
         dataset (dict): The dict to add list items to. Each type of list item
             will be appended to a separate key.
-        path (str): The path to `item` within the outermost dict. For use in
-            recursive calls.
+        path (str): The path to `item` within the outermost dict.
         index_buffer (tuple): If `item` was wrapped in one or more lists, the
-            indices of `item` in each list. For use in recursive calls.
+            indices of `item` in each list.
         parent_id (str): The value to assign to the `parentId` field of children
             if `item` is a (nested). Note that `parentId` will not be added if
             the children are dicts because DCS already assigns `parentId` to
             lists of dicts.
+        numeric_blocks (bool): If True, rectangular numeric (nested) lists are
+            added to `dataset` as a single columnar block instead of one dict
+            per element. Only `extract_dataframes` understands these blocks.
+
+    Returns:
+        dict: If `item` is a dict, a copy of it in which lists and output
+            artifacts (including those of nested dicts) have been removed
+            because they were extracted. Otherwise None.
     """
+
+    # Each frame is (items, path, parent_id, stripped, extra). For a dict,
+    # `stripped` is the copy being built and `extra` is its output artifact
+    # schema, if any. For a list, `stripped` is None and `extra` is a tuple of
+    # the index buffer, the index columns of its parents and the name of its
+    # own index column.
+    stack = []
+
+    def enter(value, value_path, value_index_buffer, value_parent_id, schema=None):
+        """Push a frame for a dict or list. Returns the copy of a dict, or
+        whether a frame was needed for a list."""
+
+        if isinstance(value, dict):
+            if value.get("id"):
+                value_parent_id = value["id"]
+            stripped = {}
+            # If the dict is an element in a list, it should be extracted into
+            # a table corresponding to its path.
+            if value_index_buffer:
+                dataset[value_path].append(stripped)
+            stack.append(
+                (iter(value.items()), value_path, value_parent_id, stripped, schema)
+            )
+            return stripped
+
+        if value_path not in dataset:
+            dataset[value_path] = []
+        if numeric_blocks:
+            block = _numeric_block(value, value_index_buffer, value_parent_id)
+            if block is not None:
+                dataset[value_path].append(block)
+                return False
+        index_columns = {f"index_{i}": j for i, j in enumerate(value_index_buffer)}
+        index_column = f"index_{len(value_index_buffer)}"
+        stack.append(
+            (
+                iter(enumerate(value)),
+                value_path,
+                value_parent_id,
+                None,
+                (value_index_buffer, index_columns, index_column),
+            )
+        )
+        return True
+
+    result = None
     if isinstance(item, dict):
-        if item.get("id"):
-            parent_id = item["id"]
-
-        # If the item is a dict that is an element in a list, it should be
-        # extracted into a table corresponding to its path.
-        if len(index_buffer) > 0:
-            dataset[path].append(item)
-
-        # Recursively extract lists from all of the item's values.
-        to_pop = []
-        for key in item:
-            schema = None
-            path_addition = key
-            if isinstance(item[key], dict) and item[key].get("schema"):
-                schema = item[key]["schema"]
-                path_addition = schema
-            if path:
-                new_path = path + "." + path_addition
-            else:
-                new_path = path_addition
-            extract_lists(item[key], dataset, new_path, (), parent_id)
-            if isinstance(item[key], list):
-                to_pop.append(key)
-            elif schema is not None:
-                if not dataset.get(schema):
-                    dataset[schema] = []
-                dataset[schema].append(item[key])
-                to_pop.append(key)
-
-        # Remove any keys whose values were lists or output artifacts because those
-        # have been extracted.
-        for key in to_pop:
-            item.pop(key)
-
-    # If the item is a list, recursively extract lists on each child.
+        result = enter(item, path, index_buffer, parent_id)
     elif isinstance(item, list):
-        if not dataset.get(path):
-            dataset[path] = []
-        for index, child in enumerate(item):
-            extract_lists(child, dataset, path, index_buffer + (index,), parent_id)
-
-    # If the item is neither a list nor a dict, but it an element in a list, it
-    # should be moved into a table given by its path.
-    elif len(index_buffer) > 0:
+        enter(item, path, index_buffer, parent_id)
+    elif index_buffer:
         item_as_dict = {"value": item}
         item_as_dict.update({f"index_{i}": j for i, j in enumerate(index_buffer)})
         item_as_dict["parentId"] = parent_id
         dataset[path].append(item_as_dict)
 
+    # Each pass resumes the frame on top of the stack, handling scalars in
+    # place until it reaches a child that needs a frame of its own.
+    while stack:
+        items, frame_path, frame_parent_id, stripped, extra = stack[-1]
 
-def get_class_dict(workflowresult):
+        if stripped is not None:
+            for key, value in items:
+                if isinstance(value, dict):
+                    schema = value.get("schema") or None
+                    path_addition = key if schema is None else schema
+                    if frame_path:
+                        new_path = frame_path + "." + path_addition
+                    else:
+                        new_path = path_addition
+                    child = enter(value, new_path, (), frame_parent_id, schema)
+                    if schema is None:
+                        stripped[key] = child
+                    break
+                elif isinstance(value, list):
+                    new_path = frame_path + "." + key if frame_path else key
+                    if enter(value, new_path, (), frame_parent_id):
+                        break
+                else:
+                    stripped[key] = value
+            else:
+                stack.pop()
+                # Output artifacts are extracted into a table named after
+                # their schema once their own lists have been extracted.
+                if extra is not None:
+                    dataset.setdefault(extra, []).append(stripped)
+
+        else:
+            frame_index_buffer, index_columns, index_column = extra
+            append = dataset[frame_path].append
+            for index, value in items:
+                if isinstance(value, list):
+                    if enter(
+                        value,
+                        frame_path,
+                        frame_index_buffer + (index,),
+                        frame_parent_id,
+                    ):
+                        break
+                elif isinstance(value, dict):
+                    # Dicts do not get index columns, so there is no need to
+                    # build their index buffer.
+                    enter(value, frame_path, True, frame_parent_id)
+                    break
+                else:
+                    # If the item is neither a list nor a dict, it should be
+                    # moved into a table given by its path.
+                    append(
+                        {
+                            "value": value,
+                            **index_columns,
+                            index_column: index,
+                            "parentId": frame_parent_id,
+                        }
+                    )
+            else:
+                stack.pop()
+
+    return result
+
+
+def get_class_dict(workflowresult, skip_steps=None):
     """Given a Quantum Engine workflowresult dict, group all steps according to
     their task class.
 
     Args:
         workflowresult (dict): A Quantum Engine workflowresult dict.
+        skip_steps (set): The keys of steps to leave out, such as the steps a
+            sink has already loaded, see `get_step_entries`.
     
     Returns:
         dict: A dict whose keys are the task classes, and values are lists of
@@ -93,6 +258,8 @@ def get_class_dict(workflowresult):
     class_dict = {}
 
     for step in workflowresult:
+        if skip_steps and step in skip_steps:
+            continue
         step_class = workflowresult[step]["class"]
         if not class_dict.get(step_class):
             class_dict[step_class] = []
@@ -100,12 +267,34 @@ def get_class_dict(workflowresult):
     return class_dict
 
 
-def get_super_dict(workflowresult):
+def get_step_entries(workflowresult, skip_steps=None):
+    """List the steps of a Quantum Engine workflowresult, to record them in the
+    checkpoint of a sink once they are loaded.
+
+    Args:
+        workflowresult (dict): A Quantum Engine workflowresult dict.
+        skip_steps (set): The keys of steps to leave out.
+
+    Returns:
+        list: (workflow id, step key, step id) tuples. Steps without a
+            `workflowId` are listed under "".
+    """
+
+    return [
+        (step.get("workflowId") or "", key, step.get("id"))
+        for key, step in workflowresult.items()
+        if not (skip_steps and key in skip_steps)
+    ]
+
+
+def get_super_dict(workflowresult, numeric_blocks=False, skip_steps=None):
     """
     Given a Quantum Engine workflowresult dict, flatten in into a "super" dict.
 
     Args:
         workflowresult (dict): A Quantum Engine workflowresult dict.
+        numeric_blocks (bool): See `extract_lists`.
+        skip_steps (set): See `get_class_dict`.
     
     Returns:
         dict: A dict that has a key for each task class that maps to a list of
@@ -119,51 +308,838 @@ def get_super_dict(workflowresult):
     # extracting lists from them one by one, this allows us to avoid this
     # problem.
 
-    super_dict = get_class_dict(workflowresult)
-    children = {}
-    for class_name in super_dict:
-        for step in super_dict[class_name]:
-            extract_lists(step, children)
-    super_dict.update(children)
+    with profile_stage("get_super_dict") as stage:
+        super_dict = get_class_dict(workflowresult, skip_steps)
+        children = {}
+        for class_name in super_dict:
+            super_dict[class_name] = [
+                extract_lists(step, children, numeric_blocks=numeric_blocks)
+                for step in super_dict[class_name]
+            ]
+        super_dict.update(children)
+        stage["tables"] = len(super_dict)
     return super_dict
 
 
-def extract_dataframes(workflowresult):
+def extract_dataframes(
+    workflowresult,
+    lazy=False,
+    optimize_dtypes=False,
+    relationship_index=False,
+    max_columns=None,
+    wide_layout="long",
+    skip_steps=None,
+):
     """
     Given a Quantum Engine workflowresult dict, flatten in into pandas
     dataframes.
 
     Args:
         workflowresult (dict): A Quantum Engine workflowresult dict.
+        lazy (bool): Return a `LazyTables` mapping that only builds each
+            dataframe when it is first accessed.
+        optimize_dtypes (bool): Convert the columns of each dataframe to
+            compact dtypes, see `optimize_dataframe`.
+        relationship_index (bool): Also return a `RelationshipIndex` of the
+            children of every row, built as each table is extracted. Cannot be
+            combined with `lazy`.
+        max_columns (int): The largest number of columns a table is flattened
+            into. Tables with more columns, such as steps with many distinct
+            nested keys, are built in `wide_layout` instead. Defaults to no
+            limit.
+        wide_layout (str): The layout of the tables with more than
+            `max_columns` columns: "long" for one row per value, with the `_id`
+            of its row, its column name in `key` and the value in one of the
+            `value_number`, `value_string` or `value_boolean` columns, or
+            "sparse" for sparse columns that only hold the values each row
+            has. Missing values are left out of both. Long tables are named
+            after their table with `LONG_TABLE_SUFFIX` appended. The long
+            layout cannot be combined with `lazy`, since the name of a table
+            is then only known once it is built.
+        skip_steps (set): The keys of steps to leave out, see
+            `get_class_dict`.
     
     Returns:
         dict: A dict that has a key for each task class that maps to a
             pandas.DataFrame object, and a key for each type of list element
-            that maps to a pandas.DataFrame object.
+            that maps to a pandas.DataFrame object. If `relationship_index` is
+            True, a (dict, RelationshipIndex) tuple.
     """
 
-    super_dict = get_super_dict(workflowresult)
+    if lazy and relationship_index:
+        raise ValueError("A relationship index cannot be built for lazy tables")
+    super_dict = get_super_dict(
+        workflowresult, numeric_blocks=True, skip_steps=skip_steps
+    )
+    if lazy:
+        return LazyTables(super_dict, optimize_dtypes, max_columns, wide_layout)
     dfs = {}
+    index = RelationshipIndex() if relationship_index else None
     for table_name in super_dict:
-        dict_flattened = list((flatten(item, ".") for item in super_dict[table_name]))
-
-        for item in dict_flattened:
-            to_pop = []
-            for key in item:
-                if isinstance(item[key], dict):
-                    if len(item[key]) == 0:
-                        to_pop.append(key)
-            for key in to_pop:
-                item.pop(key)
-        dfs[table_name] = pd.DataFrame(dict_flattened)
+        table_name, df = _build_table(
+            super_dict[table_name],
+            table_name=table_name,
+            optimize_dtypes=optimize_dtypes,
+            max_columns=max_columns,
+            wide_layout=wide_layout,
+        )
+        dfs[table_name] = df
+        if index is not None:
+            index.add_table(table_name, df)
+
+    if index is not None:
+        return dfs, index
+    return dfs
+
+
+def iter_dataframes(
+    workflowresult,
+    optimize_dtypes=False,
+    max_columns=None,
+    wide_layout="long",
+    skip_steps=None,
+):
+    """
+    Given a Quantum Engine workflowresult dict, flatten it into pandas
+    dataframes one table at a time, so that each table can be written out
+    while the next one is built.
+
+    Args:
+        workflowresult (dict): A Quantum Engine workflowresult dict.
+        optimize_dtypes (bool): See `extract_dataframes`.
+        max_columns (int): See `extract_dataframes`.
+        wide_layout (str): See `extract_dataframes`.
+        skip_steps (set): See `extract_dataframes`.
+
+    Yields:
+        tuple: A table name and its pandas.DataFrame, for every table of
+            `extract_dataframes`.
+    """
+
+    super_dict = get_super_dict(
+        workflowresult, numeric_blocks=True, skip_steps=skip_steps
+    )
+    for table_name in list(super_dict):
+        # Release the extracted rows of each table once it is built.
+        rows = super_dict.pop(table_name)
+        yield _build_table(
+            rows,
+            table_name=table_name,
+            optimize_dtypes=optimize_dtypes,
+            max_columns=max_columns,
+            wide_layout=wide_layout,
+        )
+
+
+class LazyTables(Mapping):
+    """A read-only mapping from table names to dataframes, as returned by
+    `extract_dataframes(workflowresult, lazy=True)`.
+
+    The rows of every table are extracted up front, so table names and row
+    counts are available right away, but a table is only flattened into a
+    pandas.DataFrame the first time it is accessed. The dataframe is then
+    cached and the extracted rows are released.
+
+    Args:
+        super_dict (dict): The extracted rows of each table, as returned by
+            `get_super_dict`.
+        optimize_dtypes (bool): See `extract_dataframes`.
+        max_columns (int): See `extract_dataframes`.
+        wide_layout (str): See `extract_dataframes`. Only the "sparse" layout
+            is supported with `max_columns`.
+    """
+
+    def __init__(
+        self, super_dict, optimize_dtypes=False, max_columns=None, wide_layout="long"
+    ):
+        if max_columns is not None and wide_layout == "long":
+            raise ValueError(
+                "Lazy tables cannot be built in long form, use the sparse layout"
+            )
+        self._rows = dict(super_dict)
+        self._optimize_dtypes = optimize_dtypes
+        self._max_columns = max_columns
+        self._wide_layout = wide_layout
+        self._dfs = {}
+        self._lock = threading.Lock()
+        self.row_counts = {
+            table_name: _count_rows(rows) for table_name, rows in super_dict.items()
+        }
+
+    def __getitem__(self, table_name):
+        df = self._dfs.get(table_name)
+        if df is not None:
+            return df
+        # Sinks may read the same tables from several threads. The rows are
+        # only released once the dataframe is cached, so a failed build can
+        # be retried.
+        with self._lock:
+            if table_name not in self._dfs:
+                self._dfs[table_name] = _build_dataframe(
+                    self._rows[table_name],
+                    table_name=table_name,
+                    optimize_dtypes=self._optimize_dtypes,
+                    max_columns=self._max_columns,
+                    wide_layout=self._wide_layout,
+                )
+                del self._rows[table_name]
+            return self._dfs[table_name]
+
+    def __iter__(self):
+        return iter(self.row_counts)
+
+    def __len__(self):
+        return len(self.row_counts)
+
+    def __contains__(self, table_name):
+        return table_name in self.row_counts
+
+    def is_loaded(self, table_name):
+        """Check whether the dataframe of a table has already been built."""
+
+        return table_name in self._dfs
+
+    def __repr__(self):
+        tables = ", ".join(
+            f"{table_name!r}: {count} rows"
+            for table_name, count in self.row_counts.items()
+        )
+        return f"LazyTables({{{tables}}})"
+
+
+def _build_dataframe(
+    rows,
+    start=0,
+    table_name=None,
+    optimize_dtypes=False,
+    max_columns=None,
+    wide_layout="long",
+):
+    """Flatten a list of extracted rows into a pandas.DataFrame indexed by
+    `_id`, see `_build_table`."""
+
+    return _build_table(
+        rows, start, table_name, optimize_dtypes, max_columns, wide_layout
+    )[1]
+
+
+def _build_table(
+    rows,
+    start=0,
+    table_name=None,
+    optimize_dtypes=False,
+    max_columns=None,
+    wide_layout="long",
+):
+    """Flatten a list of extracted rows into a pandas.DataFrame indexed by
+    `_id`.
+
+    Args:
+        rows (list): The rows of a single table, as found in the super dict.
+        start (int): The first index to use if the rows do not have an `id`.
+        table_name (str): The name of the table, used to profile its stages.
+        optimize_dtypes (bool): See `extract_dataframes`.
+        max_columns (int): See `extract_dataframes`.
+        wide_layout (str): See `extract_dataframes`.
+
+    Returns:
+        tuple: The name of the table, with `LONG_TABLE_SUFFIX` appended if it
+            was built in long form, and its pandas.DataFrame.
+    """
+
+    if wide_layout not in WIDE_LAYOUTS:
+        raise ValueError(f"Unknown layout {wide_layout!r} for wide tables")
+    if max_columns is not None and any(isinstance(row, _NumericBlock) for row in rows):
+        # Numeric (nested) lists only have a few index columns.
+        max_columns = None
+
+    with profile_stage("flatten", table=table_name) as stage:
+        # Numeric blocks already hold their columns, so only the dict rows
+        # between them need to be flattened.
+        parts = []
+        pending = []
+        for row in rows:
+            if isinstance(row, _NumericBlock):
+                if pending:
+                    parts.append(_flatten_rows(pending))
+                    pending = []
+                parts.append((row.columns, len(row)))
+            else:
+                pending.append(row)
+        if pending or not parts:
+            parts.append(_flatten_rows(pending, max_columns))
+        if parts[-1] is None:
+            parts = None
+        else:
+            stage["rows"] = sum(length for _, length in parts)
+
+    if parts is None:
+        with profile_stage("flatten_wide", table=table_name, layout=wide_layout) as stage:
+            df = _build_wide_dataframe(rows, start, wide_layout)
+            stage["rows"], stage["columns"] = df.shape
+        if wide_layout == "long":
+            table_name = f"{table_name}{LONG_TABLE_SUFFIX}"
+        if optimize_dtypes:
+            df = optimize_dataframe(df, table_name)
+        return table_name, df
+
+    with profile_stage("dataframe", table=table_name) as stage:
+        frames = [
+            pd.DataFrame(columns, index=pd.RangeIndex(length))
+            if length
+            else pd.DataFrame([])
+            for columns, length in parts
+        ]
+        if len(frames) == 1:
+            df = frames[0]
+        else:
+            df = pd.concat(frames, ignore_index=True)
+
         # Esthetic changes imitating MongoDB behaviour
-        if "id" in dfs[table_name].columns:
-            dfs[table_name].rename(columns={"id": "_id"}, inplace=True)
-            dfs[table_name].set_index("_id", inplace=True)
+        if "id" in df.columns:
+            df.rename(columns={"id": "_id"}, inplace=True)
+            df.set_index("_id", inplace=True)
         else:
-            dfs[table_name].index.name = "_id"
+            if start:
+                df.index = pd.RangeIndex(start, start + len(df.index))
+            df.index.name = "_id"
+        stage["rows"], stage["columns"] = df.shape
+    if optimize_dtypes:
+        df = optimize_dataframe(df, table_name)
+    return table_name, df
 
-    return dfs
+
+def _count_rows(rows):
+    """Count the rows of a table, as found in the super dict."""
+
+    return sum(len(row) if isinstance(row, _NumericBlock) else 1 for row in rows)
+
+
+def _flatten_rows(rows, max_columns=None):
+    """Flatten a list of row dicts into columns.
+
+    Nested dicts are flattened into columns named after their dot-separated
+    path, in a single pass that writes each value straight into its column.
+    Empty dicts are skipped, and rows that lack a column are filled with NaN.
+
+    Args:
+        rows (list): The row dicts.
+        max_columns (int): Give up once the rows have more columns than this,
+            before the columns are padded for every row.
+
+    Returns:
+        tuple: A dict of column lists, keyed by column name, and the number of
+            rows, or None if there are more than `max_columns` columns.
+    """
+
+    columns = {}
+    length = 0
+    for row in rows:
+        stack = [(None, iter(row.items()))]
+        while stack:
+            prefix, items = stack[-1]
+            for key, value in items:
+                if prefix:
+                    key = f"{prefix}.{key}"
+                if value and isinstance(value, (dict, list, tuple, set)):
+                    if isinstance(value, dict):
+                        stack.append((key, iter(value.items())))
+                    else:
+                        stack.append((key, iter(enumerate(value))))
+                    break
+                if isinstance(value, dict):
+                    continue
+                column = columns.get(key)
+                if column is None:
+                    if max_columns is not None and len(columns) >= max_columns:
+                        return None
+                    column = columns[key] = []
+                filled = len(column)
+                if filled > length:
+                    # A later value for the same flattened key replaces the
+                    # earlier one.
+                    column[length] = value
+                    continue
+                # Columns are only padded for the rows they were missing
+                # from once they are written to again.
+                if filled < length:
+                    column.extend([np.nan] * (length - filled))
+                column.append(value)
+            else:
+                stack.pop()
+        length += 1
+    for column in columns.values():
+        if len(column) < length:
+            column.extend([np.nan] * (length - len(column)))
+
+    return columns, length
+
+
+def _flatten_rows_sparse(rows):
+    """Flatten a list of row dicts like `_flatten_rows`, but only keep the
+    values each row has rather than padding every column.
+
+    Returns:
+        tuple: A list of the `id` of each row (NaN for rows without one), a
+            dict of (row positions, values) list tuples keyed by column name,
+            and the number of rows.
+    """
+
+    ids = []
+    columns = {}
+    for position, row in enumerate(rows):
+        flat = {}
+        stack = [(None, iter(row.items()))]
+        while stack:
+            prefix, items = stack[-1]
+            for key, value in items:
+                if prefix:
+                    key = f"{prefix}.{key}"
+                if value and isinstance(value, (dict, list, tuple, set)):
+                    if isinstance(value, dict):
+                        stack.append((key, iter(value.items())))
+                    else:
+                        stack.append((key, iter(enumerate(value))))
+                    break
+                if isinstance(value, dict):
+                    continue
+                # A later value for the same flattened key replaces the
+                # earlier one.
+                flat[key] = value
+            else:
+                stack.pop()
+        ids.append(flat.pop("id", np.nan))
+        for key, value in flat.items():
+            if value is None or value != value:
+                # Missing values, including NaN, are left out.
+                continue
+            column = columns.get(key)
+            if column is None:
+                column = columns[key] = ([], [])
+            column[0].append(position)
+            column[1].append(value)
+
+    return ids, columns, len(ids)
+
+
+def _build_wide_dataframe(rows, start, wide_layout):
+    """Build the dataframe of a table with too many columns to hold them all
+    for every row, see `extract_dataframes`.
+
+    Returns:
+        pandas.DataFrame: The table in long form, with a `key` column and
+            `value_number`, `value_string` and `value_boolean` columns, one row
+            per value; or with sparse columns.
+    """
+
+    ids, columns, length = _flatten_rows_sparse(rows)
+    if all(row_id != row_id for row_id in ids):
+        ids = np.arange(start, start + length)
+    else:
+        ids = np.asarray(ids, dtype=object)
+
+    if wide_layout == "sparse":
+        sparse_columns = {}
+        for key, (positions, values) in columns.items():
+            numeric = all(
+                isinstance(value, (int, float)) and not isinstance(value, bool)
+                for value in values
+            )
+            dense = np.full(length, np.nan, dtype=np.float64 if numeric else object)
+            dense[positions] = values
+            sparse_columns[key] = pd.arrays.SparseArray(dense, fill_value=np.nan)
+        df = pd.DataFrame(sparse_columns, index=pd.RangeIndex(length))
+        df.index = pd.Index(ids, name="_id")
+        return df
+
+    positions = []
+    keys = []
+    numbers = []
+    strings = []
+    booleans = []
+    for key, (key_positions, values) in columns.items():
+        positions.extend(key_positions)
+        keys.extend([key] * len(values))
+        for value in values:
+            if isinstance(value, bool):
+                numbers.append(np.nan)
+                strings.append(None)
+                booleans.append(value)
+            elif isinstance(value, (int, float)):
+                numbers.append(value)
+                strings.append(None)
+                booleans.append(None)
+            else:
+                numbers.append(np.nan)
+                strings.append(value)
+                booleans.append(None)
+    # Order the values by row, then by column.
+    order = np.argsort(np.asarray(positions, dtype=np.int64), kind="stable")
+    df = pd.DataFrame(
+        {
+            "key": np.asarray(keys, dtype=object)[order],
+            "value_number": np.asarray(numbers, dtype=np.float64)[order],
+            "value_string": np.asarray(strings, dtype=object)[order],
+            "value_boolean": np.asarray(booleans, dtype=object)[order],
+        },
+        index=pd.Index(
+            ids[np.asarray(positions, dtype=np.int64)[order]], name="_id"
+        ),
+    )
+    return df
+
+
+def stream_dataframes(
+    fp,
+    buffer_rows=10000,
+    optimize_dtypes=False,
+    max_columns=None,
+    wide_layout="long",
+    steps=None,
+):
+    """
+    Given a file containing a Quantum Engine workflowresult, flatten it into
+    pandas dataframes one step at a time.
+
+    Rows are buffered per table and emitted once a table's buffer holds
+    `buffer_rows` rows, so peak memory depends on the largest step rather than
+    the whole workflowresult.
+
+    Args:
+        fp (file): A text file object containing a workflowresult JSON object.
+        buffer_rows (int): The number of rows to buffer per table before
+            emitting a chunk.
+        optimize_dtypes (bool): See `extract_dataframes`.
+        max_columns (int): See `extract_dataframes`. Each chunk is checked on
+            its own, and the chunks built in long form are yielded as chunks
+            of the long table.
+        wide_layout (str): See `extract_dataframes`.
+        steps (list): If given, each step is appended to it as it is read, see
+            `get_step_entries`.
+
+    Yields:
+        tuple: A table name and a pandas.DataFrame holding the next chunk of
+            rows of that table. A table may be yielded several times.
+    """
+
+    buffers = {}
+    buffered = {}
+    emitted = {}
+    for key, step in iter_workflowresult_steps(fp):
+        if steps is not None:
+            steps.extend(get_step_entries({key: step}))
+        children = {}
+        step_tables = {
+            step["class"]: [extract_lists(step, children, numeric_blocks=True)]
+        }
+        step_tables.update(children)
+
+        for table_name, rows in step_tables.items():
+            buffers.setdefault(table_name, []).extend(rows)
+            buffered[table_name] = buffered.get(table_name, 0) + _count_rows(rows)
+            if buffered[table_name] >= buffer_rows:
+                start = emitted.get(table_name, 0)
+                emitted[table_name] = start + buffered.pop(table_name)
+                yield _build_table(
+                    buffers.pop(table_name),
+                    start,
+                    table_name,
+                    optimize_dtypes,
+                    max_columns,
+                    wide_layout,
+                )
+
+    for table_name, buffer in buffers.items():
+        # Tables that were only ever empty are still emitted, mirroring
+        # extract_dataframes.
+        if buffer or table_name not in emitted:
+            yield _build_table(
+                buffer,
+                emitted.get(table_name, 0),
+                table_name,
+                optimize_dtypes,
+                max_columns,
+                wide_layout,
+            )
+
+
+def extract_dataframes_from_file(
+    path,
+    optimize_dtypes=False,
+    cache=None,
+    digest=None,
+    max_columns=None,
+    wide_layout="long",
+    steps=None,
+):
+    """
+    Given a Quantum Engine workflowresult JSON file, flatten it into pandas
+    dataframes, reusing the tables cached for the same content.
+
+    Args:
+        path (str): The path of the workflowresult file, see
+            `load_workflowresult`.
+        optimize_dtypes (bool): See `extract_dataframes`.
+        cache (ExtractionCache): The cache to read the tables from, or to add
+            them to if the file is not cached yet. Defaults to no cache.
+        digest (str): The hash of the file content if already known, see
+            `hash_file`.
+        max_columns (int): See `extract_dataframes`.
+        wide_layout (str): See `extract_dataframes`.
+        steps (list): If given, the steps of the file are appended to it, see
+            `get_step_entries`. They are cached along with the tables.
+
+    Returns:
+        dict: A pandas.DataFrame for each table, like `extract_dataframes`.
+    """
+
+    return dict(
+        iter_dataframes_from_file(
+            path, optimize_dtypes, cache, digest, max_columns, wide_layout, steps
+        )
+    )
+
+
+def iter_dataframes_from_file(
+    path,
+    optimize_dtypes=False,
+    cache=None,
+    digest=None,
+    max_columns=None,
+    wide_layout="long",
+    steps=None,
+):
+    """
+    Given a Quantum Engine workflowresult JSON file, flatten it into pandas
+    dataframes one table at a time, like `iter_dataframes`. Tables cached for
+    the same content are read back instead of parsing the file, and tables
+    that are not cached yet are cached as they are built.
+
+    Args:
+        path (str): See `extract_dataframes_from_file`.
+        optimize_dtypes (bool): See `extract_dataframes`.
+        cache (ExtractionCache): See `extract_dataframes_from_file`.
+        digest (str): See `extract_dataframes_from_file`.
+        max_columns (int): See `extract_dataframes`.
+        wide_layout (str): See `extract_dataframes`.
+        steps (list): See `extract_dataframes_from_file`. The steps are
+            appended before the first table is yielded.
+
+    Yields:
+        tuple: A table name and its pandas.DataFrame.
+    """
+
+    def extract(file_steps):
+        workflowresult = _load_file(path)
+        file_steps.extend(get_step_entries(workflowresult))
+        return iter_dataframes(
+            workflowresult, max_columns=max_columns, wide_layout=wide_layout
+        )
+
+    if steps is None:
+        steps = []
+    if cache is None:
+        tables = extract(steps)
+    else:
+        variant = None
+        if max_columns is not None:
+            variant = f"{wide_layout}-{max_columns}"
+        key = cache.key(digest or hash_file(path), variant)
+        cached = cache.get(key)
+        info = cache.get_info(key) if cached is not None else None
+        if info is not None and "steps" in info:
+            steps.extend(tuple(entry) for entry in info["steps"])
+            tables = cached.items()
+        else:
+            file_steps = []
+            tables = cache.write_through(
+                key, extract(file_steps), {"steps": file_steps}
+            )
+            steps.extend(file_steps)
+    # Tables are cached before their dtypes are optimized, so that the same
+    # entry serves both.
+    for table_name, df in tables:
+        if optimize_dtypes:
+            df = optimize_dataframe(df, table_name)
+        yield table_name, df
+
+
+def _load_file(path):
+    with profile_stage("json_load", file=path):
+        return load_workflowresult(path)
+
+
+def _extract_file_steps(path, **options):
+    """Flatten a workflowresult file in a worker process, returning its
+    dataframes along with its steps."""
+
+    steps = []
+    dfs = extract_dataframes_from_file(path, steps=steps, **options)
+    return dfs, steps
+
+
+def extract_dataframes_from_files(
+    paths,
+    workers=None,
+    optimize_dtypes=False,
+    cache=None,
+    max_columns=None,
+    wide_layout="long",
+    steps=None,
+):
+    """
+    Given many Quantum Engine workflowresult JSON files, flatten them into
+    pandas dataframes in parallel and merge the dataframes of each table.
+
+    Args:
+        paths (list): The paths of the workflowresult files.
+        workers (int): The number of worker processes. Defaults to the number
+            of CPUs.
+        optimize_dtypes (bool): Convert the columns of each merged dataframe
+            to compact dtypes, see `optimize_dataframe`.
+        cache (ExtractionCache): The cache to read the tables of each file
+            from, or to add them to. Defaults to no cache.
+        max_columns (int): See `extract_dataframes`. Each file is checked on
+            its own.
+        wide_layout (str): See `extract_dataframes`.
+        steps (dict): If given, the steps of each file that was processed are
+            added to it, keyed by path in the order of `paths`, see
+            `get_step_entries`.
+
+    Returns:
+        tuple: A dict with a merged pandas.DataFrame for each table, like
+            `extract_dataframes`, and a list of the paths that could not be
+            processed.
+    """
+
+    start = time.perf_counter()
+    results = {}
+    file_steps = {}
+    failed = []
+    with profile_stage("extract_files", files=len(paths)):
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(
+                    _extract_file_steps,
+                    path,
+                    cache=cache,
+                    max_columns=max_columns,
+                    wide_layout=wide_layout,
+                ): path
+                for path in paths
+            }
+            for done, future in enumerate(as_completed(futures), 1):
+                path = futures[future]
+                try:
+                    results[path], file_steps[path] = future.result()
+                except Exception as e:
+                    failed.append(path)
+                    print(f"[{done}/{len(paths)}] Failed to process {path}: {e}")
+                    continue
+                print(
+                    f"[{done}/{len(paths)}] Extracted {len(results[path])} tables "
+                    f"from {path}"
+                )
+
+    # Merge in the order the files were given, regardless of which finished
+    # first.
+    tables = {}
+    for path in paths:
+        for table_name, df in results.pop(path, {}).items():
+            tables.setdefault(table_name, []).append(df)
+        if steps is not None and path in file_steps:
+            steps[path] = file_steps[path]
+    dfs = {
+        table_name: pd.concat(frames, sort=False) if len(frames) > 1 else frames[0]
+        for table_name, frames in tables.items()
+    }
+    if optimize_dtypes:
+        dfs = {
+            table_name: optimize_dataframe(df, table_name)
+            for table_name, df in dfs.items()
+        }
+    rows = sum(len(df.index) for df in dfs.values())
+    print(
+        f"Extracted {rows} rows in {len(dfs)} tables from "
+        f"{len(paths) - len(failed)} of {len(paths)} files "
+        f"in {time.perf_counter() - start:.2f}s"
+    )
+    return dfs, failed
+
+
+def iter_dataframes_from_files(
+    paths,
+    workers=None,
+    max_pending=None,
+    optimize_dtypes=False,
+    cache=None,
+    max_columns=None,
+    wide_layout="long",
+    steps=None,
+):
+    """
+    Given many Quantum Engine workflowresult JSON files, flatten them into
+    pandas dataframes in worker processes and yield the dataframes of each
+    file in the order the files were given, so that each file can be written
+    out while the next ones are flattened.
+
+    Args:
+        paths (list): The paths of the workflowresult files.
+        workers (int): The number of worker processes. Defaults to the number
+            of CPUs.
+        max_pending (int): The largest number of files being flattened or
+            waiting to be consumed at a time, which bounds memory usage.
+            Defaults to twice the number of workers.
+        optimize_dtypes (bool): Convert the columns of each dataframe to
+            compact dtypes, see `optimize_dataframe`.
+        cache (ExtractionCache): See `extract_dataframes_from_files`.
+        max_columns (int): See `extract_dataframes_from_files`.
+        wide_layout (str): See `extract_dataframes`.
+        steps (dict): See `extract_dataframes_from_files`. The steps of a file
+            are added before its dataframes are yielded.
+
+    Yields:
+        tuple: The path of a file and a dict of its dataframes, like
+            `extract_dataframes`, or None if the file could not be processed.
+    """
+
+    workers = workers or os.cpu_count() or 1
+    max_pending = max_pending or 2 * workers
+    options = {"cache": cache, "max_columns": max_columns, "wide_layout": wide_layout}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        remaining = iter(paths)
+        for path in itertools.islice(remaining, max_pending):
+            pending.append(
+                (path, executor.submit(_extract_file_steps, path, **options))
+            )
+        try:
+            while pending:
+                path, future = pending.popleft()
+                try:
+                    dfs, file_steps = future.result()
+                    if steps is not None:
+                        steps[path] = file_steps
+                except Exception as e:
+                    print(f"Failed to process {path}: {e}")
+                    dfs = None
+                if dfs is not None and optimize_dtypes:
+                    dfs = {
+                        table_name: optimize_dataframe(df, table_name)
+                        for table_name, df in dfs.items()
+                    }
+                for next_path in itertools.islice(remaining, 1):
+                    pending.append(
+                        (
+                            next_path,
+                            executor.submit(_extract_file_steps, next_path, **options),
+                        )
+                    )
+                yield path, dfs
+        finally:
+            # Do not wait for files nobody will consume.
+            for _, future in pending:
+                future.cancel()
 
 
 def _compress_name(original_name: str, length: int) -> str:
@@ -189,166 +1165,820 @@ def _compress_name(original_name: str, length: int) -> str:
 
     return compressed_name
 
-def export_to_csv(workflowresult):
+
+def get_sql_table_name(table_name):
+    """Get the name of the SQL table a table is uploaded to, compressed to fit
+    PostgreSQL's limit of 63 characters.
+
+    Args:
+        table_name (str): The name of the table, as returned by
+            `extract_dataframes`.
+
+    Returns:
+        str: The name of the SQL table.
+    """
+
+    max_len_postgres = 63
+    return _compress_name(table_name, max_len_postgres)
+
+CSV_MANIFEST_FILE = ".pyqe_manifest.json"
+
+
+def export_to_csv(workflowresult, directory="./csv_data"):
     """Given a Quantum Engine workflowresult dict, unflatten it and 
-    write to csv files, using one file per table.
+    append it to csv files, using one file per table.
                       
     Args:
         workflowresult (dict): A Quantum Engine workflowresult dict.
+        directory (str): The directory holding the csv files.
     """
 
-    dfs = extract_dataframes(workflowresult)
-    if not os.path.isdir("./csv_data"):
-        os.mkdir("./csv_data")
+    export_dataframes_to_csv(extract_dataframes(workflowresult), directory)
+
+
+def export_dataframes_to_csv(dfs, directory="./csv_data"):
+    """Append dataframes to csv files, using one file per table.
+
+    Args:
+        dfs (dict): The dataframes to export, keyed by table name, as returned
+            by `extract_dataframes`.
+        directory (str): The directory holding the csv files.
+    """
+
+    manifest = _load_csv_manifest(directory)
     for table_name in dfs:
-        filepath = "./csv_data/" + table_name + ".csv"
-        if os.path.isfile(filepath):
-            old_df = pd.read_csv(filepath)
-            old_df.set_index("_id", inplace=True)
-            df_to_write = old_df.append(dfs[table_name], ignore_index=False)
-        else:
-            df_to_write = dfs[table_name]
+        filepath = _append_to_csv(dfs[table_name], table_name, directory, manifest)
+        print(f"Updated {filepath}")
+    _save_csv_manifest(directory, manifest)
+
+
+def _load_csv_manifest(directory):
+    """Load the manifest recording the columns of each csv file in a
+    directory, creating the directory if needed."""
+
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    path = os.path.join(directory, CSV_MANIFEST_FILE)
+    if os.path.isfile(path):
+        with open(path) as f:
+            return json.load(f)
+    return {}
+
+
+def _save_csv_manifest(directory, manifest):
+    with open(os.path.join(directory, CSV_MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+
+def _append_to_csv(df, table_name, directory, manifest):
+    """Append a dataframe to the csv file of a table, writing only the new
+    rows. The file is rewritten only when the dataframe adds columns to it.
+
+    Args:
+        df (pandas.DataFrame): The rows to append.
+        table_name (str): The name of the table.
+        directory (str): The directory holding the csv files.
+        manifest (dict): The columns of each table's csv file, which is
+            updated in place.
+
+    Returns:
+        str: The path of the csv file.
+    """
+
+    with profile_stage(
+        "write_csv", table=table_name, rows=len(df.index), columns=len(df.columns)
+    ):
+        filepath = os.path.join(directory, table_name + ".csv")
+        # float32 columns would be written with fewer digits.
+        rows = restore_dtypes(df).reset_index()
+        if not os.path.isfile(filepath):
+            rows.to_csv(filepath, index=False)
+            manifest[table_name] = list(rows.columns)
+            return filepath
+
+        header = manifest.get(table_name)
+        if header is None:
+            # Files written before the manifest existed
+            header = _read_csv_header(filepath)
+
+        new_columns = [col for col in rows.columns if col not in header]
+        if new_columns:
+            # The manifest is stale if a previous export stopped between
+            # rewriting the file and saving it, so the file has the last word.
+            header = _read_csv_header(filepath)
+            new_header = header + [col for col in rows.columns if col not in header]
+            if new_header != header:
+                _rewrite_csv_header(filepath, header, new_header)
+                header = new_header
+            manifest[table_name] = header
+            _save_csv_manifest(directory, manifest)
+
+        rows.reindex(columns=header).to_csv(filepath, mode="a", header=False, index=False)
+        manifest[table_name] = header
+        return filepath
+
+
+def _read_csv_header(filepath):
+    with open(filepath, newline="") as f:
+        return next(csv.reader(f), [])
+
+
+def _rewrite_csv_header(filepath, old_header, new_header):
+    """Rewrite a csv file row by row with a wider header, leaving the new
+    columns empty for the existing rows."""
+
+    padding = [""] * (len(new_header) - len(old_header))
+    tmp_filepath = filepath + ".tmp"
+    with open(filepath, newline="") as src, open(tmp_filepath, "w", newline="") as dst:
+        reader = csv.reader(src)
+        writer = csv.writer(dst)
+        next(reader, None)
+        writer.writerow(new_header)
+        for row in reader:
+            writer.writerow(row + padding)
+    os.replace(tmp_filepath, filepath)
+
+
+def stream_workflowresult_to_csv(fp, buffer_rows=10000, directory="./csv_data"):
+    """Given a file containing a Quantum Engine workflowresult, unflatten it
+    step by step and append the results to csv files, using one file per table.
+
+    Args:
+        fp (file): A text file object containing a workflowresult JSON object.
+        buffer_rows (int): The number of rows to buffer per table before
+            writing them out.
+        directory (str): The directory holding the csv files.
+    """
+
+    export_chunks_to_csv(stream_dataframes(fp, buffer_rows), directory)
+
+
+def export_chunks_to_csv(chunks, directory="./csv_data"):
+    """Append chunks of tables to csv files as they are produced, using one
+    file per table.
 
-        df_to_write.to_csv(filepath, index=True)
-        print(f"Updated {filepath}")    
+    Args:
+        chunks (iterable): (table name, pandas.DataFrame) tuples, as yielded
+            by `stream_dataframes` or `iter_dataframes`. A table may appear
+            several times.
+        directory (str): The directory holding the csv files.
+    """
+
+    manifest = _load_csv_manifest(directory)
+    updated = []
+    for table_name, df in chunks:
+        filepath = _append_to_csv(df, table_name, directory, manifest)
+        if filepath not in updated:
+            updated.append(filepath)
+    _save_csv_manifest(directory, manifest)
+    for filepath in updated:
+        print(f"Updated {filepath}")
+
+
+EXCEL_MAX_ROWS = 1048576
 
-def export_to_xlsx(workflowresult: dict):
+
+def export_to_xlsx(workflowresult: dict, filepath="./excel_data.xlsx"):
     """Given a Quantum Engine workflowresult dict, unflatten it and 
     write or append results to an Excel file, using one worksheet per table.
+
+    Rows are streamed through a write-only workbook. Sheets of tables that are
+    not in the workflowresult are copied over cell by cell, and tables that
+    outgrow Excel's row limit continue in additional sheets.
                       
     Args:
         workflowresult (dict): A Quantum Engine workflowresult dict.
+        filepath (str): The path of the Excel file.
     """
 
-    dfs = extract_dataframes(workflowresult)
+    export_dataframes_to_xlsx(extract_dataframes(workflowresult), filepath)
+
+
+def export_dataframes_to_xlsx(dfs, filepath="./excel_data.xlsx"):
+    """Write or append dataframes to an Excel file, using one worksheet per
+    table. See `export_to_xlsx`.
+
+    Args:
+        dfs (dict): The dataframes to export, keyed by table name, as returned
+            by `extract_dataframes`.
+        filepath (str): The path of the Excel file.
+    """
+
+    if os.path.isfile(filepath):
+        old_workbook = load_workbook(filepath, read_only=True)
+        existing_sheets = old_workbook.sheetnames
+    else:
+        old_workbook = None
+        existing_sheets = []
+
+    # Find the sheets already holding each table, in order.
+    table_sheets = {}
+    for table_name in dfs:
+        sheets = []
+        while _excel_sheet_name(table_name, len(sheets)) in existing_sheets:
+            sheets.append(_excel_sheet_name(table_name, len(sheets)))
+        table_sheets[table_name] = sheets
+    first_sheets = {
+        sheets[0]: table_name for table_name, sheets in table_sheets.items() if sheets
+    }
+    table_sheet_names = {name for sheets in table_sheets.values() for name in sheets}
+
+    workbook = Workbook(write_only=True)
+    for sheet_name in existing_sheets:
+        if sheet_name in first_sheets:
+            table_name = first_sheets[sheet_name]
+            _write_excel_table(
+                workbook,
+                table_name,
+                dfs[table_name],
+                [old_workbook[name] for name in table_sheets[table_name]],
+            )
+        elif sheet_name not in table_sheet_names:
+            new_sheet = workbook.create_sheet(sheet_name)
+            for row in old_workbook[sheet_name].iter_rows(values_only=True):
+                new_sheet.append(row)
+    for table_name in dfs:
+        if not table_sheets[table_name]:
+            _write_excel_table(workbook, table_name, dfs[table_name], [])
+
+    tmp_filepath = filepath + ".tmp"
+    with profile_stage("save_xlsx"):
+        workbook.save(tmp_filepath)
+    if old_workbook is not None:
+        old_workbook.close()
+    os.replace(tmp_filepath, filepath)
+    print(f"Updated {filepath}")
+
+
+def _excel_sheet_name(table_name, part):
+    """Get the name of the sheet holding a part of a table. The first part is
+    named after the table, and continuation sheets get a `~<n>` suffix."""
 
     max_len_excel = 31
-    filepath = "./excel_data.xlsx"
-    with pd.ExcelWriter(filepath) as writer:
-        if os.path.isfile(filepath):
-            excel_file = pd.ExcelFile(filepath)
-        else:
-            excel_file = None
-        for table_name in dfs:
-            if (
-                excel_file is not None
-                and _compress_name(table_name, max_len_excel)
-                in excel_file.sheet_names
-            ):
-                old_df = excel_file.parse(_compress_name(table_name, max_len_excel))
-                old_df.set_index("_id", inplace=True)
-                df_to_write = old_df.append(dfs[table_name], ignore_index=False)
-            else:
-                df_to_write = dfs[table_name]
+    if part == 0:
+        return _compress_name(table_name, max_len_excel)
+    suffix = f"~{part + 1}"
+    return _compress_name(table_name, max_len_excel - len(suffix)) + suffix
 
-            # Excel only allows up to about a million rows...
-            if len(df_to_write.index) > 1048576:
-                print(
-                    "Table {} has more than 1048576 rows and cannot be written to Excel worksheet: it has been dropped.".format(
-                        table_name
+
+def _write_excel_table(workbook, table_name, df, old_sheets):
+    """Write the existing rows of a table followed by the rows of a dataframe
+    to a write-only workbook, starting a continuation sheet whenever a sheet
+    is full."""
+
+    with profile_stage(
+        "write_xlsx", table=table_name, rows=len(df.index), columns=len(df.columns)
+    ):
+        header = []
+        old_rows = []
+        for old_sheet in old_sheets:
+            # Every part of a table starts with the same header row.
+            sheet_rows = old_sheet.iter_rows(values_only=True)
+            sheet_header = next(sheet_rows, ())
+            if not header:
+                header = list(sheet_header)
+            old_rows.append(sheet_rows)
+        rows = restore_dtypes(df).reset_index()
+        header += [col for col in rows.columns if col not in header]
+        rows = rows.reindex(columns=header).astype(object)
+        rows = rows.where(rows.notna(), None)
+
+        sheet = None
+        part = 0
+        sheet_rows = EXCEL_MAX_ROWS
+        for row in itertools.chain(*old_rows, rows.itertuples(index=False, name=None)):
+            if sheet_rows == EXCEL_MAX_ROWS:
+                sheet = workbook.create_sheet(_excel_sheet_name(table_name, part))
+                if part > 0:
+                    print(
+                        "Table {} has more than {} rows: continuing in worksheet {}.".format(
+                            table_name, EXCEL_MAX_ROWS - 1, sheet.title
+                        )
                     )
+                sheet.append(header)
+                sheet_rows = 1
+                part += 1
+            # Existing rows may be shorter than a header that gained columns.
+            sheet.append(tuple(row) + (None,) * (len(header) - len(row)))
+            sheet_rows += 1
+        if sheet is None:
+            workbook.create_sheet(_excel_sheet_name(table_name, 0)).append(header)
+
+
+PARQUET_DEFAULT_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+
+
+def export_to_parquet(workflowresult, directory="./parquet_data"):
+    """Given a Quantum Engine workflowresult dict, unflatten it and add it to
+    Parquet datasets, using one dataset per table partitioned by workflowId.
+
+    Args:
+        workflowresult (dict): A Quantum Engine workflowresult dict.
+        directory (str): The directory holding the datasets.
+    """
+
+    export_dataframes_to_parquet(extract_dataframes(workflowresult), directory)
+
+
+def export_dataframes_to_parquet(dfs, directory="./parquet_data"):
+    """Add dataframes to Parquet datasets, using one dataset per table.
+
+    Each table is written to `<directory>/<table>/workflowId=<id>/` as a new
+    part file, so adding a workflow never rewrites existing data. Rows without
+    a `workflowId`, such as arrays and lists of dicts, are partitioned under
+    the workflow of the row their `parentId` or `taskId` points to, and rows
+    whose workflow cannot be found under `PARQUET_DEFAULT_PARTITION`. String
+    columns are dictionary encoded.
+
+    Args:
+        dfs (dict): The dataframes to export, keyed by table name, as returned
+            by `extract_dataframes`.
+        directory (str): The directory holding the datasets.
+    """
+
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError(
+            "Exporting to Parquet requires pyarrow, "
+            "install it with `pip install pyqe[parquet]`."
+        )
+
+    workflow_ids = _get_workflow_ids(dfs)
+    for table_name, df in dfs.items():
+        with profile_stage(
+            "write_parquet",
+            table=table_name,
+            rows=len(df.index),
+            columns=len(df.columns),
+        ):
+            # Categoricals are stored as plain strings, dictionary encoded
+            # like the other string columns, and numeric columns as 64 bits,
+            # so that every part of a dataset has the same schema.
+            frame = restore_dtypes(df, categoricals=True).reset_index()
+            frame["workflowId"] = workflow_ids[table_name]
+            frame["workflowId"] = frame["workflowId"].fillna(PARQUET_DEFAULT_PARTITION)
+            partitions = frame.groupby("workflowId", sort=False)
+
+            for workflow_id, partition in partitions:
+                partition_dir = os.path.join(
+                    directory,
+                    table_name,
+                    "workflowId=" + urllib.parse.quote(str(workflow_id), safe=""),
                 )
-            else:
-                df_to_write.to_excel(
-                    writer,
-                    sheet_name=_compress_name(table_name, max_len_excel),
-                    index=True,
+                os.makedirs(partition_dir, exist_ok=True)
+                partition = partition.drop(columns="workflowId", errors="ignore")
+                # Arrow needs a single type per column, so columns mixing types
+                # are stored as strings.
+                for col in partition.columns:
+                    values = partition[col]
+                    if pd.api.types.infer_dtype(values, skipna=True).startswith("mixed"):
+                        partition[col] = values.astype(str).where(values.notna(), None)
+                table = pa.Table.from_pandas(partition, preserve_index=False)
+                string_columns = [
+                    field.name
+                    for field in table.schema
+                    if pa.types.is_string(field.type)
+                ]
+                pq.write_table(
+                    table,
+                    os.path.join(partition_dir, f"part-{uuid.uuid4().hex}.parquet"),
+                    use_dictionary=string_columns,
                 )
-        # Loop over sheets that are not in the current json
-        # if an excel file already exists
-        # Ensures they are also written to the new Excel file
-        compressed_table_names = [
-            _compress_name(x, max_len_excel) for x in dfs.keys()
-        ]
-        if excel_file:
-            for sheet_name in excel_file.sheet_names:
-                if sheet_name not in compressed_table_names:
-                    transferred_df = excel_file.parse(sheet_name)
-                    transferred_df.set_index("_id", inplace=True)
-                    transferred_df.to_excel(writer, sheet_name=sheet_name, index=True)
+        print(f"Updated {os.path.join(directory, table_name)}")
 
-        print(f"Updated {filepath}")
 
-def send_workflowresult_to_sql(workflowresult: dict):
+def _get_workflow_ids(dfs):
+    """Get the `workflowId` of the rows of each table, following `parentId`
+    and `taskId` up to a row with one for the rows that have none.
+
+    Returns:
+        dict: An object array of workflow ids, None where none was found,
+            aligned with the rows of each table.
+    """
+
+    def as_objects(values):
+        if isinstance(values.dtype, pd.SparseDtype):
+            values = values.sparse.to_dense()
+        # The frames belong to the caller, and may be read by other sinks.
+        values = values.to_numpy(dtype=object, copy=True)
+        values[pd.isna(values)] = None
+        return values
+
+    workflow_ids = {}
+    for table_name, df in dfs.items():
+        if "workflowId" in df.columns:
+            workflow_ids[table_name] = as_objects(df["workflowId"])
+        else:
+            workflow_ids[table_name] = np.full(len(df.index), None, dtype=object)
+    parents = {}
+    for table_name, df in dfs.items():
+        table_parents = _get_parents(df)
+        if table_parents is not None:
+            parents[table_name] = as_objects(table_parents)
+
+    # Each pass resolves the rows one level further from the steps, so this
+    # stops after as many passes as the tables are nested.
+    resolved = -1
+    while True:
+        owners = {}
+        for table_name, df in dfs.items():
+            if isinstance(df.index, pd.RangeIndex):
+                continue
+            ids = workflow_ids[table_name]
+            known = pd.notna(ids) & df.index.notna()
+            owners.update(zip(df.index[known].tolist(), ids[known].tolist()))
+        if len(owners) == resolved:
+            return workflow_ids
+        resolved = len(owners)
+        for table_name, table_parents in parents.items():
+            ids = workflow_ids[table_name]
+            missing = pd.isna(ids)
+            if missing.any():
+                ids[missing] = as_objects(
+                    pd.Series(table_parents[missing], dtype=object).map(owners)
+                )
+
+
+def send_workflowresult_to_sql(
+    workflowresult: dict, method="copy", engine=None, ledger_entries=None
+):
     """Given a Quantum Engine workflowresult dict, flatten it and upload to a
     SQL database.
 
+    Missing columns are added to existing tables before any data is uploaded,
+    and all tables are loaded in a single transaction, so a failure leaves
+    none of the workflowresult behind.
+
     Args:
         workflowresult (dict): A Quantum Engine workflowresult dict.
+        method (str): "copy" to bulk load tables, or "insert" to use plain
+            INSERT statements. Bulk loading uses `COPY FROM STDIN` on
+            PostgreSQL (with psycopg2), a single prepared statement executed
+            for all rows on SQLite, and a scan of the registered dataframe on
+            DuckDB. Other databases always use INSERT statements.
+        engine (sqlalchemy.engine.Engine): The engine to upload with. Defaults
+            to one for the configured SQL connection.
+        ledger_entries (list): (hash, source path) tuples to record in the
+            `pyqe_ledger` table in the same transaction as the upload. See
+            `SqlLedger`.
     """
-    max_len_postgres = 63
+    send_dataframes_to_sql(
+        extract_dataframes(workflowresult), method, engine, ledger_entries
+    )
 
-    dfs = extract_dataframes(workflowresult)
 
-    engine = create_engine(get_db_conn_str())
-    for table_name in dfs:
-        try:
-            dfs[table_name].to_sql(
-                _compress_name(table_name, max_len_postgres),
-                con=engine,
-                if_exists="append",
-            )
-        except ProgrammingError as e:
-            if "UndefinedColumn" in e.args[0]:
-                # Since several columns may be missing, we iterate through all of them.
-                md = MetaData()
-                table = Table(
-                    _compress_name(table_name, max_len_postgres),
-                    md,
-                    autoload=True,
-                    autoload_with=engine,
+def send_dataframes_to_sql(
+    dfs, method="copy", engine=None, ledger_entries=None, step_entries=None
+):
+    """Upload dataframes to a SQL database in a single transaction. See
+    `send_workflowresult_to_sql`.
+
+    Args:
+        dfs (dict): The dataframes to upload, keyed by table name, as returned
+            by `extract_dataframes`.
+        method (str): See `send_workflowresult_to_sql`.
+        engine (sqlalchemy.engine.Engine): See `send_workflowresult_to_sql`.
+        ledger_entries (list): See `send_workflowresult_to_sql`.
+        step_entries (list): (workflow id, step key, step id) tuples of the
+            steps the dataframes were extracted from, to record in the
+            `pyqe_checkpoint` table in the same transaction as the upload. See
+            `SqlCheckpoint`.
+    """
+
+    if engine is None:
+        engine = get_engine()
+    catalog = get_schema_catalog(engine)
+    stats = _UploadStats()
+    try:
+        with profile_stage("sql_transaction", tables=len(dfs)), engine.begin() as conn:
+            _reconcile_sql_schema(dfs, conn, catalog)
+            for table_name in dfs:
+                _write_table_to_sql(
+                    dfs[table_name], table_name, conn, catalog, method, stats
                 )
-                # existing_cols = engine.execute('PRAGMA table_info({})'.format(table_name))
-                existing_cols = [x.name for x in table.c]
-                found_missing_col = False
-                for col in dfs[table_name].columns.values.tolist():
-                    if col not in existing_cols:
-                        found_missing_col = True
-                        col_type = dfs[table_name][col].dtypes.name
-                        print(
-                            "Adding new column {} to table {}".format(
-                                col, _compress_name(table_name, max_len_postgres)
-                            )
-                        )
-                        sql_type = None
-                        # Type mapping based on pandas.io.sql.py _SQL_TYPES dictionary
-                        if "int" in col_type:
-                            sql_type = "INTEGER"
-                        elif "float" in col_type:
-                            sql_type = "REAL"
-                        elif "bool" in col_type:
-                            sql_type = "INTEGER"
-                        elif "datetime" in col_type:
-                            sql_type = "TIMESTAMP"
-                        elif "date" in col_type:
-                            sql_type = "DATE"
-                        elif "time" in col_type:
-                            sql_type = "TIME"
-                        elif "object" in col_type or "str" in col_type:
-                            sql_type = "TEXT"
-                        else:
-                            print("Defaulting to TEXT for SQL column type")
-                            sql_type = "TEXT"
-
-                        engine.execute(
-                            'ALTER TABLE "%s" ADD COLUMN "%s" %s'
-                            % (
-                                _compress_name(table_name, max_len_postgres),
-                                col,
-                                sql_type,
-                            )
-                        )
+            if ledger_entries:
+                SqlLedger(engine).record(ledger_entries, conn)
+            if step_entries:
+                SqlCheckpoint(engine).record(step_entries, conn)
+    except Exception:
+        catalog.invalidate()
+        raise
+    stats.report()
+
+
+def stream_workflowresult_to_sql(
+    fp, buffer_rows=10000, method="copy", engine=None, ledger_entries=None
+):
+    """Given a file containing a Quantum Engine workflowresult, flatten it step
+    by step and upload it to a SQL database in a single transaction.
+
+    Args:
+        fp (file): A text file object containing a workflowresult JSON object.
+        buffer_rows (int): The number of rows to buffer per table before
+            uploading them.
+        method (str): See `send_workflowresult_to_sql`.
+        engine (sqlalchemy.engine.Engine): See `send_workflowresult_to_sql`.
+        ledger_entries (list): See `send_workflowresult_to_sql`.
+    """
+
+    send_chunks_to_sql(
+        stream_dataframes(fp, buffer_rows), method, engine, ledger_entries
+    )
+
 
-                if not found_missing_col:
-                    print("Could not find missing column name")
-                    raise e
+def send_chunks_to_sql(
+    chunks, method="copy", engine=None, ledger_entries=None, step_entries=None
+):
+    """Upload chunks of tables to a SQL database as they are produced, in a
+    single transaction. The columns missing from a table are added, and those
+    too narrow for a chunk widened, before each chunk is uploaded.
 
-                # Now try adding the table again
-                dfs[table_name].to_sql(
-                    _compress_name(table_name, max_len_postgres),
-                    con=engine,
-                    if_exists="append",
+    Args:
+        chunks (iterable): (table name, pandas.DataFrame) tuples, as yielded
+            by `stream_dataframes` or `iter_dataframes`. A table may appear
+            several times.
+        method (str): See `send_workflowresult_to_sql`.
+        engine (sqlalchemy.engine.Engine): See `send_workflowresult_to_sql`.
+        ledger_entries (list): See `send_workflowresult_to_sql`.
+        step_entries (list): See `send_dataframes_to_sql`.
+    """
+
+    if engine is None:
+        engine = get_engine()
+    catalog = get_schema_catalog(engine)
+    stats = _UploadStats()
+    try:
+        with profile_stage("sql_transaction"), engine.begin() as conn:
+            for table_name, df in chunks:
+                _reconcile_sql_schema({table_name: df}, conn, catalog)
+                _write_table_to_sql(df, table_name, conn, catalog, method, stats)
+            if ledger_entries:
+                SqlLedger(engine).record(ledger_entries, conn)
+            if step_entries:
+                SqlCheckpoint(engine).record(step_entries, conn)
+    except Exception:
+        catalog.invalidate()
+        raise
+    stats.report()
+
+
+def _reconcile_sql_schema(dfs, conn, catalog):
+    """Add the columns that existing SQL tables are missing for a set of
+    dataframes, and widen the columns too narrow for their values, such as
+    integer columns created by an earlier chunk that now receive floats, using
+    one batch of DDL per table.
+
+    Args:
+        dfs (dict): The dataframes to be uploaded, keyed by table name.
+        conn (sqlalchemy.engine.Connection): The connection to upload with.
+        catalog (SchemaCatalog): The cached schema of the database.
+    """
+
+    with profile_stage("reconcile_sql_schema", tables=len(dfs)):
+        sql_names = {table_name: get_sql_table_name(table_name) for table_name in dfs}
+        catalog.reflect(conn, list(sql_names.values()))
+        for table_name, df in dfs.items():
+            existing_cols = catalog.get_columns(conn, sql_names[table_name])
+            if existing_cols is None:
+                # New tables are created by to_sql.
+                continue
+            frame = df.reset_index()
+            _widen_sql_columns(frame, sql_names[table_name], conn, catalog)
+            missing = [
+                (col, get_sql_type(frame[col].dtype, conn.dialect))
+                for col in frame.columns
+                if col not in existing_cols
+            ]
+            if not missing:
+                continue
+            print(
+                "Adding new columns {} to table {}".format(
+                    ", ".join(col for col, _ in missing), sql_names[table_name]
                 )
+            )
+            for statement in get_add_columns_statements(
+                conn.dialect.name, sql_names[table_name], missing
+            ):
+                conn.execute(statement)
+            catalog.add_columns(sql_names[table_name], [col for col, _ in missing])
+
+
+def _widen_sql_columns(frame, sql_name, conn, catalog):
+    """Widen the columns of an existing SQL table that cannot hold the values
+    of a dataframe, see `get_widened_type`."""
+
+    column_types = catalog.get_column_types(conn, sql_name)
+    widened = []
+    for col in frame.columns:
+        if col not in column_types or not frame[col].notna().any():
+            # Missing columns are added, and nulls fit any column.
+            continue
+        sql_type = get_widened_type(column_types[col], frame[col].dtype, conn.dialect)
+        if sql_type is not None:
+            widened.append((col, sql_type))
+    if not widened:
+        return
+    print(
+        "Widening columns {} of table {}".format(
+            ", ".join("{} to {}".format(col, sql_type) for col, sql_type in widened),
+            sql_name,
+        )
+    )
+    for statement in get_alter_column_types_statements(conn, sql_name, widened):
+        conn.execute(statement)
+    catalog.alter_columns(sql_name)
+
+
+class _UploadStats:
+    """Accumulates the rows uploaded and the time spent per table."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.tables = {}
+
+    def add(self, table_name, rows, seconds):
+        total_rows, total_seconds = self.tables.get(table_name, (0, 0.0))
+        self.tables[table_name] = (total_rows + rows, total_seconds + seconds)
+
+    def report(self):
+        for table_name, (rows, seconds) in self.tables.items():
+            print(
+                f"Uploaded {rows} rows to {table_name} "
+                f"({rows / max(seconds, 1e-9):.0f} rows/s)"
+            )
+        rows = sum(rows for rows, _ in self.tables.values())
+        seconds = time.perf_counter() - self.start
+        print(
+            f"Uploaded {rows} rows in {seconds:.2f}s "
+            f"({rows / max(seconds, 1e-9):.0f} rows/s)"
+        )
+
+
+def _get_bulk_loader(conn, method):
+    """Get the function that bulk loads rows into a table of the database of
+    `conn`, or None to use INSERT statements."""
+
+    if method != "copy":
+        return None
+    if conn.dialect.name == "postgresql" and conn.dialect.driver == "psycopg2":
+        return _copy_rows
+    if conn.dialect.name == "sqlite":
+        return _executemany_rows
+    if conn.dialect.name == "duckdb":
+        return _insert_frame_duckdb
+    return None
+
+
+class _CopyNull(float):
+    """The NULL marker of `_copy_rows`. The csv module leaves floats unquoted
+    and writes their repr, so it is written as a bare `\\N`."""
+
+    def __repr__(self):
+        return "\\N"
+
+
+_COPY_NULL = _CopyNull()
+
+
+def _copy_rows(conn, table_name, keys, rows, schema=None):
+    """Stream rows into a PostgreSQL table with `COPY FROM STDIN` through an
+    in-memory csv buffer.
+
+    Strings are always quoted and NULL is written as a bare `\\N`, so empty
+    strings are not read back as NULL.
+    """
+
+    buffer = io.StringIO()
+    csv.writer(buffer, quoting=csv.QUOTE_NONNUMERIC).writerows(
+        tuple(_COPY_NULL if value is None else value for value in row)
+        for row in rows
+    )
+    buffer.seek(0)
+
+    columns = ", ".join('"{}"'.format(key.replace('"', '""')) for key in keys)
+    if schema:
+        table_name = '"{}"."{}"'.format(schema, table_name)
+    else:
+        table_name = '"{}"'.format(table_name)
+    statement = (
+        f"COPY {table_name} ({columns}) FROM STDIN WITH (FORMAT csv, NULL '\\N')"
+    )
+    dbapi = conn.dialect.dbapi
+    with conn.connection.cursor() as cursor:
+        try:
+            cursor.copy_expert(statement, buffer)
+        except dbapi.Error as e:
+            # Raise the same exception types as statements run through
+            # SQLAlchemy.
+            raise DBAPIError.instance(statement, None, e, dbapi.Error)
+
+
+def _executemany_rows(conn, table_name, keys, rows, schema=None):
+    """Insert rows by executing a single prepared INSERT statement for all of
+    them through the DBAPI cursor, which SQLite runs without going back to
+    Python for each row."""
+
+    columns = ", ".join('"{}"'.format(key.replace('"', '""')) for key in keys)
+    if schema:
+        table_name = '"{}"."{}"'.format(schema, table_name)
+    else:
+        table_name = '"{}"'.format(table_name)
+    placeholders = ", ".join("?" for _ in keys)
+    statement = f"INSERT INTO {table_name} ({columns}) VALUES ({placeholders})"
+    dbapi = conn.dialect.dbapi
+    cursor = conn.connection.cursor()
+    try:
+        cursor.executemany(statement, rows)
+    except dbapi.Error as e:
+        raise DBAPIError.instance(statement, None, e, dbapi.Error)
+    finally:
+        cursor.close()
+
+
+def _insert_frame_duckdb(conn, table_name, keys, rows, schema=None):
+    """Insert rows into a DuckDB table by registering them as a dataframe and
+    inserting the result of a query over it, which DuckDB runs vectorized.
+    `rows` may be a pandas.DataFrame with the columns `keys`."""
+
+    if not isinstance(rows, pd.DataFrame):
+        rows = pd.DataFrame.from_records(list(rows), columns=keys)
+    if not len(rows.index):
+        return
+    columns = ", ".join('"{}"'.format(key.replace('"', '""')) for key in keys)
+    if schema:
+        table_name = '"{}"."{}"'.format(schema, table_name)
+    else:
+        table_name = '"{}"'.format(table_name)
+    view_name = f"_pyqe_{uuid.uuid4().hex}"
+    # Registered dataframes are scanned by position, so rename the columns to
+    # avoid clashes with DuckDB's handling of duplicate or odd names.
+    frame = rows.copy(deep=False)
+    frame.columns = [f"c{i}" for i in range(len(keys))]
+    select = ", ".join(f"c{i}" for i in range(len(keys)))
+    dbapi_connection = conn.connection.dbapi_connection
+    dbapi_connection.register(view_name, frame)
+    try:
+        dbapi_connection.execute(
+            f"INSERT INTO {table_name} ({columns}) SELECT {select} FROM {view_name}"
+        )
+    finally:
+        dbapi_connection.unregister(view_name)
+
+
+def _to_sql_method(loader):
+    """Wrap a bulk loader for use as the `method` of
+    `pandas.DataFrame.to_sql`."""
+
+    def method(table, conn, keys, data_iter):
+        loader(conn, table.name, keys, data_iter, table.schema)
+
+    return method
+
+
+def _write_table_to_sql(df, table_name, conn, catalog, method="copy", stats=None):
+    """Append a dataframe to a SQL table within the transaction of `conn`.
+    The table must already have all of the dataframe's columns, see
+    `_reconcile_sql_schema`."""
+
+    with profile_stage(
+        "write_sql", table=table_name, rows=len(df.index), columns=len(df.columns)
+    ):
+        sql_name = get_sql_table_name(table_name)
+        loader = _get_bulk_loader(conn, method)
+        # New tables get 64-bit numeric columns even from optimized
+        # dataframes, so that later uploads fit. Categoricals become TEXT.
+        df = restore_dtypes(df)
+        start = time.perf_counter()
+
+        if catalog.get_columns(conn, sql_name) is None:
+            # Let pandas create new tables with suitable column types.
+            df.to_sql(
+                sql_name,
+                con=conn,
+                if_exists="append",
+                method=_to_sql_method(loader) if loader else None,
+            )
+            catalog.add_columns(sql_name, [df.index.name] + list(df.columns))
+        else:
+            # Existing tables are known from the catalog, so rows are inserted
+            # directly instead of having pandas look the table up again.
+            frame = df.reset_index()
+            keys = [str(col) for col in frame.columns]
+            if loader is _insert_frame_duckdb:
+                # DuckDB reads the typed columns directly.
+                rows = frame
             else:
-                raise e
+                frame = frame.astype(object)
+                rows = frame.where(frame.notna(), None).itertuples(
+                    index=False, name=None
+                )
+            if loader is not None:
+                loader(conn, sql_name, keys, rows)
+            elif len(frame.index):
+                table = sql_table(sql_name, *(sql_column(key) for key in keys))
+                conn.execute(table.insert(), [dict(zip(keys, row)) for row in rows])
 
+        if stats is not None:
+            stats.add(table_name, len(df.index), time.perf_counter() - start)
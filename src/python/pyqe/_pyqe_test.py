@@ -3,10 +3,42 @@ from ._pyqe import (
     extract_dataframes,
     get_super_dict,
     get_class_dict,
+    get_step_entries,
     send_workflowresult_to_sql,
     extract_lists,
+    stream_dataframes,
+    export_to_csv,
+    export_to_xlsx,
+    export_to_parquet,
+    extract_dataframes_from_file,
+    extract_dataframes_from_files,
+    iter_dataframes,
+    iter_dataframes_from_files,
+    export_dataframes_to_csv,
+    export_dataframes_to_parquet,
+    send_dataframes_to_sql,
+    send_chunks_to_sql,
+    _build_dataframe,
+    _copy_rows,
 )
+from . import _pyqe
+import io
 import json
+import os
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+import pandas as pd
+from ._sql import create_sql_engine, get_engine
+from ._synthetic import generate_workflowresult
+
+
+def _sqlite_engine():
+    """Create an in-memory SQLite engine."""
+
+    return create_sql_engine("sqlite://")
 
 
 class TestPyqe(unittest.TestCase):
@@ -32,25 +64,46 @@ class TestPyqe(unittest.TestCase):
     def test_extract_lists(self):
 
         children = {}
-        extract_lists(self.workflowresult["step-1"], children)
-        extract_lists(self.workflowresult["step-2"], children)
+        step_1 = extract_lists(self.workflowresult["step-1"], children)
+        step_2 = extract_lists(self.workflowresult["step-2"], children)
 
         print(json.dumps(children, indent=2))
 
         self.assertEqual(len(children["two_dimensional_array"]), 12)
-        self.assertFalse(self.workflowresult["step-1"].get("two_dimensional_array"))
-        self.assertFalse(self.workflowresult["step-2"].get("two_dimensional_array"))
+        self.assertFalse(step_1.get("two_dimensional_array"))
+        self.assertFalse(step_2.get("two_dimensional_array"))
 
         self.assertEqual(len(children["one_dimensional_array"]), 6)
-        self.assertFalse(self.workflowresult["step-1"].get("one_dimensional_array"))
-        self.assertFalse(self.workflowresult["step-2"].get("one_dimensional_array"))
+        self.assertFalse(step_1.get("one_dimensional_array"))
+        self.assertFalse(step_2.get("one_dimensional_array"))
 
-        self.assertEqual(self.workflowresult["step-1"]["scalar"], 1)
-        self.assertEqual(self.workflowresult["step-2"]["scalar"], 1)
+        self.assertEqual(step_1["scalar"], 1)
+        self.assertEqual(step_2["scalar"], 1)
 
         self.assertEqual(len(children["list_of_dicts"]), 4)
-        self.assertFalse(self.workflowresult["step-1"].get("list_of_dicts"))
-        self.assertFalse(self.workflowresult["step-2"].get("list_of_dicts"))
+        self.assertFalse(step_1.get("list_of_dicts"))
+        self.assertFalse(step_2.get("list_of_dicts"))
+
+        # The workflowresult itself is left untouched.
+        self.assertEqual(len(self.workflowresult["step-1"]["list_of_dicts"]), 2)
+        self.assertEqual(len(self.workflowresult["step-2"]), 6)
+
+    def test_extract_lists_deep(self):
+        depth = 5000
+        item = {"id": "root", "leaf": [[1, 2]]}
+        for i in range(depth):
+            item = {"level": item, "values": [i]}
+
+        children = {}
+        stripped = extract_lists(item, children)
+
+        path = ".".join(["level"] * depth + ["leaf"])
+        self.assertEqual(len(children[path]), 2)
+        self.assertEqual(children[path][1]["index_1"], 1)
+        self.assertEqual(children[path][1]["parentId"], "root")
+        self.assertEqual(len(children["values"]), 1)
+        self.assertNotIn("values", stripped)
+        self.assertIn("values", item)
 
     def test_get_class_dict(self):
         class_dict = get_class_dict(self.workflowresult)
@@ -79,10 +132,579 @@ class TestPyqe(unittest.TestCase):
         self.assertEqual(len(dataframes["two_dimensional_array"].index), 12)
         self.assertEqual(len(dataframes["list_of_dicts"].index), 4)
 
+    def test_extract_dataframes_lazy(self):
+        dataframes = extract_dataframes(self.workflowresult)
+        tables = extract_dataframes(self.workflowresult, lazy=True)
+        self.assertEqual(list(tables), list(dataframes))
+        self.assertEqual(tables.row_counts["two_dimensional_array"], 12)
+        self.assertEqual(tables.row_counts["list_of_dicts"], 4)
+        self.assertFalse(tables.is_loaded("list_of_dicts"))
+
+        df = tables["list_of_dicts"]
+        self.assertTrue(tables.is_loaded("list_of_dicts"))
+        self.assertFalse(tables.is_loaded("class-A"))
+        self.assertIs(tables["list_of_dicts"], df)
+        pd.testing.assert_frame_equal(df, dataframes["list_of_dicts"])
+        with self.assertRaises(KeyError):
+            tables["missing"]
+
+    def test_extract_dataframes_lazy_shared(self):
+        dataframes = extract_dataframes(self.workflowresult)
+        tables = extract_dataframes(self.workflowresult, lazy=True)
+        build = _pyqe._build_dataframe
+        calls = []
+
+        def slow_build(rows, **kwargs):
+            calls.append(kwargs["table_name"])
+            if len(calls) == 1:
+                raise MemoryError()
+            # Give the other thread time to ask for the same table.
+            time.sleep(0.01)
+            return build(rows, **kwargs)
+
+        with mock.patch.object(_pyqe, "_build_dataframe", slow_build):
+            # A failed build keeps the rows, so the table can be built later.
+            with self.assertRaises(MemoryError):
+                tables["class-A"]
+            self.assertFalse(tables.is_loaded("class-A"))
+            with ThreadPoolExecutor(2) as executor:
+                results = list(
+                    executor.map(lambda _: {t: tables[t] for t in tables}, range(2))
+                )
+        self.assertEqual(sorted(calls[1:]), sorted(dataframes))
+        for table_name, df in dataframes.items():
+            self.assertIs(results[0][table_name], results[1][table_name])
+            pd.testing.assert_frame_equal(results[0][table_name], df)
+
+    def test_iter_dataframes(self):
+        dataframes = extract_dataframes(self.workflowresult)
+        tables = list(iter_dataframes(self.workflowresult))
+        self.assertEqual([table_name for table_name, _ in tables], list(dataframes))
+        for table_name, df in tables:
+            pd.testing.assert_frame_equal(df, dataframes[table_name])
+
+    def test_extract_dataframes_nested_dicts(self):
+        self.workflowresult["step-3"] = {
+            "class": "class-A",
+            "id": "c",
+            "params": {"x": {"y": 1.5}, "empty": {}},
+            "extra": "only-here",
+        }
+        df = extract_dataframes(self.workflowresult)["class-A"]
+        self.assertEqual(
+            list(df.columns), ["class", "scalar", "params.x.y", "extra"],
+        )
+        self.assertEqual(df.loc["c", "params.x.y"], 1.5)
+        self.assertTrue(pd.isna(df.loc[0, "extra"]))
+
+    def _add_wide_steps(self):
+        for i in range(3):
+            self.workflowresult[f"step-opt-{i}"] = {
+                "class": "class-opt",
+                "id": f"opt-{i}",
+                "params": {f"p{i + j}": j + 0.5 for j in range(4)},
+                "converged": i == 1,
+                "one_dimensional_array": [1, 2],
+            }
+
+    def test_extract_dataframes_long_layout(self):
+        self._add_wide_steps()
+        wide = extract_dataframes(self.workflowresult)
+        dataframes = extract_dataframes(self.workflowresult, max_columns=5)
+        # Long tables get a name of their own.
+        self.assertNotIn("class-opt", dataframes)
+        df = dataframes["class-opt.long"]
+        self.assertEqual(
+            list(df.columns), ["key", "value_number", "value_string", "value_boolean"]
+        )
+        # One row per value, ordered by row.
+        self.assertEqual(len(df.index), 3 * 6)
+        self.assertEqual(list(df.index[:6]), ["opt-0"] * 6)
+        for row_id, row in df.iterrows():
+            value = wide["class-opt"].loc[row_id, row["key"]]
+            if row["key"] == "class":
+                self.assertEqual(row["value_string"], value)
+            elif row["key"] == "converged":
+                self.assertEqual(row["value_boolean"], value)
+            else:
+                self.assertEqual(row["value_number"], value)
+        # Narrower tables keep their layout.
+        pd.testing.assert_frame_equal(dataframes["class-A"], wide["class-A"])
+        pd.testing.assert_frame_equal(
+            dataframes["one_dimensional_array"], wide["one_dimensional_array"]
+        )
+        with self.assertRaises(ValueError):
+            extract_dataframes(self.workflowresult, lazy=True, max_columns=5)
+
+    def _write_narrow_and_wide_steps(self, directory):
+        # The steps of the first file fit in 5 columns, those of the second
+        # do not.
+        paths = []
+        for wide in (False, True):
+            workflowresult = {}
+            for i in range(3):
+                params = {f"p{i + j}": j + 0.5 for j in range(4)} if wide else {"p": i}
+                workflowresult[f"step-{wide}-{i}"] = {
+                    "class": "class-opt",
+                    "id": f"opt-{wide}-{i}",
+                    "params": params,
+                    "converged": i == 1,
+                }
+            paths.append(os.path.join(directory, f"{wide}.json"))
+            with open(paths[-1], "w") as f:
+                json.dump(workflowresult, f)
+        return paths
+
+    def test_long_layout_is_kept_per_table(self):
+        with tempfile.TemporaryDirectory() as directory:
+            narrow_path, wide_path = self._write_narrow_and_wide_steps(directory)
+            narrow = extract_dataframes_from_file(narrow_path)
+            wide = extract_dataframes_from_file(wide_path, max_columns=5)
+            dfs, _ = extract_dataframes_from_files(
+                [narrow_path, wide_path], workers=2, max_columns=5
+            )
+            with open(narrow_path) as f:
+                steps = json.load(f)
+            with open(wide_path) as f:
+                steps.update(json.load(f))
+            chunks = {}
+            for table_name, df in stream_dataframes(
+                io.StringIO(json.dumps(steps)), buffer_rows=3, max_columns=5
+            ):
+                chunks.setdefault(table_name, []).append(df)
+
+        # The narrow rows stay wide and the wide rows are in long form, in
+        # separate tables, whether merged across files or chunks.
+        self.assertEqual(sorted(dfs), ["class-opt", "class-opt.long"])
+        self.assertEqual(sorted(chunks), ["class-opt", "class-opt.long"])
+        for merged in (dfs, {name: pd.concat(dfs) for name, dfs in chunks.items()}):
+            pd.testing.assert_frame_equal(merged["class-opt"], narrow["class-opt"])
+            pd.testing.assert_frame_equal(
+                merged["class-opt.long"], wide["class-opt.long"]
+            )
+
+    def test_extract_dataframes_sparse_layout(self):
+        self._add_wide_steps()
+        wide = extract_dataframes(self.workflowresult)["class-opt"]
+        df = extract_dataframes(
+            self.workflowresult, max_columns=5, wide_layout="sparse"
+        )["class-opt"]
+        self.assertTrue(all(isinstance(dtype, pd.SparseDtype) for dtype in df.dtypes))
+        dense = df.sparse.to_dense()
+        self.assertEqual(list(dense.columns), list(wide.columns))
+        pd.testing.assert_frame_equal(
+            dense.astype(object).fillna(-1), wide.astype(object).fillna(-1)
+        )
+        with self.assertRaises(ValueError):
+            extract_dataframes(self.workflowresult, max_columns=5, wide_layout="tall")
+
+    def test_wide_layouts_to_sinks(self):
+        self._add_wide_steps()
+        for wide_layout, table_name, rows in (
+            ("long", "class-opt.long", 18),
+            ("sparse", "class-opt", 3),
+        ):
+            dataframes = extract_dataframes(
+                self.workflowresult, max_columns=5, wide_layout=wide_layout
+            )
+            engine = _sqlite_engine()
+            send_dataframes_to_sql(dataframes, engine=engine)
+            df = pd.read_sql(f'SELECT * FROM "{table_name}"', engine)
+            self.assertEqual(len(df.index), rows)
+            with tempfile.TemporaryDirectory() as directory:
+                export_dataframes_to_csv(dataframes, directory)
+                df = pd.read_csv(os.path.join(directory, f"{table_name}.csv"))
+            self.assertEqual(len(df.index), rows)
+
+    def test_numeric_blocks(self):
+        self.workflowresult["step-3"] = {
+            "class": "class-C",
+            "id": "c",
+            "matrix": [[[i * j + 0.5 for j in range(4)] for i in range(5)]] * 3,
+            "ragged": [[1, 2], [3]],
+            "mixed": [1, "a", None],
+            "flags": [True, False],
+            "numbers": [True, 2, 3.5],
+            "empty": [[], []],
+        }
+        dataframes = extract_dataframes(json.loads(json.dumps(self.workflowresult)))
+        super_dict = get_super_dict(self.workflowresult)
+        for table_name in super_dict:
+            pd.testing.assert_frame_equal(
+                dataframes[table_name], _build_dataframe(super_dict[table_name])
+            )
+        self.assertEqual(len(dataframes["matrix"].index), 60)
+        self.assertEqual(
+            list(dataframes["matrix"].columns),
+            ["value", "index_0", "index_1", "index_2", "parentId"],
+        )
+        self.assertEqual(list(dataframes["numbers"]["value"]), [True, 2, 3.5])
+        self.assertIsInstance(dataframes["numbers"]["value"].iloc[0], bool)
+
+    def test_stream_dataframes(self):
+        text = json.dumps(self.workflowresult)
+        expected = extract_dataframes(json.loads(text))
+
+        chunks = {}
+        steps = []
+        for table_name, df in stream_dataframes(
+            io.StringIO(text), buffer_rows=5, steps=steps
+        ):
+            chunks.setdefault(table_name, []).append(df)
+        self.assertEqual(steps, get_step_entries(self.workflowresult))
+
+        self.assertEqual(len(chunks["two_dimensional_array"]), 2)
+        self.assertEqual(set(chunks), set(expected))
+        for table_name in expected:
+            pd.testing.assert_frame_equal(
+                pd.concat(chunks[table_name]), expected[table_name]
+            )
+
+    def test_extract_dataframes_from_files(self):
+        with tempfile.TemporaryDirectory() as directory:
+            paths = []
+            for i in range(3):
+                paths.append(os.path.join(directory, f"{i}.json"))
+                with open(paths[-1], "w") as f:
+                    json.dump(self.workflowresult, f)
+            paths.append(os.path.join(directory, "missing.json"))
+
+            steps = {}
+            dfs, failed = extract_dataframes_from_files(paths, workers=2, steps=steps)
+
+        self.assertEqual(failed, paths[-1:])
+        self.assertEqual(list(steps), paths[:-1])
+        self.assertEqual(steps[paths[0]], get_step_entries(self.workflowresult))
+        self.assertEqual(len(dfs), 5)
+        self.assertEqual(len(dfs["class-A"].index), 3)
+        self.assertEqual(len(dfs["two_dimensional_array"].index), 36)
+
+    def test_iter_dataframes_from_files(self):
+        with tempfile.TemporaryDirectory() as directory:
+            paths = []
+            for i in range(3):
+                paths.append(os.path.join(directory, f"{i}.json"))
+                self.workflowresult["step-1"]["scalar"] = i
+                with open(paths[-1], "w") as f:
+                    json.dump(self.workflowresult, f)
+            paths.insert(1, os.path.join(directory, "missing.json"))
+
+            files = list(iter_dataframes_from_files(paths, workers=2, max_pending=2))
+
+        self.assertEqual([path for path, _ in files], paths)
+        self.assertIsNone(files[1][1])
+        self.assertEqual(
+            [dfs["class-A"]["scalar"].iloc[0] for _, dfs in files if dfs], [0, 1, 2]
+        )
+
+    def test_export_to_csv(self):
+        with tempfile.TemporaryDirectory() as directory:
+            export_to_csv(self.workflowresult, directory)
+            self.workflowresult["step-3"] = {
+                "class": "class-A",
+                "id": "c",
+                "new_column": "x",
+            }
+            export_to_csv(self.workflowresult, directory)
+
+            df = pd.read_csv(os.path.join(directory, "class-A.csv"))
+            self.assertEqual(list(df.columns), ["_id", "class", "scalar", "new_column"])
+            self.assertEqual(len(df.index), 3)
+            self.assertEqual(df["new_column"].isna().sum(), 2)
+            df = pd.read_csv(os.path.join(directory, "two_dimensional_array.csv"))
+            self.assertEqual(len(df.index), 24)
+            with open(os.path.join(directory, ".pyqe_manifest.json")) as f:
+                manifest = json.load(f)
+            self.assertEqual(
+                manifest["class-A"], ["_id", "class", "scalar", "new_column"]
+            )
+
+    def test_export_to_csv_interrupted(self):
+        with tempfile.TemporaryDirectory() as directory:
+            manifest_path = os.path.join(directory, ".pyqe_manifest.json")
+            export_to_csv(self.workflowresult, directory)
+            dfs = extract_dataframes(self.workflowresult)
+            dfs["class-A"]["new_column"] = "x"
+            # The export fails after the header of class-A was rewritten.
+            with self.assertRaises(AttributeError):
+                export_dataframes_to_csv(
+                    {"class-A": dfs["class-A"], "bad": None}, directory
+                )
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+            header = ["_id", "class", "scalar", "new_column"]
+            self.assertEqual(manifest["class-A"], header)
+
+            # A manifest left behind by an export that stopped before saving
+            # it is reconciled with the file.
+            manifest["class-A"] = header[:3]
+            with open(manifest_path, "w") as f:
+                json.dump(manifest, f)
+            dfs["class-A"]["other_column"] = 1
+            export_dataframes_to_csv({"class-A": dfs["class-A"]}, directory)
+            df = pd.read_csv(os.path.join(directory, "class-A.csv"))
+            self.assertEqual(list(df.columns), header + ["other_column"])
+            self.assertEqual(df["new_column"].tolist()[1:], ["x", "x"])
+            self.assertEqual(df["other_column"].tolist()[2], 1)
+
+    def test_export_to_xlsx(self):
+        with tempfile.TemporaryDirectory() as directory:
+            filepath = os.path.join(directory, "excel_data.xlsx")
+            export_to_xlsx(self.workflowresult, filepath)
+            self.workflowresult["step-3"] = {
+                "class": "class-A",
+                "id": "c",
+                "new_column": "x",
+                "two_dimensional_array": [[4, -4]],
+            }
+            del self.workflowresult["step-2"]
+            with mock.patch("pyqe._pyqe.EXCEL_MAX_ROWS", 6):
+                export_to_xlsx(self.workflowresult, filepath)
+
+            sheets = pd.read_excel(filepath, sheet_name=None, index_col="_id")
+            self.assertEqual(
+                list(sheets),
+                [
+                    "class-A",
+                    "class-B",
+                    "two_dimensional_array",
+                    "two_dimensional_array~2",
+                    "two_dimensional_array~3",
+                    "two_dimensional_array~4",
+                    "one_dimensional_array",
+                    "one_dimensional_array~2",
+                    "list_of_dicts",
+                    "list_of_dicts~2",
+                ],
+            )
+            self.assertEqual(
+                list(sheets["class-A"].columns), ["class", "scalar", "new_column"]
+            )
+            self.assertEqual(sheets["class-A"].loc["c", "new_column"], "x")
+            self.assertEqual(len(sheets["class-B"].index), 1)
+            self.assertEqual(
+                sum(
+                    len(df.index)
+                    for name, df in sheets.items()
+                    if name.startswith("two_dimensional_array")
+                ),
+                20,
+            )
+
+    def test_export_to_parquet(self):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            self.skipTest("pyarrow is not installed")
+        with tempfile.TemporaryDirectory() as directory:
+            # The arrays are partitioned by the workflow of their step.
+            self.workflowresult["step-1"].update(id="a", workflowId="wf-1")
+            self.workflowresult["step-2"].update(id="b", workflowId="wf-2")
+            export_to_parquet(self.workflowresult, directory)
+            self.workflowresult["step-2"]["workflowId"] = "wf-3"
+            del self.workflowresult["step-1"]
+            export_to_parquet(self.workflowresult, directory)
+
+            self.assertEqual(
+                sorted(os.listdir(os.path.join(directory, "two_dimensional_array"))),
+                ["workflowId=wf-1", "workflowId=wf-2", "workflowId=wf-3"],
+            )
+            df = pd.read_parquet(os.path.join(directory, "class-A"))
+            self.assertEqual(list(df["workflowId"].astype(str)), ["wf-1"])
+            df = pd.read_parquet(os.path.join(directory, "two_dimensional_array"))
+            self.assertEqual(len(df.index), 18)
+            self.assertEqual(
+                set(zip(df["workflowId"].astype(str), df["parentId"])),
+                {("wf-1", "a"), ("wf-2", "b"), ("wf-3", "b")},
+            )
+
+    def test_export_to_parquet_batch(self):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            self.skipTest("pyarrow is not installed")
+        with tempfile.TemporaryDirectory() as directory:
+            paths = []
+            for i in range(2):
+                paths.append(os.path.join(directory, f"{i}.json"))
+                with open(paths[-1], "w") as f:
+                    json.dump(generate_workflowresult(3, workflow_id=f"wf-{i}"), f)
+            dfs, _ = extract_dataframes_from_files(paths)
+            export_dataframes_to_parquet(dfs, os.path.join(directory, "parquet"))
+
+            # Artifact values reach their workflow through the artifact.
+            for table_name in (
+                "array",
+                "records",
+                "io-synthetic-v1alpha1-artifact_0.values.real",
+            ):
+                df = pd.read_parquet(os.path.join(directory, "parquet", table_name))
+                # Every row is in the partition of the workflow of its step.
+                steps = df["parentId"].str.extract(r"^(wf-\d)", expand=False)
+                self.assertEqual(sorted(steps.unique()), ["wf-0", "wf-1"])
+                self.assertEqual(list(df["workflowId"].astype(str)), list(steps))
+
+    def test_export_to_parquet_leaves_dataframes(self):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            self.skipTest("pyarrow is not installed")
+        index = pd.Index(["a", "b"], name="_id")
+        dfs = {
+            "parent": pd.DataFrame(
+                {"workflowId": ["wf-1"]}, pd.Index(["p"], name="_id")
+            ),
+            "child": pd.DataFrame(
+                {"workflowId": [None, "wf-2"], "parentId": ["p", None]}, index
+            ),
+        }
+        before = {table_name: df.copy() for table_name, df in dfs.items()}
+        with tempfile.TemporaryDirectory() as directory:
+            export_dataframes_to_parquet(dfs, directory)
+            self.assertEqual(
+                sorted(os.listdir(os.path.join(directory, "child"))),
+                ["workflowId=wf-1", "workflowId=wf-2"],
+            )
+        # Sinks only read the dataframes, which other sinks may share.
+        for table_name, df in before.items():
+            pd.testing.assert_frame_equal(dfs[table_name], df)
+
+    def test_send_workflowresult_to_sql_transaction(self):
+        engine = _sqlite_engine()
+        send_workflowresult_to_sql(self.workflowresult, engine=engine)
+        self.assertEqual(
+            len(pd.read_sql('SELECT * FROM "two_dimensional_array"', engine)), 12
+        )
+
+        # A failing table rolls back the tables uploaded before it.
+        self.workflowresult["step-3"] = {
+            "class": "class-A",
+            "id": "c",
+            "list_of_dicts": [{"a": object()}],
+        }
+        with self.assertRaises(Exception):
+            send_workflowresult_to_sql(self.workflowresult, engine=engine)
+        self.assertEqual(len(pd.read_sql('SELECT * FROM "class-A"', engine)), 1)
+
+    def test_send_workflowresult_to_sql_new_columns(self):
+        engine = _sqlite_engine()
+        send_workflowresult_to_sql(self.workflowresult, engine=engine)
+        self.workflowresult["step-3"] = {
+            "class": "class-A",
+            "id": "c",
+            "new_int": 1,
+            "new_text": "x",
+            "list_of_dicts": [{"a": 5, "c": 1.5}],
+        }
+        send_workflowresult_to_sql(self.workflowresult, engine=engine)
+
+        df = pd.read_sql('SELECT * FROM "class-A"', engine, index_col="_id")
+        self.assertEqual(list(df.columns), ["class", "scalar", "new_int", "new_text"])
+        self.assertEqual(df.loc["c", "new_text"], "x")
+        df = pd.read_sql('SELECT * FROM "list_of_dicts"', engine)
+        self.assertEqual(len(df.index), 9)
+        self.assertEqual(df["c"].count(), 1)
+
+    def test_send_workflowresult_to_sqlite_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            engine = create_sql_engine(
+                "sqlite:///" + os.path.join(directory, "results.db")
+            )
+            for method in ("copy", "insert"):
+                send_workflowresult_to_sql(self.workflowresult, method, engine)
+            df = pd.read_sql('SELECT * FROM "two_dimensional_array"', engine)
+            engine.dispose()
+        self.assertEqual(len(df.index), 24)
+        self.assertEqual(sorted(df["value"].unique()), [-3, -2, -1, 1, 2, 3])
+
+    def test_send_workflowresult_to_duckdb(self):
+        try:
+            import duckdb_engine  # noqa: F401
+        except ImportError:
+            self.skipTest("duckdb-engine is not installed")
+        with tempfile.TemporaryDirectory() as directory:
+            engine = create_sql_engine(
+                "duckdb:///" + os.path.join(directory, "results.duckdb")
+            )
+            send_workflowresult_to_sql(self.workflowresult, engine=engine)
+            self.workflowresult["step-3"] = {
+                "class": "class-A",
+                "id": 1,
+                "new_float": 1.5,
+                "two_dimensional_array": [[4, -4]],
+            }
+            send_workflowresult_to_sql(self.workflowresult, engine=engine)
+            df = pd.read_sql('SELECT * FROM "class-A"', engine, index_col="_id")
+            arrays = pd.read_sql('SELECT * FROM "two_dimensional_array"', engine)
+            engine.dispose()
+        self.assertEqual(len(df.index), 3)
+        self.assertEqual(df["new_float"].count(), 1)
+        self.assertEqual(len(arrays.index), 26)
+
+    def test_send_chunks_widens_columns(self):
+        engines = {"sqlite": _sqlite_engine}
+        try:
+            import duckdb_engine  # noqa: F401
+        except ImportError:
+            pass
+        else:
+            engines["duckdb"] = lambda: create_sql_engine("duckdb:///:memory:")
+        # The first chunk creates an integer column, the next ones hold floats
+        # and then text.
+        values = [1, 2, 1.5, 2.5, "x"]
+        text = json.dumps(
+            {
+                f"step-{i}": {"class": "class-W", "id": i, "x": value}
+                for i, value in enumerate(values)
+            }
+        )
+        for name, create_engine in engines.items():
+            with self.subTest(name):
+                engine = create_engine()
+                send_chunks_to_sql(
+                    stream_dataframes(io.StringIO(text), buffer_rows=2), engine=engine
+                )
+                df = pd.read_sql('SELECT * FROM "class-W"', engine, index_col="_id")
+                engine.dispose()
+                self.assertEqual(list(df["x"][:4].astype(float)), [1, 2, 1.5, 2.5])
+                self.assertEqual(df["x"].iloc[4], "x")
+
     def test_ci_skip_send_workflowresult_to_sql(self):
         # This test requires you to have configured the SQL backend.
         send_workflowresult_to_sql(self.workflowresult)
 
+    def test_ci_skip_copy_matches_insert(self):
+        # This test requires you to have configured the SQL backend.
+        engine = get_engine()
+        suffix = uuid.uuid4().hex[:8]
+        dfs = {}
+        for method in ("copy", "insert"):
+            table_name = f"class-{method}-{suffix}"
+            for i, text in enumerate(["", None, "\\N", 'a,"b"\n']):
+                workflowresult = {
+                    "step": {"class": table_name, "id": i, "text": text, "x": 1.5}
+                }
+                # The first upload creates the table, the others append to it.
+                send_workflowresult_to_sql(workflowresult, method, engine)
+            try:
+                dfs[method] = pd.read_sql(
+                    f'SELECT * FROM "{table_name}"', engine, index_col="_id"
+                ).drop(columns="class")
+            finally:
+                with engine.begin() as conn:
+                    conn.execute(f'DROP TABLE "{table_name}"')
+        pd.testing.assert_frame_equal(dfs["copy"], dfs["insert"])
+        self.assertEqual(list(dfs["copy"]["text"]), ["", None, "\\N", 'a,"b"\n'])
+
+    def test_copy_buffer(self):
+        cursor = mock.MagicMock()
+        conn = mock.MagicMock()
+        conn.connection.cursor.return_value.__enter__.return_value = cursor
+        _copy_rows(conn, "table", ["a", "b"], [("", None), ("\\N", 1.5)])
+        statement, buffer = cursor.copy_expert.call_args.args
+        self.assertIn("NULL '\\N'", statement)
+        self.assertEqual(buffer.read(), '"",\\N\r\n"\\N",1.5\r\n')
+
     def test_output_artifacts(self):
 
         task_data = {
@@ -101,11 +723,12 @@ class TestPyqe(unittest.TestCase):
             "id": "h2-nrepr-purif-v2-9xhzg-2941914382",
         }
         children = {}
-        extract_lists(task_data, children)
+        stripped = extract_lists(task_data, children)
 
         print(json.dumps(children, indent=2))
 
-        self.assertEqual(len(task_data), 2)
+        self.assertEqual(len(stripped), 2)
+        self.assertEqual(len(task_data), 3)
         self.assertEqual(len(children), 3)
 
         self.assertEqual(
@@ -114,7 +737,7 @@ class TestPyqe(unittest.TestCase):
             ),
             2,
         )
-        self.assertFalse(task_data.get("expectations"))
+        self.assertFalse(stripped.get("expectations"))
 
         self.assertEqual(
             len(children["io-zapOS-v1alpha1-expectation_values.covariances"]), 2
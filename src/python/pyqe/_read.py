@@ -0,0 +1,105 @@
+"""Reading tables back from the SQL database they were uploaded to."""
+
+import pandas as pd
+from sqlalchemy import column as sql_column, inspect, select, table as sql_table
+
+from pyqe._profile import profile_stage
+from pyqe._pyqe import get_sql_table_name
+from pyqe._sql import get_engine
+
+
+def read_table(
+    table_name,
+    columns=None,
+    workflow_id=None,
+    parent_id=None,
+    chunksize=None,
+    engine=None,
+):
+    """Read a table uploaded by `send_workflowresult_to_sql` back into pandas,
+    selecting only the requested columns and rows in the database.
+
+    Args:
+        table_name (str): The name of the table, as returned by
+            `extract_dataframes`. It is compressed the same way as when the
+            table was uploaded.
+        columns (list): The columns to read. `_id` is always read, as the
+            index. Defaults to every column.
+        workflow_id (str or list): Only read the rows with this `workflowId`,
+            or any of these. The table must have a `workflowId` column, as
+            steps and output artifacts do.
+        parent_id (str or list): Only read the rows with this `parentId`, or
+            any of these, such as the children of a step.
+        chunksize (int): Return an iterator of dataframes of at most this many
+            rows instead of a single dataframe. The rows are streamed through
+            a server-side cursor where the database driver supports one, such
+            as psycopg2, so that only one chunk is held in memory at a time.
+        engine (sqlalchemy.engine.Engine): The engine to read with. Defaults
+            to one for the configured SQL connection.
+
+    Returns:
+        pandas.DataFrame: The rows of the table, indexed by `_id`, or an
+            iterator of such dataframes if `chunksize` is given.
+
+    Raises:
+        ValueError: If the table, a requested column or a filtered column does
+            not exist.
+    """
+
+    if engine is None:
+        engine = get_engine()
+    sql_name = get_sql_table_name(table_name)
+    query = _build_query(engine, sql_name, columns, workflow_id, parent_id)
+    if chunksize is None:
+        with profile_stage("read_sql", table=table_name) as stage:
+            with engine.connect() as conn:
+                df = pd.read_sql(query, conn, index_col="_id")
+            stage["rows"], stage["columns"] = df.shape
+        return df
+    return _read_chunks(engine, table_name, query, chunksize)
+
+
+def _build_query(engine, sql_name, columns, workflow_id, parent_id):
+    """Build the SELECT statement of `read_table`, checking the columns it
+    uses against the table."""
+
+    inspector = inspect(engine)
+    if not inspector.has_table(sql_name):
+        raise ValueError(f"There is no table {sql_name} in the database")
+    existing = [col["name"] for col in inspector.get_columns(sql_name)]
+    if columns is None:
+        selected = existing
+    else:
+        selected = ["_id"] + [col for col in columns if col != "_id"]
+    filters = {"workflowId": workflow_id, "parentId": parent_id}
+    used = selected + [col for col, values in filters.items() if values is not None]
+    missing = [col for col in used if col not in existing]
+    if missing:
+        raise ValueError(
+            f"Table {sql_name} has no column {', '.join(dict.fromkeys(missing))}"
+        )
+
+    table = sql_table(sql_name, *(sql_column(col) for col in existing))
+    query = select(*(table.c[col] for col in selected))
+    for col, values in filters.items():
+        if values is None:
+            continue
+        if isinstance(values, str):
+            values = [values]
+        query = query.where(table.c[col].in_(list(values)))
+    return query
+
+
+def _read_chunks(engine, table_name, query, chunksize):
+    # The connection stays open, with the cursor on the server, until every
+    # chunk has been read or the iterator is closed.
+    with engine.connect().execution_options(stream_results=True) as conn:
+        chunks = pd.read_sql(query, conn, index_col="_id", chunksize=chunksize)
+        while True:
+            with profile_stage("read_sql", table=table_name) as stage:
+                chunk = next(chunks, None)
+                if chunk is not None:
+                    stage["rows"], stage["columns"] = chunk.shape
+            if chunk is None:
+                return
+            yield chunk
@@ -0,0 +1,64 @@
+import unittest
+import pandas as pd
+from ._pyqe import extract_dataframes, send_workflowresult_to_sql
+from ._pyqe_test import _sqlite_engine
+from ._read import read_table
+from ._synthetic import generate_workflowresult
+
+
+class TestRead(unittest.TestCase):
+    def setUp(self):
+        self.workflowresult = generate_workflowresult(n_steps=4, seed=1)
+        self.long_class = "io-zapata-v1-" + "x" * 80
+        self.workflowresult["step-long"] = {
+            "class": self.long_class,
+            "id": "long",
+            "workflowId": "other-workflow",
+            "scalar": 1.5,
+        }
+        self.engine = _sqlite_engine()
+        send_workflowresult_to_sql(self.workflowresult, engine=self.engine)
+        self.dfs = extract_dataframes(self.workflowresult)
+
+    def test_read_table(self):
+        df = read_table("array", engine=self.engine)
+        self.assertEqual(df.index.name, "_id")
+        self.assertEqual(list(df.columns), list(self.dfs["array"].columns))
+        self.assertEqual(len(df.index), len(self.dfs["array"].index))
+        # Table names are compressed as they were on upload.
+        df = read_table(self.long_class, engine=self.engine)
+        self.assertEqual(df.loc["long", "scalar"], 1.5)
+
+    def test_read_table_projection_and_filters(self):
+        df = read_table(
+            "array", ["value"], parent_id="synthetic-workflow-1", engine=self.engine
+        )
+        expected = self.dfs["array"]
+        expected = expected[expected["parentId"] == "synthetic-workflow-1"]
+        self.assertEqual(list(df.columns), ["value"])
+        self.assertEqual(list(df["value"]), list(expected["value"]))
+
+        df = read_table(
+            "task-class-0",
+            ["label"],
+            workflow_id=["synthetic-workflow", "missing"],
+            engine=self.engine,
+        )
+        self.assertEqual(list(df.index), list(self.dfs["task-class-0"].index))
+
+        with self.assertRaises(ValueError):
+            read_table("array", ["missing"], engine=self.engine)
+        with self.assertRaises(ValueError):
+            read_table("array", workflow_id="synthetic-workflow", engine=self.engine)
+        with self.assertRaises(ValueError):
+            read_table("missing", engine=self.engine)
+
+    def test_read_table_chunks(self):
+        chunks = list(read_table("records", ["name"], chunksize=15, engine=self.engine))
+        self.assertEqual([len(chunk.index) for chunk in chunks], [15, 15, 10])
+        df = pd.concat(chunks)
+        self.assertEqual(list(df["name"]), list(self.dfs["records"]["name"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
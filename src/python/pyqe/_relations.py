@@ -0,0 +1,190 @@
+"""An index of the parent/child relationships between extracted tables."""
+
+import numpy as np
+import pandas as pd
+
+from pyqe._profile import profile_stage
+
+# The columns linking a row to its parent, in order of precedence. Output
+# artifacts have no `parentId`, but their `taskId` is the `_id` of their step.
+PARENT_COLUMNS = ("parentId", "taskId")
+
+
+class RelationshipIndex:
+    """A mapping from the `_id` of each parent row to the positions of its
+    children in every table, as returned by
+    `extract_dataframes(workflowresult, relationship_index=True)`.
+
+    The rows of each table are grouped by the categorical codes of their
+    `parentId` (or `taskId`), so the children of a row are a contiguous range
+    of a single sorted array per table, and the subtree of a row is found in
+    time proportional to its size rather than to the size of the tables.
+
+    Positions are for `DataFrame.iloc` on the dataframes the index was built
+    from.
+    """
+
+    def __init__(self):
+        # For each table, the positions of its rows sorted by parent.
+        self._positions = {}
+        # For each parent `_id`, (table name, start, stop) ranges of
+        # `_positions`.
+        self._children = {}
+        # The tables whose `_id` come from the `id` of their rows, and so can
+        # be parents.
+        self._id_tables = set()
+
+    def add_table(self, table_name, df):
+        """Index the rows of a table by their parent.
+
+        Args:
+            table_name (str): The name of the table.
+            df (pandas.DataFrame): The dataframe of the table, as built by
+                `extract_dataframes`.
+        """
+
+        if not isinstance(df.index, pd.RangeIndex):
+            self._id_tables.add(table_name)
+        parents = _get_parents(df)
+        if parents is None:
+            return
+        with profile_stage("relationship_index", table=table_name) as stage:
+            if isinstance(parents.dtype, pd.CategoricalDtype):
+                codes = parents.cat.codes.to_numpy()
+                uniques = parents.cat.categories
+            else:
+                codes, uniques = pd.factorize(parents)
+            codes = np.asarray(codes, dtype=np.int64)
+            # Rows without a parent (code -1) sort first and are skipped.
+            order = np.argsort(codes, kind="stable")
+            counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+            stops = np.cumsum(counts) + np.count_nonzero(codes < 0)
+            starts = stops - counts
+            self._positions[table_name] = order
+            for parent_id, start, stop in zip(
+                uniques.tolist(), starts.tolist(), stops.tolist()
+            ):
+                if stop > start:
+                    self._children.setdefault(parent_id, []).append(
+                        (table_name, start, stop)
+                    )
+            stage["rows"] = len(order)
+            stage["parents"] = len(uniques)
+
+    def children(self, parent_id):
+        """Get the positions of the direct children of a row.
+
+        Args:
+            parent_id: The `_id` of the parent row.
+
+        Returns:
+            dict: The positions of the children in each table that has any,
+                keyed by table name.
+        """
+
+        return {
+            table_name: self._positions[table_name][start:stop]
+            for table_name, start, stop in self._children.get(parent_id, ())
+        }
+
+    def subtree(self, parent_id, dfs):
+        """Get the positions of every descendant of a row: its children, the
+        children of those with an `_id` of their own, and so on.
+
+        Args:
+            parent_id: The `_id` of the root row.
+            dfs (dict): The dataframes the index was built from, used to look
+                up the `_id` of the descendants.
+
+        Returns:
+            dict: The sorted positions of the descendants in each table that
+                has any, keyed by table name.
+        """
+
+        found = {}
+        seen = {parent_id}
+        pending = [parent_id]
+        while pending:
+            current = pending.pop()
+            for table_name, positions in self.children(current).items():
+                found.setdefault(table_name, []).append(positions)
+                if table_name not in self._id_tables:
+                    continue
+                for child_id in dfs[table_name].index[positions].tolist():
+                    if child_id not in seen:
+                        seen.add(child_id)
+                        pending.append(child_id)
+        return {
+            table_name: np.sort(np.concatenate(parts))
+            for table_name, parts in found.items()
+        }
+
+    def __contains__(self, parent_id):
+        return parent_id in self._children
+
+    def __len__(self):
+        return len(self._children)
+
+    def __repr__(self):
+        return (
+            f"RelationshipIndex({len(self._children)} parents, "
+            f"{len(self._positions)} child tables)"
+        )
+
+
+def build_relationship_index(dfs):
+    """Build the relationship index of dataframes, for example ones read back
+    from an `ExtractionCache`.
+
+    Args:
+        dfs (dict): The dataframes of a workflowresult, keyed by table name,
+            as returned by `extract_dataframes`.
+
+    Returns:
+        RelationshipIndex: The index of the dataframes.
+    """
+
+    index = RelationshipIndex()
+    for table_name, df in dfs.items():
+        index.add_table(table_name, df)
+    return index
+
+
+def get_subtree(dfs, index, step_id):
+    """Get the rows of every table that belong to a step, such as its arrays,
+    lists of dicts and output artifacts, along with the rows of the output
+    artifacts themselves.
+
+    Args:
+        dfs (dict): The dataframes of a workflowresult, keyed by table name.
+        index (RelationshipIndex): The relationship index of `dfs`.
+        step_id: The `_id` of the step, or of any other row with children.
+
+    Returns:
+        dict: The rows of the subtree in each table that has any, keyed by
+            table name. The step itself is not included.
+    """
+
+    return {
+        table_name: dfs[table_name].iloc[positions]
+        for table_name, positions in index.subtree(step_id, dfs).items()
+    }
+
+
+def _get_parents(df):
+    """Get the `_id` of the parent of each row of a dataframe, or None if it
+    has no parent column."""
+
+    parents = None
+    for col in PARENT_COLUMNS:
+        if col not in df.columns:
+            continue
+        if parents is None:
+            parents = df[col]
+            if isinstance(parents.dtype, pd.SparseDtype):
+                parents = parents.sparse.to_dense()
+        else:
+            if isinstance(parents.dtype, pd.CategoricalDtype):
+                parents = parents.astype(object)
+            parents = parents.where(parents.notna(), df[col].astype(object))
+    return parents
@@ -0,0 +1,76 @@
+import unittest
+import numpy as np
+import pandas as pd
+from ._pyqe import extract_dataframes
+from ._relations import build_relationship_index, get_subtree
+from ._synthetic import generate_workflowresult
+
+
+class TestRelations(unittest.TestCase):
+    def setUp(self):
+        self.workflowresult = generate_workflowresult(n_steps=4, n_artifacts=2, seed=1)
+        self.dfs, self.index = extract_dataframes(
+            self.workflowresult, relationship_index=True
+        )
+
+    def _get_subtree_by_merging(self, step_id):
+        """Find the subtree of a step by scanning every table."""
+
+        subtree = {}
+        parents = {step_id}
+        while parents:
+            children = set()
+            for table_name, df in self.dfs.items():
+                mask = np.zeros(len(df.index), dtype=bool)
+                for col in ("parentId", "taskId"):
+                    if col in df.columns:
+                        mask |= df[col].isin(parents).to_numpy()
+                if mask.any():
+                    subtree[table_name] = df[mask]
+                    if not isinstance(df.index, pd.RangeIndex):
+                        children.update(df.index[mask])
+            parents = children
+        return subtree
+
+    def test_children(self):
+        children = self.index.children("synthetic-workflow-1")
+        array = self.dfs["array"].iloc[children["array"]]
+        self.assertTrue((array["parentId"] == "synthetic-workflow-1").all())
+        self.assertEqual(len(array.index), 10)
+        # Output artifacts are linked to their step by `taskId`.
+        artifact = self.dfs["io-synthetic-v1alpha1-artifact_0"]
+        self.assertEqual(
+            artifact.index[children["io-synthetic-v1alpha1-artifact_0"]].tolist(),
+            ["synthetic-workflow-1/artifact-0"],
+        )
+        self.assertEqual(self.index.children("missing"), {})
+
+    def test_get_subtree(self):
+        subtree = get_subtree(self.dfs, self.index, "synthetic-workflow-2")
+        expected = self._get_subtree_by_merging("synthetic-workflow-2")
+        self.assertEqual(sorted(subtree), sorted(expected))
+        for table_name, df in expected.items():
+            pd.testing.assert_frame_equal(subtree[table_name], df)
+        self.assertIn("io-synthetic-v1alpha1-artifact_1.items", subtree)
+
+    def test_optimized_dtypes(self):
+        dfs, index = extract_dataframes(
+            self.workflowresult, optimize_dtypes=True, relationship_index=True
+        )
+        self.assertEqual(dfs["array"]["parentId"].dtype, "category")
+        subtree = get_subtree(dfs, index, "synthetic-workflow-2")
+        expected = get_subtree(self.dfs, self.index, "synthetic-workflow-2")
+        for table_name, df in expected.items():
+            self.assertEqual(
+                subtree[table_name].index.tolist(), df.index.tolist(), table_name
+            )
+
+    def test_build_relationship_index(self):
+        index = build_relationship_index(self.dfs)
+        self.assertEqual(len(index), len(self.index))
+        with self.assertRaises(ValueError):
+            extract_dataframes(self.workflowresult, lazy=True, relationship_index=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+"""A generator of synthetic Quantum Engine workflowresults, used to test and
+benchmark the conversion of large workflowresults."""
+
+import random
+
+
+def generate_workflowresult(
+    n_steps=10,
+    n_classes=2,
+    depth=1,
+    array_shape=(10,),
+    n_records=10,
+    n_artifacts=1,
+    workflow_id="synthetic-workflow",
+    seed=0,
+):
+    """Generate a synthetic Quantum Engine workflowresult dict.
+
+    Every step has a few scalars, a numeric (nested) list, a list of dicts,
+    nested dicts and output artifacts with a `schema`, so that all the tables
+    produced by `extract_dataframes` are exercised.
+
+    Args:
+        n_steps (int): The number of steps.
+        n_classes (int): The number of task classes the steps are spread over.
+        depth (int): The number of levels of nested dicts in each step.
+        array_shape (tuple): The shape of the numeric (nested) list of each
+            step and of the values of each output artifact.
+        n_records (int): The number of dicts in the list of dicts of each step
+            and of each output artifact.
+        n_artifacts (int): The number of output artifacts of each step.
+        workflow_id (str): The `workflowId` of the workflowresult.
+        seed (int): The seed of the random values, so that the same arguments
+            always generate the same workflowresult.
+
+    Returns:
+        dict: A workflowresult dict.
+    """
+
+    rng = random.Random(seed)
+    workflowresult = {}
+    for i in range(n_steps):
+        task_class = f"task-class-{i % n_classes}"
+        task_id = f"{workflow_id}-{i}"
+        step = {
+            "class": task_class,
+            "id": task_id,
+            "workflowId": workflow_id,
+            "scalar": rng.random(),
+            "label": f"label-{rng.randrange(100)}",
+            "array": _nested_list(rng, array_shape),
+            "records": _records(rng, n_records, task_id),
+            "nested": _nested_dict(rng, depth),
+        }
+        for j in range(n_artifacts):
+            step[f"artifact-{j}"] = {
+                "schema": f"io-synthetic-v1alpha1-artifact_{j}",
+                "id": f"{task_id}/artifact-{j}",
+                "taskClass": task_class,
+                "taskId": task_id,
+                "workflowId": workflow_id,
+                "values": {"real": _nested_list(rng, array_shape)},
+                "items": _records(rng, n_records, f"{task_id}/artifact-{j}"),
+            }
+        workflowresult[f"step-{i}"] = step
+    return workflowresult
+
+
+def _nested_list(rng, shape):
+    if len(shape) == 1:
+        return [rng.uniform(-1, 1) for _ in range(shape[0])]
+    return [_nested_list(rng, shape[1:]) for _ in range(shape[0])]
+
+
+def _records(rng, n_records, parent_id):
+    # Lists of dicts carry the `parentId` that DCS assigns to them.
+    return [
+        {
+            "parentId": parent_id,
+            "name": f"record-{k}",
+            "value": rng.random(),
+            "count": rng.randrange(1000),
+        }
+        for k in range(n_records)
+    ]
+
+
+def _nested_dict(rng, depth):
+    nested = {"value": rng.random(), "items": [rng.randrange(10) for _ in range(3)]}
+    if depth > 1:
+        nested["child"] = _nested_dict(rng, depth - 1)
+    return nested
@@ -0,0 +1,31 @@
+import unittest
+from ._synthetic import generate_workflowresult
+from ._pyqe import extract_dataframes
+
+
+class TestSynthetic(unittest.TestCase):
+    def test_generate_workflowresult(self):
+        workflowresult = generate_workflowresult(
+            n_steps=4, n_classes=2, depth=2, array_shape=(3, 2), n_records=5
+        )
+        self.assertEqual(workflowresult, generate_workflowresult(
+            n_steps=4, n_classes=2, depth=2, array_shape=(3, 2), n_records=5
+        ))
+        self.assertNotEqual(workflowresult, generate_workflowresult(
+            n_steps=4, n_classes=2, depth=2, array_shape=(3, 2), n_records=5, seed=1
+        ))
+
+        dfs = extract_dataframes(workflowresult)
+        self.assertEqual(len(dfs["task-class-0"].index), 2)
+        self.assertEqual(len(dfs["task-class-1"].index), 2)
+        self.assertEqual(len(dfs["array"].index), 24)
+        self.assertEqual(len(dfs["records"].index), 20)
+        self.assertEqual(len(dfs["nested.child.items"].index), 12)
+        self.assertEqual(len(dfs["io-synthetic-v1alpha1-artifact_0"].index), 4)
+        self.assertEqual(
+            len(dfs["io-synthetic-v1alpha1-artifact_0.values.real"].index), 24
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
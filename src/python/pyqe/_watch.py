@@ -0,0 +1,92 @@
+"""Watching a drop directory for new workflowresult files."""
+
+import glob
+import os
+import threading
+import time
+
+
+def watch_directory(
+    directory,
+    ingest,
+    pattern="*.json",
+    poll_interval=5.0,
+    settle_time=2.0,
+    backoff=1.0,
+    max_backoff=300.0,
+    max_attempts=5,
+    stop_event=None,
+):
+    """Poll a directory and ingest every workflowresult file that lands in it,
+    in the order the files were last modified.
+
+    A file is only ingested once it has not been modified for `settle_time`
+    seconds, so that files still being copied are left alone. A file that
+    fails is retried with exponential backoff, and given up on after
+    `max_attempts` attempts until it is modified again.
+
+    Args:
+        directory (str): The directory to watch.
+        ingest (callable): A function taking the path of a new file and
+            loading it into a sink. Raising an exception marks the attempt as
+            failed.
+        pattern (str): The glob pattern of the files to ingest.
+        poll_interval (float): The number of seconds between polls.
+        settle_time (float): The number of seconds a file must be left
+            unmodified before it is ingested.
+        backoff (float): The number of seconds to wait before retrying a file
+            that failed once. The wait doubles with every further failure.
+        max_backoff (float): The longest wait between two attempts.
+        max_attempts (int): The number of attempts after which a file is
+            given up on.
+        stop_event (threading.Event): An event that stops watching once set.
+            By default, watching goes on until interrupted.
+    """
+
+    if stop_event is None:
+        stop_event = threading.Event()
+    # The (mtime, size) of the version of each file that has been ingested or
+    # given up on.
+    done = {}
+    # The number of failed attempts and the time of the next attempt of each
+    # file that is being retried.
+    failures = {}
+
+    while not stop_event.is_set():
+        files = []
+        for path in glob.glob(os.path.join(directory, pattern)):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                # The file was removed since it was listed.
+                continue
+            files.append((stat.st_mtime, path, stat.st_size))
+        files.sort()
+
+        for mtime, path, size in files:
+            if stop_event.is_set():
+                break
+            signature = (mtime, size)
+            now = time.time()
+            if done.get(path) == signature or now - mtime < settle_time:
+                continue
+            attempts, retry_at = failures.get(path, (0, 0))
+            if now < retry_at:
+                continue
+            try:
+                ingest(path)
+            except Exception as e:
+                attempts += 1
+                if attempts >= max_attempts:
+                    print(f"Giving up on {path} after {attempts} attempts: {e}")
+                    failures.pop(path, None)
+                    done[path] = signature
+                else:
+                    delay = min(backoff * 2 ** (attempts - 1), max_backoff)
+                    print(f"Failed to ingest {path}: {e}. Retrying in {delay:.1f}s.")
+                    failures[path] = (attempts, time.time() + delay)
+                continue
+            failures.pop(path, None)
+            done[path] = signature
+
+        stop_event.wait(poll_interval)
@@ -0,0 +1,73 @@
+import unittest
+import os
+import tempfile
+import threading
+from ._watch import watch_directory
+
+
+class TestWatch(unittest.TestCase):
+    def test_watch_directory(self):
+        with tempfile.TemporaryDirectory() as directory:
+            for name in ("a.json", "b.json", "notes.txt"):
+                with open(os.path.join(directory, name), "w") as f:
+                    f.write("{}")
+            stop_event = threading.Event()
+            attempts = []
+
+            def ingest(path):
+                name = os.path.basename(path)
+                attempts.append(name)
+                if name == "a.json" and attempts.count(name) == 1:
+                    raise RuntimeError("database unavailable")
+                if name == "b.json":
+                    # A file landing while the directory is being watched.
+                    with open(os.path.join(directory, "c.json"), "w") as f:
+                        f.write("{}")
+                if name == "c.json":
+                    stop_event.set()
+
+            thread = threading.Thread(
+                target=watch_directory,
+                args=(directory, ingest),
+                kwargs={
+                    "poll_interval": 0.01,
+                    "settle_time": 0,
+                    "backoff": 0,
+                    "stop_event": stop_event,
+                },
+            )
+            thread.start()
+            thread.join(timeout=10)
+            stop_event.set()
+
+            self.assertFalse(thread.is_alive())
+            self.assertEqual(attempts, ["a.json", "b.json", "a.json", "c.json"])
+
+    def test_watch_directory_gives_up(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, "a.json"), "w") as f:
+                f.write("{")
+            stop_event = threading.Event()
+            attempts = []
+
+            def ingest(path):
+                attempts.append(path)
+                raise ValueError("invalid workflow result")
+
+            timer = threading.Timer(0.5, stop_event.set)
+            timer.start()
+            watch_directory(
+                directory,
+                ingest,
+                poll_interval=0.01,
+                settle_time=0,
+                backoff=0,
+                max_attempts=3,
+                stop_event=stop_event,
+            )
+            timer.cancel()
+            self.assertEqual(len(attempts), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,9 +1,46 @@
-from ._pyqe import send_workflowresult_to_sql, export_to_csv, export_to_xlsx
-from ._sql import set_configuration, get_configuration
+from ._pyqe import (
+    extract_dataframes,
+    extract_dataframes_from_file,
+    extract_dataframes_from_files,
+    export_dataframes_to_csv,
+    export_dataframes_to_xlsx,
+    export_dataframes_to_parquet,
+    send_dataframes_to_sql,
+    send_chunks_to_sql,
+    export_chunks_to_csv,
+    iter_dataframes_from_file,
+    iter_dataframes_from_files,
+    stream_dataframes,
+    get_step_entries,
+)
+from ._sql import set_configuration, get_configuration, get_engine
+from ._ledger import (
+    CHECKPOINT_FILE,
+    LEDGER_FILE,
+    FileCheckpoint,
+    FileLedger,
+    SqlCheckpoint,
+    SqlLedger,
+    hash_file,
+)
+from ._profile import Profiler, profile_stage
+from ._watch import watch_directory
+from ._io import load_workflowresult, open_workflowresult
+from ._pipeline import PipelineStats, pipelined
+from ._dtypes import DtypeSavings
+from ._cache import CACHE_DIR, DEFAULT_CACHE_SIZE, ExtractionCache
+from ._fanout import write_to_sinks
 import argparse
+import glob
+import hashlib
+import os
 import sys
 import json
 
+# The file names of workflowresults in a directory, plain or compressed.
+WORKFLOWRESULT_PATTERNS = ("*.json", "*.json.gz", "*.json.zst")
+FORMATS = ("xlsx", "csv", "parquet", "sql")
+
 
 def parse_arguments():
     parser = argparse.ArgumentParser(description="Convert workflow result.")
@@ -26,17 +63,48 @@ def parse_arguments():
     config_parser.add_argument("--password", type=str, default="", help="the password")
     config_parser.set_defaults(func=set_configuration_command)
 
+    url_parser = subparsers.add_parser(
+        "set-url",
+        help="Configure SQL connection with a SQLAlchemy URL.",
+    )
+    url_parser.add_argument(
+        "connection_string",
+        type=str,
+        help="The SQLAlchemy URL of the database, e.g. sqlite:///results.db or duckdb:///results.duckdb",
+    )
+    url_parser.set_defaults(func=set_url_command)
+
     show_config_parser = subparsers.add_parser(
         "show-config", help="Show SQL configuration."
     )
     show_config_parser.set_defaults(func=show_configuration_command)
 
+    clear_cache_parser = subparsers.add_parser(
+        "clear-cache", help="Remove every table from the extraction cache."
+    )
+    clear_cache_parser.set_defaults(func=clear_cache)
+
     upload_parser = subparsers.add_parser(
         "upload", help="Upload workflow result to SQL connection."
     )
     upload_parser.add_argument(
         "file", type=str, help="The workflow result JSON file to process."
     )
+    upload_parser.add_argument(
+        "--method",
+        type=str,
+        choices=["copy", "insert"],
+        default="copy",
+        help="Load tables with PostgreSQL COPY or with INSERT statements.",
+    )
+    _add_stream_arguments(upload_parser)
+    _add_pipeline_arguments(upload_parser)
+    _add_force_argument(upload_parser)
+    _add_profile_argument(upload_parser)
+    _add_optimize_argument(upload_parser)
+    _add_max_columns_argument(upload_parser)
+    _add_incremental_argument(upload_parser)
+    _add_cache_arguments(upload_parser)
     upload_parser.set_defaults(func=upload)
 
     export_parser = subparsers.add_parser(
@@ -46,17 +114,496 @@ def parse_arguments():
         "file", type=str, help="The workflow result JSON file to process."
     )
     export_parser.add_argument(
-        "--format", type=str, choices=["xlsx", "csv"], default="csv", help="Format to export to."
+        "--format",
+        dest="formats",
+        type=_parse_formats,
+        default=["csv"],
+        help="Comma-separated formats to export to, among xlsx, csv, parquet and sql, "
+        "e.g. csv,xlsx,sql. Several formats are written concurrently from a single extraction.",
     )
+    export_parser.add_argument(
+        "--output-dir",
+        type=str,
+        default=None,
+        help="Directory to write csv or parquet files to. Defaults to ./csv_data or ./parquet_data.",
+    )
+    export_parser.add_argument(
+        "--output-file",
+        type=str,
+        default="./excel_data.xlsx",
+        help="Excel file to write xlsx output to.",
+    )
+    export_parser.add_argument(
+        "--method",
+        type=str,
+        choices=["copy", "insert"],
+        default="copy",
+        help="Load SQL tables with PostgreSQL COPY or with INSERT statements.",
+    )
+    _add_stream_arguments(export_parser)
+    _add_pipeline_arguments(export_parser)
+    _add_force_argument(export_parser)
+    _add_profile_argument(export_parser)
+    _add_optimize_argument(export_parser)
+    _add_max_columns_argument(export_parser)
+    _add_incremental_argument(export_parser)
+    _add_cache_arguments(export_parser)
     export_parser.set_defaults(func=export)
 
+    batch_parser = subparsers.add_parser(
+        "batch",
+        help="Convert many workflow results in parallel.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    batch_parser.add_argument(
+        "path",
+        type=str,
+        help="A directory of workflow result JSON files, optionally compressed with gzip (.json.gz) or zstd (.json.zst), or a glob pattern matching them.",
+    )
+    batch_parser.add_argument(
+        "--format",
+        type=str,
+        choices=["xlsx", "csv", "parquet", "sql"],
+        default="csv",
+        help="Format to export to.",
+    )
+    batch_parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Number of worker processes. Defaults to the number of CPUs.",
+    )
+    batch_parser.add_argument(
+        "--output-dir",
+        type=str,
+        default=None,
+        help="Directory to write csv or parquet files to. Defaults to ./csv_data or ./parquet_data.",
+    )
+    batch_parser.add_argument(
+        "--output-file",
+        type=str,
+        default="./excel_data.xlsx",
+        help="Excel file to write xlsx output to.",
+    )
+    batch_parser.add_argument(
+        "--method",
+        type=str,
+        choices=["copy", "insert"],
+        default="copy",
+        help="Load SQL tables with PostgreSQL COPY or with INSERT statements.",
+    )
+    _add_pipeline_arguments(batch_parser)
+    _add_force_argument(batch_parser)
+    _add_profile_argument(batch_parser)
+    _add_optimize_argument(batch_parser)
+    _add_max_columns_argument(batch_parser)
+    _add_cache_arguments(batch_parser)
+    batch_parser.set_defaults(func=batch)
+
+    watch_parser = subparsers.add_parser(
+        "watch",
+        help="Watch a directory and convert workflow results as they land in it.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    watch_parser.add_argument(
+        "directory", type=str, help="The directory to watch for workflow result files."
+    )
+    watch_parser.add_argument(
+        "--format",
+        type=str,
+        choices=["xlsx", "csv", "parquet", "sql"],
+        default="sql",
+        help="Format to export to.",
+    )
+    watch_parser.add_argument(
+        "--pattern",
+        type=str,
+        default="*.json",
+        help="Glob pattern of the workflow result files in the directory.",
+    )
+    watch_parser.add_argument(
+        "--output-dir",
+        type=str,
+        default=None,
+        help="Directory to write csv or parquet files to. Defaults to ./csv_data or ./parquet_data.",
+    )
+    watch_parser.add_argument(
+        "--output-file",
+        type=str,
+        default="./excel_data.xlsx",
+        help="Excel file to write xlsx output to.",
+    )
+    watch_parser.add_argument(
+        "--method",
+        type=str,
+        choices=["copy", "insert"],
+        default="copy",
+        help="Load SQL tables with PostgreSQL COPY or with INSERT statements.",
+    )
+    watch_parser.add_argument(
+        "--pool-size",
+        type=int,
+        default=5,
+        help="Number of database connections to keep open.",
+    )
+    watch_parser.add_argument(
+        "--poll-interval",
+        type=float,
+        default=5.0,
+        help="Seconds between two scans of the directory.",
+    )
+    watch_parser.add_argument(
+        "--settle-time",
+        type=float,
+        default=2.0,
+        help="Seconds a file must be left unmodified before it is converted.",
+    )
+    watch_parser.add_argument(
+        "--backoff",
+        type=float,
+        default=1.0,
+        help="Seconds to wait before retrying a failed file, doubled after every failure.",
+    )
+    watch_parser.add_argument(
+        "--max-backoff",
+        type=float,
+        default=300.0,
+        help="Longest wait in seconds between two attempts at a file.",
+    )
+    watch_parser.add_argument(
+        "--max-attempts",
+        type=int,
+        default=5,
+        help="Number of attempts after which a file is given up on.",
+    )
+    _add_optimize_argument(watch_parser)
+    _add_max_columns_argument(watch_parser)
+    _add_incremental_argument(watch_parser)
+    _add_cache_arguments(watch_parser)
+    watch_parser.set_defaults(func=watch)
+
     args = parser.parse_args()
 
     if args.func is None:
         parser.print_help(sys.stderr)
         sys.exit(1)
+    elif getattr(args, "profile", None):
+        _run_profiled(args)
     else:
+        _run(args)
+
+
+def _parse_formats(value):
+    formats = []
+    for fmt in value.split(","):
+        fmt = fmt.strip()
+        if fmt not in FORMATS:
+            raise argparse.ArgumentTypeError(
+                f"invalid format {fmt!r} (choose from {', '.join(FORMATS)})"
+            )
+        if fmt not in formats:
+            formats.append(fmt)
+    return formats
+
+
+def _add_stream_arguments(parser):
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Process the workflow result one step at a time to bound memory usage.",
+    )
+    parser.add_argument(
+        "--buffer-rows",
+        type=int,
+        default=10000,
+        help="Number of rows to buffer per table when streaming.",
+    )
+
+
+def _add_pipeline_arguments(parser):
+    parser.add_argument(
+        "--pipeline",
+        action="store_true",
+        help="Flatten the next tables or files while the current ones are written out.",
+    )
+    parser.add_argument(
+        "--queue-size",
+        type=int,
+        default=2,
+        help="Number of flattened tables or files that may wait to be written when pipelining.",
+    )
+
+
+def _iter_chunks(args, steps, digest=None):
+    """Flatten the workflow result file of the command line arguments one
+    table, or with --stream one chunk, at a time, adding its steps to `steps`
+    once every chunk has been yielded. Streaming bypasses the extraction
+    cache, which holds whole tables."""
+
+    file_steps = []
+    if args.stream:
+        with open_workflowresult(args.file) as f:
+            yield from stream_dataframes(
+                f,
+                args.buffer_rows,
+                args.optimize_dtypes,
+                args.max_columns,
+                steps=file_steps,
+            )
+    else:
+        yield from iter_dataframes_from_file(
+            args.file,
+            args.optimize_dtypes,
+            _get_cache(args),
+            digest,
+            args.max_columns,
+            steps=file_steps,
+        )
+    steps.extend(_get_file_steps(args.file, file_steps))
+
+
+def _add_cache_arguments(parser):
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help=f"Do not read or add the extracted tables to the cache in {CACHE_DIR}.",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=DEFAULT_CACHE_SIZE >> 20,
+        help="Size in MiB above which the least recently used tables are evicted from the cache.",
+    )
+
+
+def _get_cache(args):
+    if args.no_cache:
+        return None
+    return ExtractionCache(max_bytes=args.cache_size << 20)
+
+
+def _add_force_argument(parser):
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Load workflow results even if the ledger shows they were already loaded.",
+    )
+
+
+def _add_profile_argument(parser):
+    parser.add_argument(
+        "--profile",
+        type=str,
+        nargs="?",
+        const="-",
+        default=None,
+        metavar="FILE",
+        help="Report the time, memory and table sizes of each stage, printed or written to a JSON FILE.",
+    )
+    parser.add_argument(
+        "--trace-memory",
+        action="store_true",
+        help="Trace the peak memory of each stage when profiling. This slows down the conversion.",
+    )
+
+
+def _add_optimize_argument(parser):
+    parser.add_argument(
+        "--optimize-dtypes",
+        action="store_true",
+        help="Hold tables in memory with compact dtypes and report the memory saved per table.",
+    )
+
+
+def _add_max_columns_argument(parser):
+    parser.add_argument(
+        "--max-columns",
+        type=int,
+        default=None,
+        help="Write tables with more columns than this in long form, one row per value "
+        "with its column name in `key`. Defaults to no limit.",
+    )
+
+
+def _add_incremental_argument(parser):
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only load the steps of each workflow that the sink has not loaded yet, "
+        "according to the checkpoint of the steps every load records. "
+        "For workflows that are still running.",
+    )
+
+
+def _run(args):
+    if not getattr(args, "optimize_dtypes", False):
         args.func(args)
+        return
+    with DtypeSavings() as savings:
+        args.func(args)
+    savings.report()
+
+
+def _run_profiled(args):
+    profiler = Profiler(trace_memory=args.trace_memory)
+    try:
+        with profiler:
+            _run(args)
+    finally:
+        if args.profile == "-":
+            profiler.print_report()
+        else:
+            profiler.write_report(args.profile)
+            print(f"Wrote profile to {args.profile}")
+
+
+def _get_output_dir(args, fmt=None):
+    if args.output_dir is not None:
+        return args.output_dir
+    return "./parquet_data" if (fmt or args.format) == "parquet" else "./csv_data"
+
+
+def _get_sidecar_path(output_file, kind):
+    """Get the path of the ledger or checkpoint of a single output file,
+    `.<file>.pyqe_<kind>` next to it. Being hidden and not ending in .json, it
+    is never mistaken for a workflow result by `batch` or `watch`."""
+
+    directory, name = os.path.split(output_file)
+    path = os.path.join(directory, f".{name}.pyqe_{kind}")
+    # Sidecars used to be named <file>.<kind>.json.
+    legacy_path = f"{output_file}.{kind}.json"
+    if os.path.isfile(legacy_path) and not os.path.exists(path):
+        os.replace(legacy_path, path)
+    return path
+
+
+def _get_ledger(args, engine=None, fmt=None):
+    """Get the ledger of the sink of a format, by default the one selected by
+    the command line arguments."""
+
+    fmt = fmt or args.format
+    if fmt == "sql":
+        return SqlLedger(engine or get_engine())
+    if fmt == "xlsx":
+        return FileLedger(_get_sidecar_path(args.output_file, "ledger"))
+    return FileLedger(os.path.join(_get_output_dir(args, fmt), LEDGER_FILE))
+
+
+def _get_checkpoint(args, engine=None, fmt=None):
+    """Get the checkpoint of the steps loaded into the sink of a format, by
+    default the one selected by the command line arguments."""
+
+    fmt = fmt or args.format
+    if fmt == "sql":
+        return SqlCheckpoint(engine or get_engine())
+    if fmt == "xlsx":
+        return FileCheckpoint(_get_sidecar_path(args.output_file, "checkpoint"))
+    return FileCheckpoint(os.path.join(_get_output_dir(args, fmt), CHECKPOINT_FILE))
+
+
+def _get_sink(args, fmt, ledger, entries, engine=None, steps=()):
+    """Get a function writing dataframes to the sink of a format and recording
+    the workflow results they came from in the sink's ledger, and the steps
+    they came from in the sink's checkpoint, so that a later --incremental
+    load skips them."""
+
+    def write(dfs):
+        if fmt == "sql":
+            # The ledger and checkpoint are updated in the same transaction as
+            # the upload.
+            send_dataframes_to_sql(dfs, args.method, engine, entries, steps)
+            return
+        if fmt == "csv":
+            export_dataframes_to_csv(dfs, _get_output_dir(args, fmt))
+        elif fmt == "xlsx":
+            export_dataframes_to_xlsx(dfs, args.output_file)
+        elif fmt == "parquet":
+            export_dataframes_to_parquet(dfs, _get_output_dir(args, fmt))
+        _get_checkpoint(args, engine, fmt).record(steps)
+        ledger.record(entries)
+
+    return write
+
+
+def _get_file_steps(path, steps):
+    """Move the steps of a workflow result file that have no workflowId to a
+    namespace of the file, so that a checkpoint keeps them apart from the
+    steps of other files.
+
+    Args:
+        path (str): The path of the file.
+        steps (list): The steps of the file, see `get_step_entries`.
+
+    Returns:
+        list: The steps, with the workflowId of their checkpoint entries.
+    """
+
+    digest = hashlib.sha256(os.path.abspath(path).encode()).hexdigest()[:16]
+    namespace = f"file:{digest}"
+    return [
+        (workflow_id or namespace, step, step_id)
+        for workflow_id, step, step_id in steps
+    ]
+
+
+def _load_steps(path):
+    """Load a workflow result file and list its steps, see
+    `_get_file_steps`."""
+
+    with profile_stage("json_load", file=path):
+        workflowresult = load_workflowresult(path)
+    return workflowresult, _get_file_steps(path, get_step_entries(workflowresult))
+
+
+def _get_loaded_steps(args, checkpoint, steps):
+    """Get the keys of the steps of a workflow result already in the
+    checkpoint of a sink, or none when forcing a reload."""
+
+    if getattr(args, "force", False):
+        return set()
+    return checkpoint.get_steps({workflow_id for workflow_id, _, _ in steps})
+
+
+def _extract_new_steps(args, path, workflowresult, steps, loaded):
+    """Flatten the steps of a workflow result that are not in `loaded`.
+
+    Returns:
+        tuple: The dataframes of the new steps and their step entries.
+    """
+
+    new_steps = [entry for entry in steps if entry[1] not in loaded]
+    print(
+        f"Loading {len(new_steps)} new of {len(steps)} steps from {path}, "
+        f"skipping {len(steps) - len(new_steps)} already loaded"
+    )
+    dfs = extract_dataframes(
+        workflowresult,
+        optimize_dtypes=args.optimize_dtypes,
+        max_columns=args.max_columns,
+        skip_steps=loaded,
+    )
+    return dfs, new_steps
+
+
+def _skip_loaded(paths, ledger, force):
+    """Hash workflow result files and drop the ones already in the ledger, or
+    repeated within `paths`, before they are parsed.
+
+    Returns:
+        list: (hash, path) tuples of the files to load.
+    """
+
+    entries = []
+    seen = set()
+    for path in paths:
+        with profile_stage("hash_file", file=path):
+            digest = hash_file(path)
+        if digest in seen or (not force and digest in ledger):
+            print(f"Skipping {path}, its content has already been loaded.")
+            continue
+        seen.add(digest)
+        entries.append((digest, path))
+    return entries
 
 
 def set_configuration_command(args):
@@ -70,6 +617,10 @@ def set_configuration_command(args):
     set_configuration(configuration)
 
 
+def set_url_command(args):
+    set_configuration({"connection_string": args.connection_string})
+
+
 def show_configuration_command(args):
     config = get_configuration()
     if config:
@@ -78,22 +629,306 @@ def show_configuration_command(args):
         print("SQL connection not configured.")
 
 
+def clear_cache(args):
+    ExtractionCache().clear()
+    print(f"Cleared {CACHE_DIR}")
+
+
 def upload(args):
     config = get_configuration()
     if not config:
         print("SQL connection not configured. Run `convert-workflowresult set-config` to configure.")
-    with open(args.file) as f:
-        workflowresult = json.load(f)
-    send_workflowresult_to_sql(workflowresult)
+        sys.exit(1)
+    if args.incremental and (args.stream or args.pipeline):
+        print("--incremental cannot be combined with --stream or --pipeline")
+        sys.exit(1)
+    engine = get_engine()
+    ledger = SqlLedger(engine)
+    entries = _skip_loaded([args.file], ledger, args.force)
+    if not entries:
+        return
+    steps = []
+    if args.pipeline:
+        stats = PipelineStats()
+        chunks = pipelined(
+            _iter_chunks(args, steps, entries[0][0]), args.queue_size, stats
+        )
+        send_chunks_to_sql(chunks, args.method, engine, entries, steps)
+        stats.report()
+        return
+    if args.stream:
+        chunks = _iter_chunks(args, steps)
+        send_chunks_to_sql(chunks, args.method, engine, entries, steps)
+        return
+    _write_file(args, args.file, "sql", ledger, entries, engine)
 
 def export(args):
-    with open(args.file) as f:
-        workflowresult = json.load(f)
-    
-    if args.format == 'csv':
-        export_to_csv(workflowresult)
-    elif args.format == 'xlsx':
-        export_to_xlsx(workflowresult)
+    formats = args.formats
+    if args.stream and formats != ["csv"]:
+        print(f"Streaming is not supported for output format {','.join(formats)}")
+        sys.exit(1)
+    if args.pipeline and formats != ["csv"]:
+        print(f"Pipelining is not supported for output format {','.join(formats)}")
+        sys.exit(1)
+    if args.incremental and (args.stream or args.pipeline):
+        print("--incremental cannot be combined with --stream or --pipeline")
+        sys.exit(1)
+    if "csv" in formats and "parquet" in formats and args.output_dir is not None:
+        print("csv and parquet cannot share an --output-dir, export them separately")
+        sys.exit(1)
+    engine = None
+    if "sql" in formats:
+        if not get_configuration():
+            print("SQL connection not configured. Run `convert-workflowresult set-config` to configure.")
+            sys.exit(1)
+        engine = get_engine()
+    if len(formats) > 1:
+        _export_formats(args, formats, engine)
+        return
+
+    fmt = formats[0]
+    ledger = _get_ledger(args, engine, fmt)
+    entries = _skip_loaded([args.file], ledger, args.force)
+    if not entries:
+        return
+
+    steps = []
+    if args.pipeline:
+        stats = PipelineStats()
+        chunks = pipelined(
+            _iter_chunks(args, steps, entries[0][0]), args.queue_size, stats
+        )
+        export_chunks_to_csv(chunks, _get_output_dir(args, fmt))
+        _get_checkpoint(args, engine, fmt).record(steps)
+        ledger.record(entries)
+        stats.report()
+        return
+
+    if args.stream:
+        export_chunks_to_csv(_iter_chunks(args, steps), _get_output_dir(args, fmt))
+        _get_checkpoint(args, engine, fmt).record(steps)
+        ledger.record(entries)
+        return
+
+    _write_file(args, args.file, fmt, ledger, entries, engine)
+
+
+def _export_formats(args, formats, engine):
+    """Extract a workflow result file once and write it to the sinks of
+    several formats concurrently, skipping the sinks it is already loaded
+    into. A sink that fails does not stop the others."""
+
+    ledgers = {fmt: _get_ledger(args, engine, fmt) for fmt in formats}
+    with profile_stage("hash_file", file=args.file):
+        digest = hash_file(args.file)
+    pending = []
+    for fmt in formats:
+        if not args.force and _is_loaded(ledgers[fmt], digest):
+            print(f"Skipping {fmt} for {args.file}, its content has already been loaded.")
+        else:
+            pending.append(fmt)
+    if not pending:
+        return
+
+    entries = [(digest, args.file)]
+    if not args.incremental:
+        steps = []
+        dfs = extract_dataframes_from_file(
+            args.file,
+            args.optimize_dtypes,
+            _get_cache(args),
+            digest,
+            args.max_columns,
+            steps=steps,
+        )
+        groups = [(dfs, _get_file_steps(args.file, steps), pending)]
+    else:
+        # Sinks whose checkpoints hold the same steps share an extraction.
+        workflowresult, steps = _load_steps(args.file)
+        by_loaded = {}
+        for fmt in pending:
+            try:
+                checkpoint = _get_checkpoint(args, engine, fmt)
+                loaded = _get_loaded_steps(args, checkpoint, steps)
+            except Exception:
+                # As with the ledger, writing to a sink that cannot be reached
+                # fails in turn.
+                loaded = set()
+            by_loaded.setdefault(frozenset(loaded), []).append(fmt)
+        groups = [
+            _extract_new_steps(args, args.file, workflowresult, steps, loaded)
+            + (group,)
+            for loaded, group in by_loaded.items()
+        ]
+
+    failed = False
+    for dfs, new_steps, group in groups:
+        summary = write_to_sinks(
+            dfs,
+            {
+                fmt: _get_sink(args, fmt, ledgers[fmt], entries, engine, new_steps)
+                for fmt in group
+            },
+        )
+        summary.report()
+        failed = failed or bool(summary.failed)
+    if failed:
+        sys.exit(1)
+
+
+def _is_loaded(ledger, digest):
+    try:
+        return digest in ledger
+    except Exception:
+        # The sink cannot be reached: writing to it fails in turn, and is
+        # reported along with the other sinks.
+        return False
+
+
+def _write_file(args, path, fmt, ledger, entries, engine=None):
+    """Write a workflowresult file to the sink of a format and record it in
+    the sink's ledger, and its steps in the sink's checkpoint. With
+    --incremental, only its steps that are not in the checkpoint yet are
+    written."""
+
+    if args.incremental:
+        workflowresult, steps = _load_steps(path)
+        loaded = _get_loaded_steps(args, _get_checkpoint(args, engine, fmt), steps)
+        dfs, new_steps = _extract_new_steps(args, path, workflowresult, steps, loaded)
+        _get_sink(args, fmt, ledger, entries, engine, new_steps)(dfs)
+        return
+
+    steps = []
+    dfs = extract_dataframes_from_file(
+        path,
+        args.optimize_dtypes,
+        _get_cache(args),
+        entries[0][0],
+        args.max_columns,
+        steps=steps,
+    )
+    _get_sink(args, fmt, ledger, entries, engine, _get_file_steps(path, steps))(dfs)
+
+
+def batch(args):
+    if os.path.isdir(args.path):
+        paths = sorted(
+            path
+            for pattern in WORKFLOWRESULT_PATTERNS
+            for path in glob.glob(os.path.join(args.path, pattern))
+        )
     else:
-        print(f"Unsupported output format {args.format}")
+        paths = sorted(glob.glob(args.path))
+    if not paths:
+        print(f"No workflow result files found for {args.path}")
+        sys.exit(1)
+
+    if args.pipeline and args.format == "xlsx":
+        print(f"Pipelining is not supported for output format {args.format}")
+        sys.exit(1)
+    engine = None
+    if args.format == "sql":
+        if not get_configuration():
+            print("SQL connection not configured. Run `convert-workflowresult set-config` to configure.")
+            sys.exit(1)
+        engine = get_engine()
+    ledger = _get_ledger(args, engine)
+    entries = _skip_loaded(paths, ledger, args.force)
+    if not entries:
+        print("All workflow result files have already been loaded.")
+        return
+    if args.pipeline:
+        _batch_pipelined(args, entries, ledger, engine)
+        return
+
+    steps = {}
+    dfs, failed = extract_dataframes_from_files(
+        [path for _, path in entries],
+        args.workers,
+        args.optimize_dtypes,
+        _get_cache(args),
+        args.max_columns,
+        steps=steps,
+    )
+    failed_paths = set(failed)
+    entries = [entry for entry in entries if entry[1] not in failed_paths]
+    steps = [
+        entry
+        for _, path in entries
+        for entry in _get_file_steps(path, steps.get(path, ()))
+    ]
+    _get_sink(args, args.format, ledger, entries, engine, steps)(dfs)
+    _exit_on_failures(failed)
+
+
+def _exit_on_failures(failed):
+    if failed:
+        print(f"Failed to process {len(failed)} files:")
+        for path in failed:
+            print(f"  {path}")
+        sys.exit(1)
+
+
+def _batch_pipelined(args, entries, ledger, engine):
+    """Write the tables of each file as soon as it is flattened, while worker
+    processes flatten the next files."""
+
+    digests = {path: digest for digest, path in entries}
+    stats = PipelineStats()
+    workers = args.workers or os.cpu_count() or 1
+    steps = {}
+    files = iter_dataframes_from_files(
+        list(digests),
+        workers,
+        args.queue_size + workers,
+        args.optimize_dtypes,
+        _get_cache(args),
+        args.max_columns,
+        steps=steps,
+    )
+    failed = []
+    for path, dfs in pipelined(files, args.queue_size, stats):
+        if dfs is None:
+            failed.append(path)
+            continue
+        # With SQL, each file is uploaded in its own transaction.
+        file_entries = [(digests[path], path)]
+        file_steps = _get_file_steps(path, steps.pop(path, ()))
+        _get_sink(args, args.format, ledger, file_entries, engine, file_steps)(dfs)
+    stats.report()
+    _exit_on_failures(failed)
+
+
+def watch(args):
+    if not os.path.isdir(args.directory):
+        print(f"{args.directory} is not a directory")
         sys.exit(1)
+    engine = None
+    if args.format == "sql":
+        if not get_configuration():
+            print("SQL connection not configured. Run `convert-workflowresult set-config` to configure.")
+            sys.exit(1)
+        # A single pooled engine is kept for the lifetime of the process.
+        engine = get_engine(args.pool_size)
+    ledger = _get_ledger(args, engine)
+
+    def ingest(path):
+        entries = _skip_loaded([path], ledger, False)
+        if entries:
+            _write_file(args, path, args.format, ledger, entries, engine)
+            print(f"Converted {path}")
+
+    print(f"Watching {os.path.join(args.directory, args.pattern)} (press Ctrl+C to stop)")
+    try:
+        watch_directory(
+            args.directory,
+            ingest,
+            pattern=args.pattern,
+            poll_interval=args.poll_interval,
+            settle_time=args.settle_time,
+            backoff=args.backoff,
+            max_backoff=args.max_backoff,
+            max_attempts=args.max_attempts,
+        )
+    except KeyboardInterrupt:
+        print("Stopped watching.")